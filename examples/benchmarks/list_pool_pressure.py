@@ -0,0 +1,167 @@
+# Compares the connection pool pressure of AbstractRepository.get_all in "parallel"
+# list execution (the count and the page run concurrently on two pooled connections)
+# against "single" list execution (one connection, window function count).
+#
+# The engine uses a QueuePool shaped like the MysqlAdapter default (pool_size=4),
+# without overflow, so pool starvation shows up as queueing latency. In parallel
+# mode every request holds one connection while it waits for a second one, so enough
+# concurrent requests can deadlock the pool until pool_timeout expires.
+#
+# Usage:
+# poetry run python -m examples.benchmarks.list_pool_pressure --rows 20000 --requests 400
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Optional
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from fastapi_cruddy_framework import (
+    AbstractRepository,
+    BaseAdapter,
+    CruddyIntIDModel,
+    CruddyModel,
+)
+
+
+class BenchRecordCreate(CruddyModel):
+    name: str
+    score: int
+
+
+class BenchRecord(CruddyIntIDModel, BenchRecordCreate, table=True):
+    note: Optional[str] = None
+
+
+class PooledSqliteAdapter(BaseAdapter):
+    def __init__(self, db_path: str, pool_size: int, max_overflow: int, timeout: float):
+        self.engine = create_async_engine(
+            f"sqlite+aiosqlite:///{db_path}",
+            future=True,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=timeout,
+        )
+
+
+class PoolMonitor:
+    def __init__(self, adapter: BaseAdapter):
+        self.checkouts = 0
+        self.checked_out = 0
+        self.peak = 0
+        pool = adapter.engine.sync_engine.pool
+        event.listen(pool, "checkout", self.on_checkout)
+        event.listen(pool, "checkin", self.on_checkin)
+
+    def on_checkout(self, *args):
+        self.checkouts += 1
+        self.checked_out += 1
+        self.peak = max(self.peak, self.checked_out)
+
+    def on_checkin(self, *args):
+        self.checked_out -= 1
+
+    def reset(self):
+        self.checkouts = 0
+        self.peak = self.checked_out
+
+
+async def seed(adapter: BaseAdapter, rows: int):
+    async with adapter.engine.begin() as conn:
+        await conn.run_sync(CruddyModel.metadata.create_all)
+        await conn.execute(
+            BenchRecord.__table__.insert(),
+            [
+                {"name": f"record {i}", "score": i % 100, "note": "x" * 64}
+                for i in range(rows)
+            ],
+        )
+
+
+async def run(
+    repository: AbstractRepository,
+    monitor: PoolMonitor,
+    requests: int,
+    concurrency: int,
+):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    timeouts = 0
+
+    async def one(i: int):
+        nonlocal timeouts
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await repository.get_all(
+                    page=1 + i % 50, limit=25, where={"score": {"*gte": i % 90}}
+                )
+            except PoolTimeoutError:
+                timeouts += 1
+            latencies.append(time.perf_counter() - start)
+
+    monitor.reset()
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests/s": requests / elapsed,
+        "mean ms": statistics.mean(latencies) * 1000,
+        "p95 ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "checkouts/request": monitor.checkouts / requests,
+        "peak checked out": monitor.peak,
+        "pool timeouts": timeouts,
+    }
+
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        adapter = PooledSqliteAdapter(
+            db_path=os.path.join(tmp, "bench.db"),
+            pool_size=args.pool_size,
+            max_overflow=args.max_overflow,
+            timeout=args.pool_timeout,
+        )
+        monitor = PoolMonitor(adapter)
+        await seed(adapter, args.rows)
+        print(
+            f"{args.requests} list requests, concurrency {args.concurrency}, "
+            f"pool_size {args.pool_size}, max_overflow {args.max_overflow}, "
+            f"{args.rows} rows"
+        )
+        for mode in ("parallel", "single"):
+            repository = AbstractRepository(
+                adapter=adapter,
+                update_model=BenchRecordCreate,
+                create_model=BenchRecordCreate,
+                model=BenchRecord,
+                list_execution=mode,
+            )
+            repository.resolve()
+            await run(repository, monitor, min(args.requests, 20), args.concurrency)
+            stats = await run(repository, monitor, args.requests, args.concurrency)
+            print(
+                f"{mode:>8}: "
+                + ", ".join(
+                    f"{k} {v:.2f}" if isinstance(v, float) else f"{k} {v}"
+                    for k, v in stats.items()
+                )
+            )
+        await adapter.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--max-overflow", type=int, default=0)
+    parser.add_argument("--pool-timeout", type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,130 @@
+# Compares write and read throughput of a file mode SqliteAdapter without a profile
+# (rollback journal, default pragmas, a new connection per session) against each of the
+# SQLite performance profiles, and against "reader_writer" mode (read-only reader pool,
+# one writer connection fed by a group committing write queue).
+#
+# Each profile gets a fresh database. Concurrent AbstractRepository.create calls are
+# measured first, then a concurrent mix of get_by_id and get_all calls. "errors" counts
+# requests that failed, usually with "database is locked".
+#
+# Usage:
+# poetry run python -m examples.benchmarks.sqlite_profiles --writes 2000 --reads 4000
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Optional
+from sqlalchemy.exc import OperationalError
+from fastapi_cruddy_framework import (
+    AbstractRepository,
+    CruddyIntIDModel,
+    CruddyModel,
+    SqliteAdapter,
+)
+
+
+class ProfileRecordCreate(CruddyModel):
+    name: str
+    score: int
+
+
+class ProfileRecord(CruddyIntIDModel, ProfileRecordCreate, table=True):
+    note: Optional[str] = None
+
+
+async def run(requests: int, concurrency: int, request):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await request(i)
+            except OperationalError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests/s": requests / elapsed,
+        "mean ms": statistics.mean(latencies) * 1000,
+        "p95 ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+def report(label: str, stats: dict):
+    print(
+        f"{label:>20}: "
+        + ", ".join(
+            f"{k} {v:.2f}" if isinstance(v, float) else f"{k} {v}"
+            for k, v in stats.items()
+        )
+    )
+
+
+async def main(args):
+    print(
+        f"{args.writes} creates, then {args.reads} reads, "
+        f"concurrency {args.concurrency}"
+    )
+    for profile, mode in (
+        (None, "file"),
+        ("balanced", "file"),
+        ("durable", "file"),
+        ("fast", "file"),
+        ("balanced", "reader_writer"),
+        ("durable", "reader_writer"),
+    ):
+        with tempfile.TemporaryDirectory() as tmp:
+            adapter = SqliteAdapter(
+                db_path=os.path.join(tmp, "bench.db"),
+                mode=mode,
+                profile=profile,
+                instrument=False,
+            )
+            await adapter.destroy_then_create_all_tables_unsafe()
+            repository = AbstractRepository(
+                adapter=adapter,
+                update_model=ProfileRecordCreate,
+                create_model=ProfileRecordCreate,
+                model=ProfileRecord,
+                list_execution="single",
+            )
+            repository.resolve()
+
+            async def write(i: int):
+                await repository.create(
+                    data=ProfileRecordCreate(name=f"record {i}", score=i % 100)
+                )
+
+            async def read(i: int):
+                if i % 2 == 0:
+                    await repository.get_by_id(id=1 + i % args.writes)
+                else:
+                    await repository.get_all(
+                        page=1 + i % 20, limit=25, where={"score": {"*gte": i % 90}}
+                    )
+
+            label = profile or "no profile"
+            if mode == "reader_writer":
+                label = f"{label} r/w"
+            report(f"{label} writes", await run(args.writes, args.concurrency, write))
+            report(f"{label} reads", await run(args.reads, args.concurrency, read))
+            await adapter.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=2000)
+    parser.add_argument("--reads", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    asyncio.run(main(parser.parse_args()))
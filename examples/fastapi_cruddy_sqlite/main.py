@@ -50,6 +50,12 @@ async def bootstrap():
     # You can do any init hooks below
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    # Closes the adapter's pooled connections (and optimizes profiled SQLite databases)
+    await sqlite.shutdown()
+
+
 def local_start():
     uvicorn.run(
         "examples.fastapi_cruddy_sqlite.main:app",
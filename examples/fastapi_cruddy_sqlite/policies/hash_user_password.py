@@ -10,6 +10,16 @@ async def hash_user_password(request: Request):
     # isloate the request body for modification
     request_body: dict = request._json
 
+    # POST /users/bulk sends a list of envelopes, hash each of them
+    if type(request_body) == list:
+        for envelope in request_body:
+            hash_envelope_password(envelope)
+        return
+
+    hash_envelope_password(request_body)
+
+
+def hash_envelope_password(request_body: dict):
     # make sure the request body has the proper keys for the password...
     if request_body == None or type(request_body) != dict:
         raise HTTPException(
@@ -1,3 +1,4 @@
+from typing import Optional
 from fastapi_cruddy_framework import CruddyGenericModel
 
 
@@ -11,6 +12,9 @@ class MetaObject(CruddyGenericModel):
     limit: int
     pages: int
     records: int
+    next: Optional[str] = None
+    has_more: Optional[bool] = None
+    count_strategy: Optional[str] = None
 
     def __init__(
         self,
@@ -18,5 +22,16 @@ class MetaObject(CruddyGenericModel):
         limit: int = 0,
         pages: int = 0,
         records: int = 0,
+        next: Optional[str] = None,
+        has_more: Optional[bool] = None,
+        count_strategy: Optional[str] = None,
     ):
-        super().__init__(page=page, limit=limit, pages=pages, records=records)
+        super().__init__(
+            page=page,
+            limit=limit,
+            pages=pages,
+            records=records,
+            next=next,
+            has_more=has_more,
+            count_strategy=count_strategy,
+        )
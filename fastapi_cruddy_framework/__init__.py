@@ -10,6 +10,11 @@ from .schemas import (
     CruddyGenericModel,
     BulkDTO,
     MetaObject,
+    BulkWriteResponse,
+    BatchOperation,
+    BatchRequest,
+    BatchResult,
+    BatchResponse,
     PageResponse,
     ResponseSchema,
     CruddyModel,
@@ -22,9 +27,36 @@ from .schemas import (
 )
 from .controller import CruddyController, ControllerCongifurator
 from .repository import AbstractRepository
-from .adapters import BaseAdapter, SqliteAdapter, MysqlAdapter, PostgresqlAdapter
+from .plans import QueryPlanCache
+from .instrumentation import SqlInstrumentation, QueryStats
+from .cache import CacheBackend, LRUCache
+from .serialization import RowEncoder, dump_json
+from .adapters import (
+    BaseAdapter,
+    SqliteAdapter,
+    MysqlAdapter,
+    PostgresqlAdapter,
+    RequestSessionRoute,
+)
 from .resource import Resource, ResourceRegistry, CruddyResourceRegistry
 from .router import getModuleDir, getDirectoryModules, CreateRouterFromResources
-from .util import get_pk, possible_id_types, lifecycle_types
+from .batch import CreateBatchRouter
+from .util import (
+    get_pk,
+    possible_id_types,
+    lifecycle_types,
+    count_strategy_types,
+    list_execution_types,
+    relation_sync_types,
+    replica_strategy_types,
+    sqlite_profile_types,
+    export_format_types,
+    InvalidCursor,
+    UnsafeBulkWrite,
+    RelationshipWriteError,
+    NotModified,
+    encode_cursor,
+    decode_cursor,
+)
 
 # -----------------------------------------------------------------
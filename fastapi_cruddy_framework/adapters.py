@@ -1,10 +1,96 @@
+import asyncio
+import sqlite3
+import time
+from contextvars import ContextVar
+from logging import getLogger
+from sqlalchemy import event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.exc import OperationalError, SQLAlchemyError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 from contextlib import asynccontextmanager
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
 from sqlmodel import text
 from sqlmodel.ext.asyncio.session import AsyncSession
-from typing import Union, AsyncIterator, Literal
+from typing import Union, AsyncIterator, Literal, List, Dict, Hashable, Any, Callable
 from .schemas import CruddyModel
+from .instrumentation import SqlInstrumentation
+from .util import replica_strategy_types, sqlite_profile_types
+
+LOGGER = getLogger(__name__)
+
+# Bounds the read-your-writes bookkeeping, expired scopes are pruned past this size
+WRITE_SCOPE_MAX_ENTRIES = 10000
+
+# The read-your-writes scope of the current request. None is a single shared scope.
+_write_scope: ContextVar[Hashable] = ContextVar("cruddy_write_scope", default=None)
+
+# The request scoped sessions opened during a request, kept in its ASGI scope
+REQUEST_SESSIONS_SCOPE_KEY = "cruddy_request_sessions"
+
+# Set in a shared session's info once a write ran in it, until it commits
+SESSION_WROTE_KEY = "cruddy_wrote"
+
+# The callbacks a shared session runs once it has committed, see BaseAdapter.after_commit
+SESSION_AFTER_COMMIT_KEY = "cruddy_after_commit"
+
+# Set in the info of the session opened by a request scoped session dependency
+SESSION_REQUEST_KEY = "cruddy_request"
+
+# Set in a request scoped session's info when its route answered with an error response
+SESSION_ROLLBACK_KEY = "cruddy_rollback"
+
+
+# Commits a session, which holds no uncommitted writes afterwards, then runs its after
+# commit callbacks. The writes are committed by then, so callbacks only log failures.
+async def commit_session(session: AsyncSession):
+    await session.commit()
+    session.info.pop(SESSION_WROTE_KEY, None)
+    for callback in session.info.pop(SESSION_AFTER_COMMIT_KEY, []):
+        try:
+            await callback()
+        except Exception as e:
+            LOGGER.warning(f"After commit callback {callback!r} failed: {e!r}")
+
+
+# Rolls a session back, dropping the after commit callbacks of its discarded writes
+async def rollback_session(session: AsyncSession):
+    session.info.pop(SESSION_WROTE_KEY, None)
+    session.info.pop(SESSION_AFTER_COMMIT_KEY, None)
+    try:
+        await session.rollback()
+    except:
+        pass
+
+
+# Routes of this class commit the request scoped sessions opened by their dependencies
+# once the response is built, and before it is sent, so a client never receives a
+# success for a write that fails to commit afterwards. A commit failure becomes an
+# error response, and the adapter's dependency rolls the session back. So does an
+# error response (status 400 and up) built by the route instead of raised. Streaming
+# responses still read from their session while they are sent, so their sessions are
+# committed by the dependency once the body is done.
+#
+# Resources use this class for their routers when their adapter has
+# request_scoped_sessions. Use it for your own routers with APIRouter(route_class=...).
+class RequestSessionRoute(APIRoute):
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def request_session_handler(request: Request) -> Response:
+            sessions = request.scope.setdefault(REQUEST_SESSIONS_SCOPE_KEY, [])
+            response = await handler(request)
+            if response.status_code >= 400:
+                for session in sessions:
+                    session.info[SESSION_ROLLBACK_KEY] = True
+            elif not isinstance(response, StreamingResponse):
+                for session in sessions:
+                    await commit_session(session)
+            return response
+
+        return request_session_handler
 
 
 # -------------------------------------------------------------------------------------------
@@ -12,29 +98,225 @@ from .schemas import CruddyModel
 # -------------------------------------------------------------------------------------------
 class BaseAdapter:
     engine: None
+    replica_engines: List[AsyncEngine] = []
+    replica_strategy: replica_strategy_types = "round_robin"
+    read_your_writes_window: float = 0
+    request_scoped_sessions: bool = False
+    instrumentation: Union[SqlInstrumentation, None] = None
+    _request_session: Union[ContextVar, None] = None
+    _session_factories: Union[Dict[AsyncEngine, sessionmaker], None] = None
 
-    def __init__(self):
+    def __init__(
+        self,
+        request_scoped_sessions: bool = False,
+        echo: bool = False,
+        instrument: bool = True,
+        slow_query_ms: float = 500,
+    ):
         self.engine = create_async_engine(
             "sqlite+aiosqlite:///file:temp.db?mode=memory&cache=shared&uri=true",
-            echo=True,
+            echo=echo,
             future=True,
         )
+        self.setup_replicas()
+        self.setup_sessions(request_scoped_sessions=request_scoped_sessions)
+        self.setup_instrumentation(instrument=instrument, slow_query_ms=slow_query_ms)
 
-    async def __call__(self) -> AsyncIterator[AsyncSession]:
-        # Used by FastAPI Depends
+    # Statement timing for the primary and replica engines, read with
+    # adapter.instrumentation.stats() and adapter.instrumentation.slow_queries().
+    # SQLAlchemy's echo logging is off unless echo=True is passed to the adapter.
+    def setup_instrumentation(
+        self, instrument: bool = True, slow_query_ms: float = 500
+    ):
+        if not instrument:
+            self.instrumentation = None
+            return
+        self.instrumentation = SqlInstrumentation(slow_query_ms=slow_query_ms)
+        self.instrumentation.attach(engine=self.engine, role="primary")
+        for i, replica_engine in enumerate(self.replica_engines):
+            self.instrumentation.attach(engine=replica_engine, role=f"replica{i}")
+
+    # With request_scoped_sessions, the FastAPI dependency below (Depends(adapter))
+    # shares one primary session with the getSession calls made during the request, so
+    # its writes use one connection and commit once. Reads only join it once the request
+    # has written; until then they open sessions of their own, which replicas can serve.
+    # Routes of the RequestSessionRoute class commit before the response is sent; the
+    # dependency rolls back on errors, closes the session, and commits whatever is left
+    # (like writes made by background tasks, or by routes of other classes) once the
+    # request is done.
+    # Resources add the dependency to their own routers when this is enabled.
+    def setup_sessions(self, request_scoped_sessions: bool = False):
+        self.request_scoped_sessions = request_scoped_sessions
+        self._request_session = ContextVar(
+            f"cruddy_request_session_{id(self)}", default=None
+        )
+        self._session_factories = {}
+
+    # The session shared by the current request (or transaction block), if any
+    def request_session(self) -> Union[AsyncSession, None]:
+        if self._request_session is None:
+            return None
+        return self._request_session.get()
+
+    # Shares one session, and so one transaction, with every getSession call made inside
+    # the block. It is committed when the block exits, and rolled back if it raises.
+    # Inside a shared session already, that session is used as is.
+    #
+    # async with adapter.transaction():
+    #     await users.repository.create(...)
+    #     await posts.repository.create(...)
+    @asynccontextmanager
+    async def transaction(self):
+        shared = self.shared_session()
+        if shared != None:
+            yield shared
+            return
         async with self.getSession() as session:
-            yield session
+            token = self._request_session.set(session)
+            try:
+                yield session
+            finally:
+                self._request_session.reset(token)
 
-    def asyncSessionGenerator(self):
-        return sessionmaker(
-            autocommit=False,
-            autoflush=False,
-            future=True,
-            bind=self.engine,
-            class_=AsyncSession,
-            expire_on_commit=False,
+    # The session every getSession call of the current context will share, if any
+    def shared_session(self) -> Union[AsyncSession, None]:
+        return self.request_session()
+
+    # Queues an async callback to run once the shared session of the current context
+    # commits, and returns whether there was one. Repositories invalidate their caches
+    # right after each write, but a shared session commits later: until it does, other
+    # sessions still read (and may cache) what it replaced, so invalidations run again
+    # after the commit. Callbacks are dropped when the session rolls back.
+    def after_commit(self, callback: Callable[[], Any] = ...) -> bool:
+        session = self.shared_session()
+        if session is None:
+            return False
+        callbacks = session.info.setdefault(SESSION_AFTER_COMMIT_KEY, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+        return True
+
+    # Whether the shared session of the current context holds uncommitted writes, which
+    # caches must neither serve around nor be filled with
+    def shared_session_wrote(self) -> bool:
+        session = self.shared_session()
+        if session is None:
+            return False
+        return (
+            session.info.get(SESSION_WROTE_KEY, False)
+            or len(session.new) > 0
+            or len(session.dirty) > 0
+            or len(session.deleted) > 0
+        )
+
+    # Read replicas take the sessions opened with getSession(read_only=True), which the
+    # repository uses for get_by_id and list queries. Everything else, including all
+    # writes and relationship updates, runs on the primary engine.
+    # "round_robin" rotates through the replicas, "least_connections" picks the replica
+    # with the fewest sessions currently checked out by this adapter.
+    # With a read_your_writes_window (in seconds), reads in the same scope as a recent
+    # write go to the primary until the window passes, so replica lag can't hide that
+    # write. The scope is shared by all requests unless set_write_scope is called.
+    def setup_replicas(
+        self,
+        replica_engines: List[AsyncEngine] = [],
+        replica_strategy: replica_strategy_types = "round_robin",
+        read_your_writes_window: float = 0,
+    ):
+        self.replica_engines = list(replica_engines)
+        self.replica_strategy = replica_strategy
+        self.read_your_writes_window = read_your_writes_window
+        self._replica_cursor = 0
+        self._replica_checkouts = [0] * len(self.replica_engines)
+        self._recent_writes: Dict[Hashable, float] = {}
+
+    # Narrows the read-your-writes scope of the current request, e.g. to a user or
+    # client id. Call it from an async policy so the route shares its context.
+    def set_write_scope(self, scope: Hashable):
+        _write_scope.set(scope)
+
+    def wrote_recently(self) -> bool:
+        if self.read_your_writes_window <= 0:
+            return False
+        written = self._recent_writes.get(_write_scope.get(), None)
+        return (
+            written != None
+            and time.monotonic() - written < self.read_your_writes_window
         )
 
+    def record_write(self):
+        if self.read_your_writes_window <= 0 or len(self.replica_engines) == 0:
+            return
+        now = time.monotonic()
+        if len(self._recent_writes) >= WRITE_SCOPE_MAX_ENTRIES:
+            expired = now - self.read_your_writes_window
+            for k in [k for k, v in self._recent_writes.items() if v <= expired]:
+                del self._recent_writes[k]
+        self._recent_writes[_write_scope.get()] = now
+
+    # Returns the index of the replica a session should use, or None for the primary
+    def select_replica(self, read_only: bool = False) -> Union[int, None]:
+        if not read_only or len(self.replica_engines) == 0 or self.wrote_recently():
+            return None
+        if self.replica_strategy == "least_connections":
+            return min(
+                range(len(self.replica_engines)),
+                key=lambda i: self._replica_checkouts[i],
+            )
+        index = self._replica_cursor % len(self.replica_engines)
+        self._replica_cursor = index + 1
+        return index
+
+    async def __call__(self, request: Request) -> AsyncIterator[AsyncSession]:
+        # Used by FastAPI Depends
+        if not self.request_scoped_sessions:
+            async with self.getSession() as session:
+                yield session
+            return
+        shared = self.request_session()
+        if shared != None:
+            yield shared
+            return
+        # no connection is checked out until the session runs its first statement
+        async with self.asyncSessionGenerator()() as session:
+            session.info[SESSION_REQUEST_KEY] = True
+            token = self._request_session.set(session)
+            request.scope.setdefault(REQUEST_SESSIONS_SCOPE_KEY, []).append(session)
+            try:
+                yield session
+                if session.info.pop(SESSION_ROLLBACK_KEY, False):
+                    await rollback_session(session)
+                else:
+                    await commit_session(session)
+            except:
+                await rollback_session(session)
+                raise
+            finally:
+                try:
+                    self._request_session.reset(token)
+                except ValueError:
+                    # opened in another context, like a concurrent batch operation,
+                    # which took its copy of the variable with it
+                    pass
+
+    # Session factories are built once per engine and reused by every getSession call
+    def asyncSessionGenerator(self, engine: Union[AsyncEngine, None] = None):
+        engine = engine if engine != None else self.engine
+        if self._session_factories is None:
+            self._session_factories = {}
+        factory = self._session_factories.get(engine, None)
+        if factory is None:
+            factory = sessionmaker(
+                autocommit=False,
+                autoflush=False,
+                future=True,
+                bind=engine,
+                class_=AsyncSession,
+                expire_on_commit=False,
+            )
+            self._session_factories[engine] = factory
+        return factory
+
     # Since this returns an async generator, to use it elsewhere, it
     # should be invoked using the following syntax.
     #
@@ -47,22 +329,118 @@ class BaseAdapter:
     # transactions, or rolling them back. It will happen here after
     # the yielded context cedes control of the event loop back to
     # the adapter. If the database explodes, the rollback happens.
+    # Sessions opened with read_only=True may be served by a read replica.
+    # Inside a shared session, that session is yielded instead. It is committed
+    # or rolled back by the request's dependency, not here, but writes are flushed so
+    # the statements that follow in the shared session can see them. Read sessions
+    # opened with shared=False get a session of their own anyway, for reads that need
+    # no uncommitted writes and should not wait on the shared one. So do all reads of
+    # a request scoped session that has not written yet.
     @asynccontextmanager
-    async def getSession(self):
-        asyncSession = self.asyncSessionGenerator()
-        async with asyncSession() as session:
-            try:
-                yield session
-                await session.commit()
-            except:
+    async def getSession(self, read_only: bool = False, shared: bool = True):
+        request_session = self.request_session()
+        if (
+            request_session != None
+            and read_only
+            and (
+                not shared
+                or (
+                    request_session.info.get(SESSION_REQUEST_KEY, False)
+                    and not self.shared_session_wrote()
+                )
+            )
+        ):
+            request_session = None
+        if request_session != None:
+            if not read_only:
+                request_session.info[SESSION_WROTE_KEY] = True
+            yield request_session
+            if not read_only:
+                await request_session.flush()
+                self.record_write()
+            return
+        replica = self.select_replica(read_only=read_only)
+        if replica is None:
+            asyncSession = self.asyncSessionGenerator()
+        else:
+            asyncSession = self.asyncSessionGenerator(self.replica_engines[replica])
+            self._replica_checkouts[replica] += 1
+        try:
+            async with asyncSession() as session:
                 try:
-                    await session.rollback()
+                    yield session
+                    await commit_session(session)
                 except:
-                    pass
-                await session.close()
-                raise
-            else:
-                await session.close()
+                    await rollback_session(session)
+                    await session.close()
+                    raise
+                else:
+                    await session.close()
+            if not read_only:
+                self.record_write()
+        finally:
+            if replica != None:
+                self._replica_checkouts[replica] -= 1
+
+    # Whether the connected database can evaluate COUNT(*) OVER() window functions.
+    # MySQL and MariaDB only report their version after the first connection is made,
+    # so until then the answer is a conservative False.
+    def supports_window_functions(self) -> bool:
+        dialect = self.engine.dialect
+        if dialect.name == "sqlite":
+            return sqlite3.sqlite_version_info >= (3, 25, 0)
+        if dialect.name == "postgresql":
+            return True
+        if dialect.name == "mysql" and dialect.server_version_info != None:
+            if getattr(dialect, "is_mariadb", False):
+                return dialect.server_version_info >= (10, 2)
+            return dialect.server_version_info >= (8, 0)
+        return False
+
+    # Whether NULL sorts below every other value, so it comes first in ascending order.
+    # SQLite and MySQL sort it that way, PostgreSQL sorts it above every value.
+    def nulls_sort_first(self) -> bool:
+        return self.engine.dialect.name != "postgresql"
+
+    # Whether UPDATE ... RETURNING and DELETE ... RETURNING can run on the connected
+    # database, letting single record writes finish in one statement. PostgreSQL always
+    # can. SQLite 3.35+ and MariaDB 10.5+ can too, but only once the installed SQLAlchemy
+    # dialect is able to compile RETURNING for them (its update/delete_returning flags).
+    def supports_returning(self) -> bool:
+        dialect = self.engine.dialect
+        if getattr(dialect, "full_returning", False):
+            return True
+        dialect_returning = getattr(dialect, "update_returning", False) and getattr(
+            dialect, "delete_returning", False
+        )
+        if not dialect_returning:
+            return False
+        if dialect.name == "sqlite":
+            return sqlite3.sqlite_version_info >= (3, 35, 0)
+        if dialect.name == "mysql" and dialect.server_version_info != None:
+            return getattr(dialect, "is_mariadb", False) and (
+                dialect.server_version_info >= (10, 5)
+            )
+        return dialect.name == "postgresql"
+
+    # Returns the number of rows the database statistics report for a table, or None
+    # if no statistics exist. SQLite only gathers statistics when ANALYZE is run.
+    async def estimate_row_count(
+        self, session: AsyncSession, table_name: str
+    ) -> Union[int, None]:
+        query = text("SELECT stat FROM sqlite_stat1 WHERE tbl = :table_name")
+        try:
+            rows = (await session.execute(query, {"table_name": table_name})).all()
+        except OperationalError:
+            # sqlite_stat1 does not exist until the first ANALYZE
+            return None
+        counts = [int(row[0].split(" ")[0]) for row in rows if row[0]]
+        return max(counts) if len(counts) > 0 else None
+
+    # Closes every pooled connection. Call it from the app "shutdown" hook.
+    async def shutdown(self):
+        for engine in [self.engine, *self.replica_engines]:
+            await engine.dispose()
 
     # Don't call this until the app "startup" hook is invoked. Or ever.
     async def destroy_then_create_all_tables_unsafe(self):
@@ -80,15 +458,58 @@ class MysqlAdapter(BaseAdapter):
     connection_uri: str = None
     engine: Union[AsyncEngine, None] = None
 
-    def __init__(self, connection_uri="", pool_size=4, max_overflow=64):
+    replica_uris: List[str] = []
+
+    def __init__(
+        self,
+        connection_uri="",
+        pool_size=4,
+        max_overflow=64,
+        replica_uris: List[str] = [],
+        replica_strategy: replica_strategy_types = "round_robin",
+        read_your_writes_window: float = 0,
+        request_scoped_sessions: bool = False,
+        echo: bool = False,
+        instrument: bool = True,
+        slow_query_ms: float = 500,
+    ):
         self.connection_uri = connection_uri
+        self.replica_uris = replica_uris
         self.engine = create_async_engine(
             self.connection_uri,
-            echo=True,
+            echo=echo,
             future=True,
             pool_size=pool_size,
             max_overflow=max_overflow,
         )
+        self.setup_replicas(
+            replica_engines=[
+                create_async_engine(
+                    uri,
+                    echo=echo,
+                    future=True,
+                    pool_size=pool_size,
+                    max_overflow=max_overflow,
+                )
+                for uri in replica_uris
+            ],
+            replica_strategy=replica_strategy,
+            read_your_writes_window=read_your_writes_window,
+        )
+        self.setup_sessions(request_scoped_sessions=request_scoped_sessions)
+        self.setup_instrumentation(instrument=instrument, slow_query_ms=slow_query_ms)
+
+    async def estimate_row_count(
+        self, session: AsyncSession, table_name: str
+    ) -> Union[int, None]:
+        query = text(
+            "SELECT TABLE_ROWS FROM information_schema.TABLES"
+            " WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table_name"
+        )
+        estimate = (
+            await session.execute(query, {"table_name": table_name})
+        ).scalar_one_or_none()
+        return int(estimate) if estimate != None else None
 
 
 # -------------------------------------------------------------------------------------------
@@ -102,6 +523,182 @@ class PostgresqlAdapter(MysqlAdapter):
         async with self.getSession() as session:
             await session.execute(query)
 
+    async def estimate_row_count(
+        self, session: AsyncSession, table_name: str
+    ) -> Union[int, None]:
+        query = text(
+            "SELECT reltuples FROM pg_class WHERE relname = :table_name AND relkind = 'r'"
+        )
+        estimate = (
+            await session.execute(query, {"table_name": table_name})
+        ).scalar_one_or_none()
+        # reltuples is -1 for tables that were never vacuumed or analyzed
+        return int(estimate) if estimate != None and estimate >= 0 else None
+
+
+# -------------------------------------------------------------------------------------------
+# SQLITE PERFORMANCE PROFILES
+# -------------------------------------------------------------------------------------------
+# The pragmas a profiled SqliteAdapter applies to every connection it opens. A negative
+# cache_size is in KiB rather than pages. All profiles use WAL journaling, so readers never
+# wait on the writer.
+SQLITE_PROFILES: Dict[str, Dict[str, Any]] = {
+    # synchronous=NORMAL only syncs at WAL checkpoints. The last commits can be lost on
+    # power loss, but the database can't be corrupted.
+    "balanced": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # synchronous=FULL syncs every commit
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -16000,
+        "mmap_size": 0,
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,
+    },
+    # synchronous=OFF never syncs. An OS crash or power loss can corrupt the database.
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256000,
+        "mmap_size": 1073741824,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+# In memory databases have no journal file and nothing to memory map
+SQLITE_MEMORY_SKIPPED_PRAGMAS = ("journal_mode", "mmap_size")
+# Pool shape of profiled file mode adapters
+SQLITE_FILE_POOL_SIZE = 8
+SQLITE_FILE_MAX_OVERFLOW = 16
+# Pool shape of the read-only connections in reader_writer mode
+SQLITE_READER_POOL_SIZE = 8
+SQLITE_READER_MAX_OVERFLOW = 8
+
+
+# -------------------------------------------------------------------------------------------
+# SQLITE WRITE QUEUE
+# -------------------------------------------------------------------------------------------
+# Serializes writes onto a single writer connection. Each queued write is granted the
+# writer's session in turn, inside a SAVEPOINT, so a failing write only rolls back its own
+# work. Writes that queue up while others run join the same transaction, which commits
+# once the queue is empty or max_batch writes have run (group commit). A write's session
+# only exits once its batch has committed, so callers see the same durability as before.
+class SqliteWriteJob:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        # resolves with the writer session when it is this job's turn
+        self.granted = loop.create_future()
+        # resolves with the exception that ended the job's work, or None
+        self.finished = loop.create_future()
+        # resolves with the exception that failed the batch commit, or None
+        self.committed = loop.create_future()
+
+
+class SqliteWriteQueue:
+    max_batch: int = 64
+    batches: int = 0
+    writes: int = 0
+
+    def __init__(self, session_factory: sessionmaker = ..., max_batch: int = 64):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue: Union[asyncio.Queue, None] = None
+        self._worker: Union[asyncio.Task, None] = None
+        self._loop: Union[asyncio.AbstractEventLoop, None] = None
+        # the writer session of the job running in the current context
+        self._current = ContextVar(f"cruddy_writer_session_{id(self)}", default=None)
+
+    # Writes made while a queued write runs (like a lifecycle hook calling another
+    # repository) share its session instead of queueing behind it.
+    def current_session(self) -> Union[AsyncSession, None]:
+        return self._current.get()
+
+    @asynccontextmanager
+    async def session(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._work())
+        job = SqliteWriteJob(loop)
+        self._queue.put_nowait(job)
+        try:
+            session = await job.granted
+        except BaseException as e:
+            # cancelled while queued. If the turn came anyway, hand it back.
+            if not job.granted.cancel() and not job.finished.done():
+                job.finished.set_result(e)
+            raise
+        token = self._current.set(session)
+        try:
+            yield session
+        except BaseException as e:
+            job.finished.set_result(e)
+            raise
+        finally:
+            self._current.reset(token)
+        job.finished.set_result(None)
+        error = await job.committed
+        if error != None:
+            raise error
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            batch: List[SqliteWriteJob] = []
+            try:
+                async with self.session_factory() as session:
+                    while job != None:
+                        if not job.granted.cancelled():
+                            savepoint = await session.begin_nested()
+                            # the group's earlier jobs are not committed yet
+                            session.info[SESSION_WROTE_KEY] = True
+                            job.granted.set_result(session)
+                            if await job.finished is None:
+                                try:
+                                    # flushes whatever the job left pending
+                                    await savepoint.commit()
+                                except SQLAlchemyError as e:
+                                    await savepoint.rollback()
+                                    job.committed.set_result(e)
+                                else:
+                                    batch.append(job)
+                            else:
+                                await savepoint.rollback()
+                        if len(batch) >= self.max_batch or self._queue.empty():
+                            job = None
+                        else:
+                            job = self._queue.get_nowait()
+                    await commit_session(session)
+                error = None
+            except Exception as e:
+                error = e
+                if job != None and not job.granted.done():
+                    job.granted.set_exception(e)
+                elif job != None and not job.committed.done():
+                    job.committed.set_result(e)
+            self.batches += 1
+            self.writes += len(batch)
+            for done in batch:
+                done.committed.set_result(error)
+
+    async def close(self):
+        if self._worker != None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
 
 # -------------------------------------------------------------------------------------------
 # SQLITE ADAPTER
@@ -114,9 +711,209 @@ class SqliteAdapter(BaseAdapter):
     connection_uri: str = None
     engine: Union[AsyncEngine, None] = None
 
-    def __init__(self, db_path="temp.db", mode: Literal["memory", "file"] = "memory"):
-        if mode == "memory":
-            self.connection_uri = f"{self.SQLITE_ASYNC_URL_PREFIX}{self.MEMORY_LOCATION_START}{db_path}{self.MEMORY_LOCATION_END}"
+    replica_uris: List[str] = []
+    mode: Literal["memory", "file", "reader_writer"] = "memory"
+    profile: Union[sqlite_profile_types, None] = None
+    pragmas: Dict[str, Any] = {}
+    write_queue: Union[SqliteWriteQueue, None] = None
+
+    # replica_paths are database paths opened in the same mode as db_path.
+    # Without a profile, connections are opened the way the aiosqlite dialect defaults to:
+    # one static connection in memory mode, and a new connection per session in file mode.
+    # A profile applies its pragmas (plus any overrides in pragmas) to each connection,
+    # and keeps a pool of file mode connections open so their caches survive.
+    # "reader_writer" mode opens a file database in WAL mode with a pool of read-only
+    # connections for read sessions, and one writer connection fed by a SqliteWriteQueue.
+    # Readers never wait on the writer, and writes never compete for the write lock.
+    def __init__(
+        self,
+        db_path="temp.db",
+        mode: Literal["memory", "file", "reader_writer"] = "memory",
+        replica_paths: List[str] = [],
+        replica_strategy: replica_strategy_types = "round_robin",
+        read_your_writes_window: float = 0,
+        request_scoped_sessions: bool = False,
+        echo: bool = False,
+        instrument: bool = True,
+        slow_query_ms: float = 500,
+        profile: Union[sqlite_profile_types, None] = None,
+        pragmas: Dict[str, Any] = {},
+        reader_pool_size: int = SQLITE_READER_POOL_SIZE,
+        writer_batch_size: int = 64,
+    ):
+        self.mode = mode
+        self.profile = profile
+        self.pragmas = {
+            k: v
+            for k, v in {**SQLITE_PROFILES.get(profile, {}), **pragmas}.items()
+            if mode != "memory" or k not in SQLITE_MEMORY_SKIPPED_PRAGMAS
+        }
+        if mode == "reader_writer":
+            self.setup_reader_writer(
+                db_path=db_path,
+                echo=echo,
+                reader_pool_size=reader_pool_size,
+                writer_batch_size=writer_batch_size,
+                request_scoped_sessions=request_scoped_sessions,
+            )
+            self.setup_instrumentation(
+                instrument=instrument, slow_query_ms=slow_query_ms
+            )
+            return
+        self.connection_uri = self.build_uri(db_path=db_path, mode=mode)
+        self.replica_uris = [
+            self.build_uri(db_path=x, mode=mode) for x in replica_paths
+        ]
+        self.engine = self.create_engine(uri=self.connection_uri, echo=echo)
+        self.setup_replicas(
+            replica_engines=[
+                self.create_engine(uri=uri, echo=echo) for uri in self.replica_uris
+            ],
+            replica_strategy=replica_strategy,
+            read_your_writes_window=read_your_writes_window,
+        )
+        self.setup_sessions(request_scoped_sessions=request_scoped_sessions)
+        self.setup_instrumentation(instrument=instrument, slow_query_ms=slow_query_ms)
+
+    def setup_reader_writer(
+        self,
+        db_path: str = ...,
+        echo: bool = False,
+        reader_pool_size: int = SQLITE_READER_POOL_SIZE,
+        writer_batch_size: int = 64,
+        request_scoped_sessions: bool = False,
+    ):
+        if request_scoped_sessions:
+            # a request holding the writer's turn would serialize every request
+            raise ValueError(
+                "request_scoped_sessions can't be used with reader_writer mode"
+            )
+        writer_pragmas = {**self.pragmas, "journal_mode": "WAL"}
+        reader_pragmas = {k: v for k, v in self.pragmas.items() if k != "journal_mode"}
+        self.connection_uri = self.build_uri(db_path=db_path, mode="file")
+        self.engine = self.create_engine(
+            uri=self.connection_uri,
+            echo=echo,
+            pool_options={
+                "poolclass": AsyncAdaptedQueuePool,
+                "pool_size": 1,
+                "max_overflow": 0,
+            },
+            pragmas=writer_pragmas,
+            immediate_transactions=True,
+        )
+        # the read-only pool takes every read session, like a replica that never lags
+        self.replica_uris = [
+            f"{self.SQLITE_ASYNC_URL_PREFIX}file:{db_path}?mode=ro&uri=true"
+        ]
+        self.setup_replicas(
+            replica_engines=[
+                self.create_engine(
+                    uri=self.replica_uris[0],
+                    echo=echo,
+                    pool_options={
+                        "poolclass": AsyncAdaptedQueuePool,
+                        "pool_size": reader_pool_size,
+                        "max_overflow": SQLITE_READER_MAX_OVERFLOW,
+                    },
+                    pragmas=reader_pragmas,
+                )
+            ]
+        )
+        self.setup_sessions()
+        self.write_queue = SqliteWriteQueue(
+            session_factory=self.asyncSessionGenerator(self.engine),
+            max_batch=writer_batch_size,
+        )
+
+    def shared_session(self) -> Union[AsyncSession, None]:
+        if self.write_queue != None and self.write_queue.current_session() != None:
+            return self.write_queue.current_session()
+        return super().shared_session()
+
+    # In reader_writer mode, write sessions are served by the write queue, and sessions
+    # opened while a queued write runs join that write.
+    @asynccontextmanager
+    async def getSession(self, read_only: bool = False, shared: bool = True):
+        if self.write_queue is None:
+            async with super().getSession(
+                read_only=read_only, shared=shared
+            ) as session:
+                yield session
+            return
+        writer_session = self.write_queue.current_session()
+        if writer_session != None and (shared or not read_only):
+            if not read_only:
+                writer_session.info[SESSION_WROTE_KEY] = True
+            yield writer_session
+            if not read_only:
+                await writer_session.flush()
+        elif read_only:
+            async with super().getSession(read_only=True, shared=shared) as session:
+                yield session
+        else:
+            async with self.write_queue.session() as session:
+                yield session
+
+    # pool_options and pragmas default to the ones of the adapter's mode and profile.
+    # immediate_transactions takes the write lock when a transaction begins, and lets
+    # SQLAlchemy manage transactions itself so SAVEPOINTs work with the sqlite driver.
+    def create_engine(
+        self,
+        uri: str = ...,
+        echo: bool = False,
+        pool_options: Union[Dict[str, Any], None] = None,
+        pragmas: Union[Dict[str, Any], None] = None,
+        immediate_transactions: bool = False,
+    ) -> AsyncEngine:
+        pragmas = pragmas if pragmas != None else self.pragmas
+        if pool_options != None:
+            engine = create_async_engine(uri, echo=echo, future=True, **pool_options)
+        elif self.profile is None:
+            engine = create_async_engine(uri, echo=echo, future=True)
+        elif self.mode == "memory":
+            engine = create_async_engine(
+                uri, echo=echo, future=True, poolclass=StaticPool
+            )
         else:
-            self.connection_uri = f"{self.SQLITE_ASYNC_URL_PREFIX}{db_path}"
-        self.engine = create_async_engine(self.connection_uri, echo=True, future=True)
+            engine = create_async_engine(
+                uri,
+                echo=echo,
+                future=True,
+                poolclass=AsyncAdaptedQueuePool,
+                pool_size=SQLITE_FILE_POOL_SIZE,
+                max_overflow=SQLITE_FILE_MAX_OVERFLOW,
+            )
+        statements = [f"PRAGMA {k}={v}" for k, v in pragmas.items()]
+
+        def on_connect(dbapi_connection, connection_record):
+            if immediate_transactions:
+                dbapi_connection.isolation_level = None
+            cursor = dbapi_connection.cursor()
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.close()
+
+        def on_begin(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+        if len(statements) > 0 or immediate_transactions:
+            event.listen(engine.sync_engine, "connect", on_connect)
+        if immediate_transactions:
+            event.listen(engine.sync_engine, "begin", on_begin)
+        return engine
+
+    # Profiled adapters let SQLite refresh the query planner statistics it finds
+    # worth updating before the connections close.
+    async def shutdown(self):
+        if self.write_queue != None:
+            await self.write_queue.close()
+        if self.profile != None or self.write_queue != None:
+            async with self.engine.connect() as conn:
+                await conn.exec_driver_sql("PRAGMA optimize")
+        await super().shutdown()
+
+    def build_uri(self, db_path: str = ..., mode: Literal["memory", "file"] = ...):
+        if mode == "memory":
+            return f"{self.SQLITE_ASYNC_URL_PREFIX}{self.MEMORY_LOCATION_START}{db_path}{self.MEMORY_LOCATION_END}"
+        return f"{self.SQLITE_ASYNC_URL_PREFIX}{db_path}"
@@ -0,0 +1,288 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from logging import getLogger
+from urllib.parse import urlencode
+from fastapi import APIRouter, Request, Response, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.dependencies.utils import solve_dependencies
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute, run_endpoint_function, serialize_response
+from starlette.background import BackgroundTasks
+from starlette.routing import Match
+from typing import Union, List, Dict, Tuple, Any, TYPE_CHECKING
+from .adapters import RequestSessionRoute
+from .schemas import BatchOperation, BatchRequest, BatchResponse
+from .serialization import dump_json
+
+if TYPE_CHECKING:
+    from .resource import Resource
+
+LOGGER = getLogger(__name__)
+
+# Sent for the operations of a transactional batch that did not fail themselves, once
+# another operation failed and the transaction was rolled back
+ROLLED_BACK_STATUS = 424
+
+
+class BatchRollback(Exception):
+    pass
+
+
+# -------------------------------------------------------------------------------------------
+# BATCH ROUTER
+# -------------------------------------------------------------------------------------------
+# POST /_batch runs many resource requests in one HTTP call. Each operation is matched to
+# a route of one of the resources, and runs through that route exactly as a request
+# would: its policies and other dependencies, query and body validation, the handler and
+# its response model. Middleware and the HTTP round trip are only paid once per batch.
+#
+# Operations run in order. Consecutive GET operations run concurrently, at most
+# concurrency at a time, while other operations wait for everything before them. With
+# "transaction": true, every operation runs in order on one session of the resources'
+# (shared) adapter, and the first failure rolls the whole batch back.
+def CreateBatchRouter(
+    resources: Union[List["Resource"], None] = None,
+    max_operations: int = 100,
+    concurrency: int = 8,
+    path: str = "/_batch",
+) -> APIRouter:
+    # operations on resources with request scoped sessions commit before the response
+    router = APIRouter(route_class=RequestSessionRoute)
+
+    @router.post(path, response_model=BatchResponse)
+    async def batch(request: Request, data: BatchRequest):
+        if len(data.operations) > max_operations:
+            raise HTTPException(
+                status_code=400,
+                detail=f"A batch may hold at most {max_operations} operations",
+            )
+        candidates = BatchResources(resources)
+        background = BackgroundTasks()
+        if data.transaction:
+            results = await RunBatchTransaction(
+                request=request,
+                resources=candidates,
+                operations=data.operations,
+                background=background,
+            )
+        else:
+            results = await RunBatch(
+                request=request,
+                resources=candidates,
+                operations=data.operations,
+                background=background,
+                concurrency=concurrency,
+            )
+        return Response(
+            content=dump_json({"results": results}),
+            media_type="application/json",
+            background=background,
+        )
+
+    return router
+
+
+# Every registered resource, unless the batch router was given its own list
+def BatchResources(resources: Union[List["Resource"], None] = None) -> List["Resource"]:
+    if resources != None:
+        return resources
+    from .resource import CruddyResourceRegistry
+
+    return CruddyResourceRegistry._resources
+
+
+async def RunBatch(
+    request: Request = ...,
+    resources: List["Resource"] = ...,
+    operations: List[BatchOperation] = ...,
+    background: BackgroundTasks = ...,
+    concurrency: int = 8,
+) -> List[Dict]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def read(operation: BatchOperation) -> Dict:
+        async with semaphore:
+            return await RunOperation(request, resources, operation, background)
+
+    results = []
+    reads = []
+    for operation in operations:
+        if operation.method == "GET":
+            reads.append(operation)
+            continue
+        if len(reads) > 0:
+            results += await asyncio.gather(*[read(x) for x in reads])
+            reads = []
+        results.append(await RunOperation(request, resources, operation, background))
+    if len(reads) > 0:
+        results += await asyncio.gather(*[read(x) for x in reads])
+    return results
+
+
+async def RunBatchTransaction(
+    request: Request = ...,
+    resources: List["Resource"] = ...,
+    operations: List[BatchOperation] = ...,
+    background: BackgroundTasks = ...,
+) -> List[Dict]:
+    adapters = []
+    for operation in operations:
+        try:
+            resource, _, _ = MatchOperation(request, resources, operation)
+        except HTTPException:
+            continue
+        if resource.adapter not in adapters:
+            adapters.append(resource.adapter)
+    if len(adapters) > 1:
+        raise HTTPException(
+            status_code=400,
+            detail="The operations of a transaction must share one database adapter",
+        )
+
+    results = []
+    tasks = BackgroundTasks()
+    try:
+        # operations that match no route fail without touching the database
+        async with adapters[0].transaction() if len(adapters) > 0 else NoTransaction():
+            for operation in operations:
+                result = await RunOperation(request, resources, operation, tasks)
+                results.append(result)
+                if result["status"] >= 400:
+                    raise BatchRollback()
+    except BatchRollback:
+        failed = len(results) - 1
+        detail = f"Rolled back, operation {failed} failed"
+        return [
+            results[i]
+            if i == failed
+            else {"status": ROLLED_BACK_STATUS, "body": {"detail": detail}}
+            for i in range(len(operations))
+        ]
+    background.tasks += tasks.tasks
+    return results
+
+
+@asynccontextmanager
+async def NoTransaction():
+    yield
+
+
+# Finds the resource route an operation is addressed to, and the scope of a request to it
+def MatchOperation(
+    request: Request = ...,
+    resources: List["Resource"] = ...,
+    operation: BatchOperation = ...,
+) -> Tuple["Resource", APIRoute, Dict]:
+    path, _, query_string = operation.path.partition("?")
+    query = BatchQueryString(operation.query)
+    if query_string != "" and query != "":
+        query_string = f"{query_string}&{query}"
+    elif query != "":
+        query_string = query
+    scope = {
+        **request.scope,
+        "method": operation.method,
+        "path": path,
+        "raw_path": path.encode("utf-8"),
+        "query_string": query_string.encode("utf-8"),
+        "path_params": {},
+    }
+    method_mismatch = False
+    for resource in resources:
+        for route in resource.controller.routes:
+            if not isinstance(route, APIRoute):
+                continue
+            match, child_scope = route.matches(scope)
+            if match == Match.FULL:
+                if route.response_class is StreamingResponse:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"{operation.method} {path} can't run in a batch",
+                    )
+                return resource, route, {**scope, **child_scope}
+            if match == Match.PARTIAL:
+                method_mismatch = True
+    if method_mismatch:
+        raise HTTPException(status_code=405, detail="Method Not Allowed")
+    raise HTTPException(status_code=404, detail="Not Found")
+
+
+# Query values are sent as JSON: lists of plain values become repeated parameters (like
+# columns), and objects and other lists are sent as JSON text (like where)
+def BatchQueryString(query: Union[Dict[str, Any], None] = None) -> str:
+    pairs = []
+    for key, value in (query or {}).items():
+        if isinstance(value, list) and all(
+            not isinstance(x, (dict, list)) for x in value
+        ):
+            pairs += [(key, BatchQueryValue(x)) for x in value]
+        elif value != None:
+            pairs.append((key, BatchQueryValue(value)))
+    return urlencode(pairs)
+
+
+def BatchQueryValue(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return f"{value}"
+
+
+# Runs one operation through its route, and returns its status code and JSON body.
+# Policies that edit the request body (request._json) edit the operation's body.
+async def RunOperation(
+    request: Request = ...,
+    resources: List["Resource"] = ...,
+    operation: BatchOperation = ...,
+    background: BackgroundTasks = ...,
+) -> Dict:
+    try:
+        _, route, scope = MatchOperation(request, resources, operation)
+        sub_request = Request(scope, receive=request.receive)
+        body = operation.body
+        if body != None:
+            sub_request._body = dump_json(body)
+            sub_request._json = body
+        values, errors, tasks, sub_response, _ = await solve_dependencies(
+            request=sub_request,
+            dependant=route.dependant,
+            body=body,
+            dependency_overrides_provider=request.app,
+        )
+        if len(errors) > 0:
+            raise RequestValidationError(errors)
+        # sync endpoints run in the threadpool, as they do outside of a batch
+        is_coroutine = asyncio.iscoroutinefunction(route.dependant.call)
+        raw = await run_endpoint_function(
+            dependant=route.dependant, values=values, is_coroutine=is_coroutine
+        )
+        if tasks != None:
+            background.tasks += tasks.tasks
+        if isinstance(raw, Response):
+            return {
+                "status": raw.status_code,
+                "body": json.loads(raw.body) if len(raw.body) > 0 else None,
+            }
+        content = await serialize_response(
+            field=route.response_field,
+            response_content=raw,
+            include=route.response_model_include,
+            exclude=route.response_model_exclude,
+            by_alias=route.response_model_by_alias,
+            exclude_unset=route.response_model_exclude_unset,
+            exclude_defaults=route.response_model_exclude_defaults,
+            exclude_none=route.response_model_exclude_none,
+            is_coroutine=is_coroutine,
+        )
+        status = sub_response.status_code or route.status_code or 200
+        return {"status": status, "body": content}
+    except HTTPException as e:
+        return {"status": e.status_code, "body": {"detail": e.detail}}
+    except RequestValidationError as e:
+        return {"status": 422, "body": {"detail": jsonable_encoder(e.errors())}}
+    except Exception:
+        LOGGER.exception(f"batch operation {operation.method} {operation.path} failed")
+        return {"status": 500, "body": {"detail": "Internal Server Error"}}
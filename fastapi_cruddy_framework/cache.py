@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from typing import Union, Dict, Any
+
+
+# -------------------------------------------------------------------------------------------
+# CACHE BACKENDS
+# -------------------------------------------------------------------------------------------
+# The interface repository caches are written against. Subclass it to keep cached values
+# somewhere else, like Redis or memcached. get returns None on a miss, so None itself is
+# never cached. Keys are strings prefixed with the model name ("User:1"), so one backend
+# can be shared by many resources, and clear(prefix) only drops the keys of one of them.
+class CacheBackend:
+    async def get(self, key: str) -> Any:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: Any, ttl: Union[float, None] = None):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def clear(self, prefix: str = ""):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        return {}
+
+
+# The default backend: an in-process LRU, where entries also expire ttl seconds after they
+# are set. Values are stored as they are given, so callers should not mutate them.
+class LRUCache(CacheBackend):
+    max_size: int = 1024
+    ttl: float = 60
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries: OrderedDict = OrderedDict()
+
+    async def get(self, key: str) -> Any:
+        entry = self._entries.get(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    async def set(self, key: str, value: Any, ttl: Union[float, None] = None):
+        if self.max_size <= 0:
+            return
+        ttl = ttl if ttl != None else self.ttl
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    async def clear(self, prefix: str = ""):
+        if prefix == "":
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -1,16 +1,33 @@
-from asyncio import gather
-from fastapi import APIRouter, Path, Query, Depends
-from sqlalchemy.sql.schema import Column, ForeignKey
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import (
+    APIRouter,
+    Path,
+    Query,
+    Body,
+    Depends,
+    HTTPException,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from fastapi.dependencies.models import Dependant
+from fastapi.dependencies.utils import (
+    get_parameterless_sub_dependant,
+    solve_dependencies,
+)
 from sqlalchemy.orm import (
     ONETOMANY,
     MANYTOMANY,
     MANYTOONE,
 )
-from typing import Union, List, Dict, TYPE_CHECKING
+from typing import Union, List, Dict, Any, Callable, AsyncIterator, TYPE_CHECKING
 from pydantic.types import Json
 from .schemas import (
     RelationshipConfig,
     BulkDTO,
+    BulkWriteResponse,
     MetaObject,
     PageResponse,
     ResponseSchema,
@@ -18,9 +35,19 @@ from .schemas import (
     ExampleUpdate,
     ExampleCreate,
 )
-from .util import possible_id_types
+from .util import (
+    possible_id_types,
+    count_strategy_types,
+    InvalidCursor,
+    UnsafeBulkWrite,
+    RelationshipWriteError,
+    NotModified,
+    export_format_types,
+)
+from .serialization import EXPORT_MEDIA_TYPES
 
 if TYPE_CHECKING:
+    from .serialization import RowEncoder
     from .repository import AbstractRepository
     from .resource import Resource
     from .adapters import BaseAdapter, MysqlAdapter, PostgresqlAdapter, SqliteAdapter
@@ -69,6 +96,174 @@ def assemblePolicies(*args: (List)):
     return merged
 
 
+# Runs policies chosen while handling a request, rather than when its route was built,
+# like those of the resources a client asks to include. Each policy's own dependencies
+# are resolved from the request, as they would be for a route dependency.
+async def RunPolicies(
+    request: Request = ...,
+    response: Union[Response, None] = None,
+    policies: List[Callable] = ...,
+):
+    if len(policies) == 0:
+        return
+    dependant = Dependant(
+        dependencies=[
+            get_parameterless_sub_dependant(
+                depends=Depends(policy), path=request.url.path
+            )
+            for policy in policies
+        ]
+    )
+    _, errors, _, _, _ = await solve_dependencies(
+        request=request,
+        dependant=dependant,
+        response=response,
+        dependency_overrides_provider=request.app,
+    )
+    if len(errors) > 0:
+        raise RequestValidationError(errors)
+
+
+# include accepts repeated and comma separated relationship names: include=groups,posts
+def ParseInclude(
+    include: Union[List[str], None] = None,
+    relations: Dict[str, RelationshipConfig] = ...,
+) -> List[str]:
+    names = []
+    for value in include or []:
+        for name in value.split(","):
+            name = name.strip()
+            if name == "" or name in names:
+                continue
+            if name not in relations:
+                raise HTTPException(
+                    status_code=400, detail=f"Unknown relationship to include: {name}"
+                )
+            names.append(name)
+    return names
+
+
+# Loads the included relationships of a page of records with one query per relationship
+# (see AbstractRepository.get_included), after running each far side resource's get_many
+# policies. Returns the embedded values by record id, then by relationship name: a list
+# of records for x-to-Many relationships, and a single record (or None) for many to one.
+# Related records are shaped like the far side resource's list responses.
+async def LoadIncluded(
+    request: Request = ...,
+    response: Response = ...,
+    repository: "AbstractRepository" = ...,
+    relations: Dict[str, RelationshipConfig] = ...,
+    include: List[str] = ...,
+    ids: List[possible_id_types] = ...,
+    links: bool = True,
+) -> Dict[possible_id_types, Dict[str, Any]]:
+    included = {id: {} for id in ids}
+    for name in include:
+        config = relations[name]
+        foreign = config.foreign_resource
+        await RunPolicies(
+            request=request, response=response, policies=foreign.policies["get_many"]
+        )
+        grouped = await repository.get_included(
+            ids=ids,
+            relation=name,
+            relation_model=foreign.repository.model,
+            _lifecycle_before=foreign.repository.lifecycle["before_get_all"],
+            _lifecycle_after=foreign.repository.lifecycle["after_get_all"],
+        )
+        to_one = config.orm_relationship.direction == MANYTOONE
+        for id, embedded in included.items():
+            records = [
+                foreign.row_encoder.encode_row(row, links)
+                for row in grouped.get(id, [])
+            ]
+            if to_one:
+                embedded[name] = records[0] if len(records) > 0 else None
+            else:
+                embedded[name] = records
+    return included
+
+
+def BuildMeta(result: BulkDTO = ..., meta_schema=MetaObject):
+    meta = {
+        "page": result.page,
+        "limit": result.limit,
+        "pages": result.total_pages,
+        "records": result.total_records,
+    }
+    # Optional meta values are only handed to meta schemas that declare them, so
+    # custom meta schemas with a fixed __init__ keep working.
+    for key in ("next", "has_more", "count_strategy"):
+        value = getattr(result, key)
+        if value != None and key in meta_schema.__fields__:
+            meta[key] = value
+    return meta_schema(**meta)
+
+
+# The validators of a conditional GET. If-None-Match ETags are compared weakly, as the
+# header requires, and If-Modified-Since is only read when no ETag was sent. variant is
+# mixed into ETags, so each representation of the same records has its own.
+def ConditionalRequest(request: Request, variant: str = "") -> Dict:
+    if_none_match = None
+    header = request.headers.get("if-none-match", None)
+    if header != None:
+        if_none_match = []
+        for tag in header.split(","):
+            tag = tag.strip()
+            if_none_match.append(tag[2:] if tag.startswith("W/") else tag)
+    if_modified_since = None
+    header = request.headers.get("if-modified-since", None)
+    if if_none_match is None and header != None:
+        try:
+            if_modified_since = _utc(parsedate_to_datetime(header))
+        except (TypeError, ValueError, IndexError):
+            pass
+    return {
+        "if_none_match": if_none_match,
+        "if_modified_since": if_modified_since,
+        "variant": variant,
+    }
+
+
+# The representation variant of responses built with links=false
+def LinksVariant(links: bool = True) -> str:
+    return "" if links else "|nolinks"
+
+
+def VersionHeaders(etag: str = ..., last_modified: Union[datetime, None] = None):
+    headers = {"ETag": etag}
+    if last_modified != None:
+        headers["Last-Modified"] = format_datetime(_utc(last_modified), usegmt=True)
+    return headers
+
+
+def NotModifiedResponse(etag: str = ..., last_modified: Union[datetime, None] = None):
+    return Response(status_code=304, headers=VersionHeaders(etag, last_modified))
+
+
+# A single record is also unchanged when its updated_at, in whole seconds like the
+# header, is not later than If-Modified-Since
+def RecordNotModified(
+    conditional: Dict = ...,
+    etag: str = ...,
+    last_modified: Union[datetime, None] = None,
+) -> bool:
+    tags = conditional["if_none_match"]
+    if tags != None:
+        return etag in tags or "*" in tags
+    since = conditional["if_modified_since"]
+    if since is None or last_modified is None:
+        return False
+    return _utc(last_modified).replace(microsecond=0) <= since
+
+
+# updated_at columns hold naive UTC datetimes
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
 def _ControllerConfigManyToOne(
     controller: APIRouter = ...,
     repository: "AbstractRepository" = ...,
@@ -77,12 +272,9 @@ def _ControllerConfigManyToOne(
     config: RelationshipConfig = ...,
     policies_universal: List = ...,
     policies_get_one: List = ...,
+    conditional_requests: bool = False,
 ):
-    col: Column = next(iter(config.orm_relationship.local_columns))
-    far_side: ForeignKey = next(iter(col.foreign_keys))
-    far_col: Column = far_side.column
-    far_col_name = far_col.name
-    near_col_name = col.name
+    far_model: CruddyModel = config.foreign_resource.repository.model
 
     # Merge three policy sets onto this endpoint:
     # 1. Universal policies
@@ -99,60 +291,65 @@ def _ControllerConfigManyToOne(
         ),
     )
     async def get_many_to_one(
+        request: Request,
+        response: Response,
         id: id_type = Path(..., alias="id"),
         columns: List[str] = Query(None, alias="columns"),
+        links: bool = Query(True, alias="links"),
     ):
-        origin_record = await repository.get_by_id(id=id)
-
-        # Consider raising 404 here and in get by ID
-        if origin_record == None:
-            return config.foreign_resource.schemas["single"](data=None)
-
-        # Build a query to use foreign resource to find related objects
-
-        tgt_id = origin_record.dict()[near_col_name]
-        where = {far_col_name: {"*eq": tgt_id}}
-
-        _lifecycle_before = None
         foreign_lifecycle_before = config.foreign_resource.repository.lifecycle[
             "before_get_one"
         ]
         foreign_lifecycle_after = config.foreign_resource.repository.lifecycle[
             "after_get_one"
         ]
+        # The foreign resource's get one hooks see the related id and record, as if the
+        # record was requested from the foreign resource directly. Its before hook runs
+        # before the related record is read, so the origin record's foreign key is read
+        # first when there is one. Otherwise the foreign key and the related record are
+        # read with one outer joined query.
         if foreign_lifecycle_before != None:
+            found = await repository.get_relation_key(id=id, relation=relationship_prop)
+            # Consider raising 404 here and in get by ID
+            if found == None:
+                return config.foreign_resource.schemas["single"](data=None)
+            await foreign_lifecycle_before(found[0])
 
-            async def _shimmed_lifecycle_before():
-                await foreign_lifecycle_before(tgt_id)
-                return
-
-            _lifecycle_before = _shimmed_lifecycle_before
-
-        # Collect the bulk data transfer object from the query
-        result: BulkDTO = await config.foreign_resource.repository.get_all(
-            page=1,
-            limit=1,
+        found = await repository.get_one_relation(
+            id=id,
+            relation=relationship_prop,
+            relation_model=far_model,
             columns=columns,
-            sort=None,
-            where=where,
-            _use_own_hooks=False,
-            _lifecycle_before=_lifecycle_before,
         )
 
-        # If we get a result, grab the first value. There should only be one in many to one.
-        data = None
-        if len(result.data) != 0:
-            data = result.data[0]
-            table_record = config.foreign_resource.repository.model(**data)
-            if foreign_lifecycle_after != None:
-                await foreign_lifecycle_after(table_record)
-            data = table_record.dict()
-        else:
-            if foreign_lifecycle_after != None:
-                await foreign_lifecycle_after(None)
+        # Consider raising 404 here and in get by ID
+        if found == None:
+            return config.foreign_resource.schemas["single"](data=None)
+
+        _, data = found
+
+        if foreign_lifecycle_after != None and isinstance(data, dict):
+            # the hook gets a record, whose requested columns are returned
+            record = far_model(**data)
+            await foreign_lifecycle_after(record)
+            data = {k: getattr(record, k) for k in data}
+        elif foreign_lifecycle_after != None:
+            await foreign_lifecycle_after(data)
+
+        version = None
+        if conditional_requests and data != None:
+            version = config.foreign_resource.repository.record_version(
+                record=data, variant=LinksVariant(links)
+            )
+        if version != None:
+            if RecordNotModified(
+                ConditionalRequest(request, LinksVariant(links)), *version
+            ):
+                return NotModifiedResponse(*version)
+            response.headers.update(VersionHeaders(*version))
 
         # Invoke the dynamically built model
-        return config.foreign_resource.schemas["single"](data=data)
+        return config.foreign_resource.schemas["single"](data=data, with_links=links)
 
 
 def _ControllerConfigOneToMany(
@@ -164,11 +361,9 @@ def _ControllerConfigOneToMany(
     meta_schema=MetaObject,
     policies_universal: List = ...,
     policies_get_one: List = ...,
+    conditional_requests: bool = False,
 ):
-    far_col: Column = next(iter(config.orm_relationship.remote_side))
-    col: Column = next(iter(config.orm_relationship.local_columns))
-    far_col_name = far_col.name
-    near_col_name = col.name
+    far_model: CruddyModel = config.foreign_resource.repository.model
 
     # Merge three policy sets onto this endpoint:
     # 1. Universal policies
@@ -185,29 +380,18 @@ def _ControllerConfigOneToMany(
         ),
     )
     async def get_one_to_many(
+        request: Request,
+        response: Response,
         id: id_type = Path(..., alias="id"),
         page: int = 1,
         limit: int = 10,
         columns: List[str] = Query(None, alias="columns"),
         sort: List[str] = Query(None, alias="sort"),
         where: Json = Query(None, alias="where"),
+        after: str = Query(None, alias="after"),
+        count: count_strategy_types = Query(None, alias="count"),
+        links: bool = Query(True, alias="links"),
     ):
-        origin_record = await repository.get_by_id(id=id)
-
-        # Consider raising 404 here and in get by ID
-        if origin_record == None:
-            return config.foreign_resource.schemas["many"](
-                data=[],
-                meta=meta_schema(**{"page": 0, "limit": 0, "pages": 0, "records": 0}),
-            )
-
-        # Build a query to use foreign resource to find related objects
-        additional_where = {far_col_name: {"*eq": origin_record.dict()[near_col_name]}}
-        if where != None:
-            repo_where = {"*and": [additional_where, where]}
-        else:
-            repo_where = additional_where
-
         _lifecycle_before = None
         foreign_lifecycle_before = config.foreign_resource.repository.lifecycle[
             "before_get_all"
@@ -227,28 +411,53 @@ def _ControllerConfigOneToMany(
 
             _lifecycle_before = _shimmed_lifecycle_before
 
-        # Collect the bulk data transfer object from the query
-        result: BulkDTO = await config.foreign_resource.repository.get_all(
-            page=page,
-            limit=limit,
-            columns=columns,
-            sort=sort,
-            where=repo_where,
-            _lifecycle_before=_lifecycle_before,
-            _lifecycle_after=config.foreign_resource.repository.lifecycle[
-                "after_get_all"
-            ],
-            _use_own_hooks=False,
-        )
-        meta = {
-            "page": result.page,
-            "limit": result.limit,
-            "pages": result.total_pages,
-            "records": result.total_records,
-        }
+        # Collect the bulk data transfer object from the query. The related records are
+        # joined to the origin record, rather than filtered by a key read from it first.
+        try:
+            result: BulkDTO = await repository.get_all_relations(
+                id=id,
+                relation=relationship_prop,
+                relation_model=far_model,
+                page=page,
+                limit=limit,
+                columns=columns,
+                sort=sort,
+                where=where,
+                after=after,
+                # the listed records belong to the foreign resource, so its count strategy applies
+                count=count
+                if count != None
+                else config.foreign_resource.repository.count_strategy,
+                _lifecycle_before=_lifecycle_before,
+                _lifecycle_after=config.foreign_resource.repository.lifecycle[
+                    "after_get_all"
+                ],
+                _conditional=ConditionalRequest(request, LinksVariant(links))
+                if conditional_requests
+                else None,
+            )
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=f"{e}")
+        except NotModified as e:
+            return NotModifiedResponse(e.etag, e.last_modified)
+
+        # An empty page may mean the origin record does not exist, only then is it probed
+        # Consider raising 404 here and in get by ID
+        if len(result.data) == 0 and not await repository.record_exists(id=id):
+            return config.foreign_resource.schemas["many"](
+                data=[],
+                meta=meta_schema(**{"page": 0, "limit": 0, "pages": 0, "records": 0}),
+            )
+
+        if result.etag != None:
+            response.headers.update(VersionHeaders(result.etag, result.last_modified))
+        meta = BuildMeta(result=result, meta_schema=meta_schema)
+        if config.foreign_resource._fast_serialization:
+            return config.foreign_resource.row_encoder.response(
+                rows=result.data, meta=meta, response=response, links=links
+            )
         return config.foreign_resource.schemas["many"](
-            meta=meta_schema(**meta),
-            data=result.data,
+            meta=meta, data=result.data, with_links=links
         )
 
 
@@ -261,6 +470,7 @@ def _ControllerConfigManyToMany(
     meta_schema=MetaObject,
     policies_universal: List = ...,
     policies_get_one: List = ...,
+    conditional_requests: bool = False,
 ):
     far_model: CruddyModel = config.foreign_resource.repository.model
 
@@ -279,43 +489,131 @@ def _ControllerConfigManyToMany(
         ),
     )
     async def get_many_to_many(
+        request: Request,
+        response: Response,
         id: id_type = Path(..., alias="id"),
         page: int = 1,
         limit: int = 10,
         columns: List[str] = Query(None, alias="columns"),
         sort: List[str] = Query(None, alias="sort"),
         where: Json = Query(None, alias="where"),
+        after: str = Query(None, alias="after"),
+        count: count_strategy_types = Query(None, alias="count"),
+        links: bool = Query(True, alias="links"),
     ):
         # Collect the bulk data transfer object from the query
-        result: BulkDTO = await repository.get_all_relations(
-            id=id,
-            relation=relationship_prop,
-            relation_model=far_model,
-            page=page,
-            limit=limit,
-            columns=columns,
-            sort=sort,
-            where=where,
-            # the foreign resource must interact with its own lifecycle
-            _lifecycle_before=config.foreign_resource.repository.lifecycle[
-                "before_get_all"
-            ],
-            _lifecycle_after=config.foreign_resource.repository.lifecycle[
-                "after_get_all"
-            ],
-        )
-        meta = {
-            "page": result.page,
-            "limit": result.limit,
-            "pages": result.total_pages,
-            "records": result.total_records,
-        }
+        try:
+            result: BulkDTO = await repository.get_all_relations(
+                id=id,
+                relation=relationship_prop,
+                relation_model=far_model,
+                page=page,
+                limit=limit,
+                columns=columns,
+                sort=sort,
+                where=where,
+                after=after,
+                # the listed records belong to the foreign resource, so its count strategy applies
+                count=count
+                if count != None
+                else config.foreign_resource.repository.count_strategy,
+                # the foreign resource must interact with its own lifecycle
+                _lifecycle_before=config.foreign_resource.repository.lifecycle[
+                    "before_get_all"
+                ],
+                _lifecycle_after=config.foreign_resource.repository.lifecycle[
+                    "after_get_all"
+                ],
+                _conditional=ConditionalRequest(request, LinksVariant(links))
+                if conditional_requests
+                else None,
+            )
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=f"{e}")
+        except NotModified as e:
+            return NotModifiedResponse(e.etag, e.last_modified)
+        if result.etag != None:
+            response.headers.update(VersionHeaders(result.etag, result.last_modified))
+        meta = BuildMeta(result=result, meta_schema=meta_schema)
+        if config.foreign_resource._fast_serialization:
+            return config.foreign_resource.row_encoder.response(
+                rows=result.data, meta=meta, response=response, links=links
+            )
         return config.foreign_resource.schemas["many"](
-            meta=meta_schema(**meta),
-            data=result.data,
+            meta=meta, data=result.data, with_links=links
         )
 
 
+# Adds and removes individual links of a one to many or many to many relationship, so a
+# client does not have to send the full list of ids to change a few of them. Removals take
+# the ids as a repeated query parameter, since many clients and proxies drop DELETE
+# bodies. Both routes are guarded by the primary resource's update policies.
+def _ControllerConfigRelationWrites(
+    controller: APIRouter = ...,
+    repository: "AbstractRepository" = ...,
+    id_type: possible_id_types = ...,
+    relationship_prop: str = ...,
+    config: RelationshipConfig = ...,
+    policies_universal: List = ...,
+    policies_update: List = ...,
+):
+    foreign_id_type = config.foreign_resource._id_type
+
+    async def change_relations(id, relations, write):
+        try:
+            result = await write(id=id, relation=relationship_prop, relations=relations)
+        except RelationshipWriteError as e:
+            raise HTTPException(status_code=400, detail=f"{e}")
+        if result == None:
+            raise HTTPException(status_code=404, detail="Record not found")
+        return BulkWriteResponse(affected=result)
+
+    @controller.post(
+        f'/{"{id}"}/{relationship_prop}',
+        response_model=BulkWriteResponse,
+        dependencies=assemblePolicies(policies_universal, policies_update),
+    )
+    async def add_relations(
+        id: id_type = Path(..., alias="id"),
+        relations: List[foreign_id_type] = Body(...),
+    ):
+        return await change_relations(id, relations, repository.add_relations)
+
+    @controller.delete(
+        f'/{"{id}"}/{relationship_prop}',
+        response_model=BulkWriteResponse,
+        dependencies=assemblePolicies(policies_universal, policies_update),
+    )
+    async def remove_relations(
+        id: id_type = Path(..., alias="id"),
+        ids: List[foreign_id_type] = Query(..., alias="ids"),
+    ):
+        return await change_relations(id, ids, repository.remove_relations)
+
+
+# The body of an export. Batches are only read from the database cursor once the client
+# has taken the previous one, since the server waits for each chunk to be sent before
+# asking for the next. The cursor is closed when the client disconnects.
+async def ExportBody(
+    first: List = ...,
+    batches: AsyncIterator[List] = ...,
+    encoder: "RowEncoder" = ...,
+    format: export_format_types = "ndjson",
+) -> AsyncIterator[bytes]:
+    try:
+        if format == "csv":
+            fields = encoder.csv_fields(first[0] if len(first) > 0 else None)
+            yield encoder.encode_csv(rows=first, fields=fields, header=True)
+            async for rows in batches:
+                yield encoder.encode_csv(rows=rows, fields=fields)
+        else:
+            yield encoder.encode_ndjson(rows=first)
+            async for rows in batches:
+                yield encoder.encode_ndjson(rows=rows)
+    finally:
+        await batches.aclose()
+
+
 def GetRelationships(
     record: CruddyModel, relation_config_map: Dict[str, RelationshipConfig]
 ):
@@ -337,30 +635,11 @@ async def SaveRelationships(
     relation_config_map: Dict[str, RelationshipConfig] = ...,
     repository: "AbstractRepository" = ...,
 ):
-    relationship_lists = GetRelationships(record, relation_config_map)
-    modified_records = 0
-    awaitables = []
-    for k, v in relationship_lists.items():
-        name: str = k
-        new_relations: List[possible_id_types] = v
-        config: RelationshipConfig = relation_config_map[name]
-        if config.orm_relationship.direction == MANYTOMANY:
-            awaitables.append(
-                repository.set_many_many_relations(
-                    id=id, relation=name, relations=new_relations
-                )
-            )
-        elif config.orm_relationship.direction == ONETOMANY:
-            awaitables.append(
-                repository.set_one_many_relations(
-                    id=id, relation=name, relations=new_relations
-                )
-            )
-    results = await gather(*awaitables, return_exceptions=True)
-    for result_or_exc in results:
-        if not isinstance(result_or_exc, Exception):
-            modified_records += result_or_exc
-    return modified_records
+    # All relationship lists are written in a single transaction. Failures raise a
+    # RelationshipWriteError instead of being dropped.
+    return await repository.set_relations(
+        id=id, relations=GetRelationships(record, relation_config_map)
+    )
 
 
 def ControllerCongifurator(
@@ -371,12 +650,15 @@ def ControllerCongifurator(
     plural_name: str = ...,
     single_schema=ResponseSchema,
     many_schema=PageResponse,
+    bulk_schema=PageResponse,
     meta_schema=MetaObject,
     update_model=ExampleUpdate,
     update_model_proxy=ExampleUpdate,
+    update_many_model=ExampleUpdate,
     create_model=ExampleCreate,
     create_model_proxy=ExampleCreate,
     relations: Dict[str, RelationshipConfig] = ...,
+    protected_relationships: List[str] = [],
     policies_universal=[],
     policies_create=[],
     policies_update=[],
@@ -384,10 +666,17 @@ def ControllerCongifurator(
     policies_get_one=[],
     policies_get_many=[],
     disable_create=False,
+    disable_create_many=False,
     disable_update=False,
     disable_delete=False,
     disable_get_one=False,
     disable_get_many=False,
+    enable_update_many=False,
+    enable_delete_many=False,
+    enable_export=False,
+    conditional_requests=False,
+    fast_serialization=False,
+    row_encoder: Union["RowEncoder", None] = None,
 ) -> APIRouter:
     if not disable_create:
 
@@ -400,16 +689,40 @@ def ControllerCongifurator(
         async def create(data: create_model):
             the_thing_with_rels = getattr(data, single_name)
             the_thing = create_model_proxy(**the_thing_with_rels.dict())
-            result = await repository.create(data=the_thing)
-            relations_modified = await SaveRelationships(
-                id=getattr(result, repository.primary_key),
-                record=the_thing_with_rels,
-                relation_config_map=relations,
-                repository=repository,
-            )
-            # Add error logic?
+            try:
+                # the record and its relationships are written in one transaction
+                result = await repository.create(
+                    data=the_thing,
+                    relations=GetRelationships(the_thing_with_rels, relations),
+                )
+            except RelationshipWriteError as e:
+                raise HTTPException(status_code=400, detail=f"{e}")
             return single_schema(data=result)
 
+    if not disable_create and not disable_create_many:
+
+        @controller.post(
+            "/bulk",
+            response_model=bulk_schema,
+            response_model_exclude_none=True,
+            dependencies=assemblePolicies(policies_universal, policies_create),
+        )
+        async def create_many(data: List[create_model]):
+            the_things_with_rels = list(map(lambda x: getattr(x, single_name), data))
+            the_things = list(
+                map(lambda x: create_model_proxy(**x.dict()), the_things_with_rels)
+            )
+            relationship_lists = list(
+                map(lambda x: GetRelationships(x, relations), the_things_with_rels)
+            )
+            try:
+                result = await repository.create_many(
+                    data=the_things, relations=relationship_lists
+                )
+            except RelationshipWriteError as e:
+                raise HTTPException(status_code=400, detail=f"{e}")
+            return bulk_schema(data=result)
+
     if not disable_update:
 
         @controller.patch(
@@ -421,14 +734,15 @@ def ControllerCongifurator(
         async def update(id: id_type = Path(..., alias="id"), *, data: update_model):
             the_thing_with_rels = getattr(data, single_name)
             the_thing = update_model_proxy(**the_thing_with_rels.dict())
-            result = await repository.update(id=id, data=the_thing)
-            relations_modified = await SaveRelationships(
-                id=getattr(result, repository.primary_key),
-                record=the_thing_with_rels,
-                relation_config_map=relations,
-                repository=repository,
-            )
-            # Add error logic?
+            try:
+                # the record and its relationships are written in one transaction
+                result = await repository.update(
+                    id=id,
+                    data=the_thing,
+                    relations=GetRelationships(the_thing_with_rels, relations),
+                )
+            except RelationshipWriteError as e:
+                raise HTTPException(status_code=400, detail=f"{e}")
             return single_schema(data=result)
 
     if not disable_delete:
@@ -446,6 +760,73 @@ def ControllerCongifurator(
             # Add error logic?
             return single_schema(data=data)
 
+    # Filter based bulk writes are opt-in, a single request can touch many records
+    if enable_update_many:
+
+        @controller.patch(
+            "",
+            response_model=BulkWriteResponse,
+            dependencies=assemblePolicies(policies_universal, policies_update),
+        )
+        async def update_many(
+            where: Json = Query(..., alias="where"), *, data: update_many_model
+        ):
+            values = getattr(data, single_name).dict(exclude_unset=True)
+            try:
+                affected = await repository.update_many(where=where, data=values)
+            except UnsafeBulkWrite as e:
+                raise HTTPException(status_code=400, detail=f"{e}")
+            return BulkWriteResponse(affected=affected)
+
+    if enable_delete_many:
+
+        @controller.delete(
+            "",
+            response_model=BulkWriteResponse,
+            dependencies=assemblePolicies(policies_universal, policies_delete),
+        )
+        async def delete_many(where: Json = Query(..., alias="where")):
+            try:
+                affected = await repository.delete_many(where=where)
+            except UnsafeBulkWrite as e:
+                raise HTTPException(status_code=400, detail=f"{e}")
+            return BulkWriteResponse(affected=affected)
+
+    # Registered before GET /{id}, which would otherwise match "export" as an id
+    if enable_export:
+
+        @controller.get(
+            "/export",
+            response_class=StreamingResponse,
+            responses={200: {"content": {v: {} for v in EXPORT_MEDIA_TYPES.values()}}},
+            dependencies=assemblePolicies(policies_universal, policies_get_many),
+        )
+        async def export(
+            format: export_format_types = Query("ndjson", alias="format"),
+            columns: List[str] = Query(None, alias="columns"),
+            sort: List[str] = Query(None, alias="sort"),
+            where: Json = Query(None, alias="where"),
+            limit: int = Query(None, alias="limit", ge=1),
+        ):
+            batches = repository.stream_all(
+                columns=columns, sort=sort, where=where, limit=limit
+            )
+            # the first batch is read up front, so hooks and queries that fail are
+            # still answered with an error status instead of a broken stream
+            try:
+                first = await batches.__anext__()
+            except StopAsyncIteration:
+                first = []
+            return StreamingResponse(
+                ExportBody(
+                    first=first, batches=batches, encoder=row_encoder, format=format
+                ),
+                media_type=EXPORT_MEDIA_TYPES[format],
+                headers={
+                    "Content-Disposition": f'attachment; filename="{plural_name}.{format}"'
+                },
+            )
+
     if not disable_get_one:
 
         @controller.get(
@@ -454,9 +835,45 @@ def ControllerCongifurator(
             response_model_exclude_none=True,
             dependencies=assemblePolicies(policies_universal, policies_get_one),
         )
-        async def get_by_id(id: id_type = Path(..., alias="id")):
-            data = await repository.get_by_id(id=id)
-            return single_schema(data=data)
+        async def get_by_id(
+            request: Request,
+            response: Response,
+            id: id_type = Path(..., alias="id"),
+            columns: List[str] = Query(None, alias="columns"),
+            links: bool = Query(True, alias="links"),
+            include: List[str] = Query(None, alias="include"),
+        ):
+            include = ParseInclude(include, relations)
+            data = await repository.get_by_id(id=id, columns=columns)
+            included = None
+            if len(include) > 0 and data != None:
+                record_id = (
+                    data[repository.primary_key]
+                    if isinstance(data, dict)
+                    else getattr(data, repository.primary_key)
+                )
+                included = await LoadIncluded(
+                    request=request,
+                    response=response,
+                    repository=repository,
+                    relations=relations,
+                    include=include,
+                    ids=[record_id],
+                    links=links,
+                )
+            version = None
+            # included records change on their own, so they can't be versioned
+            if conditional_requests and data != None and included is None:
+                version = repository.record_version(
+                    record=data, variant=LinksVariant(links)
+                )
+            if version != None:
+                if RecordNotModified(
+                    ConditionalRequest(request, LinksVariant(links)), *version
+                ):
+                    return NotModifiedResponse(*version)
+                response.headers.update(VersionHeaders(*version))
+            return single_schema(data=data, with_links=links, included=included)
 
     if not disable_get_many:
 
@@ -467,24 +884,64 @@ def ControllerCongifurator(
             dependencies=assemblePolicies(policies_universal, policies_get_many),
         )
         async def get_all(
+            request: Request,
+            response: Response,
             page: int = 1,
             limit: int = 10,
             columns: List[str] = Query(None, alias="columns"),
             sort: List[str] = Query(None, alias="sort"),
             where: Json = Query(None, alias="where"),
+            after: str = Query(None, alias="after"),
+            count: count_strategy_types = Query(None, alias="count"),
+            links: bool = Query(True, alias="links"),
+            include: List[str] = Query(None, alias="include"),
         ):
-            result: BulkDTO = await repository.get_all(
-                page=page, limit=limit, columns=columns, sort=sort, where=where
-            )
-            meta = {
-                "page": result.page,
-                "limit": result.limit,
-                "pages": result.total_pages,
-                "records": result.total_records,
-            }
+            include = ParseInclude(include, relations)
+            try:
+                result: BulkDTO = await repository.get_all(
+                    page=page,
+                    limit=limit,
+                    columns=columns,
+                    sort=sort,
+                    where=where,
+                    after=after,
+                    count=count,
+                    # included records change on their own, so they can't be versioned
+                    _conditional=ConditionalRequest(request, LinksVariant(links))
+                    if conditional_requests and len(include) == 0
+                    else None,
+                )
+            except InvalidCursor as e:
+                raise HTTPException(status_code=400, detail=f"{e}")
+            except NotModified as e:
+                return NotModifiedResponse(e.etag, e.last_modified)
+            if result.etag != None:
+                response.headers.update(
+                    VersionHeaders(result.etag, result.last_modified)
+                )
+            meta = BuildMeta(result=result, meta_schema=meta_schema)
+            included = None
+            if len(include) > 0:
+                included = await LoadIncluded(
+                    request=request,
+                    response=response,
+                    repository=repository,
+                    relations=relations,
+                    include=include,
+                    ids=[row._mapping[repository.primary_key] for row in result.data],
+                    links=links,
+                )
+            # resources with fast_serialization skip the response model
+            if fast_serialization:
+                return row_encoder.response(
+                    rows=result.data,
+                    meta=meta,
+                    response=response,
+                    links=links,
+                    included=included,
+                )
             return many_schema(
-                meta=meta_schema(**meta),
-                data=result.data,
+                meta=meta, data=result.data, with_links=links, included=included
             )
 
     # Add relationship link endpoints starting here...
@@ -500,6 +957,7 @@ def ControllerCongifurator(
                 meta_schema=meta_schema,
                 policies_universal=policies_universal,
                 policies_get_one=policies_get_one,
+                conditional_requests=conditional_requests,
             )
         elif config.orm_relationship.direction == MANYTOMANY:
             _ControllerConfigManyToMany(
@@ -511,6 +969,7 @@ def ControllerCongifurator(
                 meta_schema=meta_schema,
                 policies_universal=policies_universal,
                 policies_get_one=policies_get_one,
+                conditional_requests=conditional_requests,
             )
             # print("To Implement: Many to Many Through Association Object")
         elif config.orm_relationship.direction == MANYTOONE:
@@ -522,6 +981,22 @@ def ControllerCongifurator(
                 config=config,
                 policies_universal=policies_universal,
                 policies_get_one=policies_get_one,
+                conditional_requests=conditional_requests,
+            )
+
+        # Incremental link writes, skipped for read only and protected relationships
+        if (
+            config.orm_relationship.direction == ONETOMANY
+            or config.orm_relationship.direction == MANYTOMANY
+        ) and not (disable_update or key in protected_relationships):
+            _ControllerConfigRelationWrites(
+                controller=controller,
+                repository=repository,
+                id_type=id_type,
+                relationship_prop=key,
+                config=config,
+                policies_universal=policies_universal,
+                policies_update=policies_update,
             )
 
     return controller
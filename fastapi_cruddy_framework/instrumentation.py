@@ -0,0 +1,223 @@
+import json
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+from logging import getLogger
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from typing import Union, List, Dict, Tuple, Any, Callable, Deque
+
+LOGGER = getLogger(__name__)
+
+# Upper bounds (in milliseconds) of the histogram buckets, the last bucket is unbounded
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+START_TIMES_KEY = "cruddy_query_start"
+UNATTRIBUTED = "unattributed"
+SLOW_STATEMENT_MAX_LENGTH = 2000
+
+# The (resource, method) of the repository call running in the current context
+_query_origin: ContextVar[Union[Tuple[str, str], None]] = ContextVar(
+    "cruddy_query_origin", default=None
+)
+
+
+# -------------------------------------------------------------------------------------------
+# QUERY ORIGINS
+# -------------------------------------------------------------------------------------------
+# Tags the SQL run by a repository method with the method and resource (model) names. The
+# outermost call wins, so SQL run by helper methods is reported under the public method
+# that invoked them.
+def track_origin(method: Callable):
+    @wraps(method)
+    async def tracked(self, *args, **kwargs):
+        if _query_origin.get() != None:
+            return await method(self, *args, **kwargs)
+        token = _query_origin.set((self.model.__name__, method.__name__))
+        try:
+            return await method(self, *args, **kwargs)
+        finally:
+            _query_origin.reset(token)
+
+    return tracked
+
+
+# -------------------------------------------------------------------------------------------
+# QUERY STATS
+# -------------------------------------------------------------------------------------------
+# Lifetime totals, plus a rolling window of the most recent statement durations that the
+# percentiles and histogram are computed from.
+class QueryStats:
+    count: int = 0
+    errors: int = 0
+    rows: int = 0
+    total_ms: float = 0
+    max_ms: float = 0
+
+    def __init__(self, sample_size: int = 1000):
+        self.count = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0
+        self.max_ms = 0
+        self.samples: Deque[float] = deque(maxlen=sample_size)
+
+    def record(self, duration_ms: float, rows: Union[int, None], error: bool):
+        self.count += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.samples.append(duration_ms)
+        if error:
+            self.errors += 1
+        if rows != None:
+            self.rows += rows
+
+    def snapshot(self) -> Dict[str, Any]:
+        samples = sorted(self.samples)
+        histogram = {}
+        index = 0
+        for bound in HISTOGRAM_BOUNDS_MS:
+            start = index
+            while index < len(samples) and samples[index] <= bound:
+                index += 1
+            histogram[f"le_{bound}ms"] = index - start
+        histogram["inf"] = len(samples) - index
+
+        def percentile(p: float) -> Union[float, None]:
+            if len(samples) == 0:
+                return None
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 3)
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.count, 3) if self.count else None,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "window": len(samples),
+            "histogram": histogram,
+        }
+
+
+# -------------------------------------------------------------------------------------------
+# SQL INSTRUMENTATION
+# -------------------------------------------------------------------------------------------
+# Times every statement an engine executes through SQLAlchemy's cursor events. Stats are
+# kept in total, per "Resource.method" origin and per engine ("primary", "replica0"...).
+# Statements slower than slow_query_ms are logged as JSON to the
+# "fastapi_cruddy_framework.instrumentation" logger, and the most recent of them are
+# kept for slow_queries(). Bind parameters are never logged or stored.
+class SqlInstrumentation:
+    slow_query_ms: float = 500
+    sample_size: int = 1000
+
+    def __init__(
+        self,
+        slow_query_ms: float = 500,
+        sample_size: int = 1000,
+        max_slow_queries: int = 100,
+    ):
+        self.slow_query_ms = slow_query_ms
+        self.sample_size = sample_size
+        self._slow_queries: Deque[Dict[str, Any]] = deque(maxlen=max_slow_queries)
+        self.reset()
+
+    def attach(self, engine: AsyncEngine = ..., role: str = "primary"):
+        sync_engine = engine.sync_engine
+
+        def before_cursor_execute(conn, cursor, statement, params, context, many):
+            conn.info.setdefault(START_TIMES_KEY, []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, params, context, many):
+            started = conn.info[START_TIMES_KEY].pop()
+            self.record(
+                role=role,
+                statement=statement,
+                started=started,
+                rows=self.row_count(cursor),
+                many=many,
+                error=False,
+            )
+
+        def handle_error(exception_context):
+            conn = exception_context.connection
+            if conn is None or len(conn.info.get(START_TIMES_KEY, [])) == 0:
+                return
+            self.record(
+                role=role,
+                statement=exception_context.statement,
+                started=conn.info[START_TIMES_KEY].pop(),
+                rows=None,
+                many=False,
+                error=True,
+            )
+
+        event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(sync_engine, "handle_error", handle_error)
+
+    # Rows written by DML, or rows returned by a query. The async drivers' cursor adapters
+    # buffer the whole result as soon as the statement runs, so it can be measured here.
+    @staticmethod
+    def row_count(cursor) -> Union[int, None]:
+        if cursor.description is None:
+            return cursor.rowcount if cursor.rowcount >= 0 else None
+        buffered = getattr(cursor, "_rows", None)
+        return len(buffered) if buffered != None else None
+
+    def record(
+        self,
+        role: str = ...,
+        statement: Union[str, None] = ...,
+        started: float = ...,
+        rows: Union[int, None] = ...,
+        many: bool = ...,
+        error: bool = ...,
+    ):
+        duration_ms = (time.perf_counter() - started) * 1000
+        origin = _query_origin.get()
+        origin_key = f"{origin[0]}.{origin[1]}" if origin != None else UNATTRIBUTED
+        for stats, key in (
+            (self._by_origin, origin_key),
+            (self._by_engine, role),
+        ):
+            if key not in stats:
+                stats[key] = QueryStats(sample_size=self.sample_size)
+            stats[key].record(duration_ms, rows, error)
+        self._total.record(duration_ms, rows, error)
+
+        if duration_ms >= self.slow_query_ms:
+            entry = {
+                "engine": role,
+                "resource": origin[0] if origin != None else None,
+                "method": origin[1] if origin != None else None,
+                "duration_ms": round(duration_ms, 3),
+                "rows": rows,
+                "executemany": many,
+                "error": error,
+                "statement": (statement or "")[:SLOW_STATEMENT_MAX_LENGTH],
+            }
+            self._slow_queries.append(entry)
+            LOGGER.warning(
+                f"slow query {json.dumps(entry)}", extra={"cruddy_query": entry}
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "total": self._total.snapshot(),
+            "by_origin": {k: v.snapshot() for k, v in self._by_origin.items()},
+            "by_engine": {k: v.snapshot() for k, v in self._by_engine.items()},
+        }
+
+    def slow_queries(self) -> List[Dict[str, Any]]:
+        return list(self._slow_queries)
+
+    def reset(self):
+        self._total = QueryStats(sample_size=self.sample_size)
+        self._by_origin: Dict[str, QueryStats] = {}
+        self._by_engine: Dict[str, QueryStats] = {}
+        self._slow_queries.clear()
@@ -0,0 +1,234 @@
+from collections import OrderedDict
+from dateutil.parser import parse
+from dateutil.tz import UTC
+from sqlalchemy import bindparam, func
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.schema import Table, Column
+from sqlalchemy.orm import InstrumentedAttribute
+from typing import Union, List, Dict, Tuple, Any, Hashable
+
+BIND_PREFIX = "cruddy_"
+LIMIT_BIND = f"{BIND_PREFIX}limit"
+OFFSET_BIND = f"{BIND_PREFIX}offset"
+ID_BIND = f"{BIND_PREFIX}id"
+WINDOW_COUNT_LABEL = f"{BIND_PREFIX}total_count"
+UPDATED_AT_LABEL = f"{BIND_PREFIX}updated_at"
+CURSOR_LABEL_PREFIX = f"{BIND_PREFIX}cursor"
+
+
+# -------------------------------------------------------------------------------------------
+# QUERY PLANS
+# -------------------------------------------------------------------------------------------
+# A query plan is every statement a list query needs (page, count and windowed page),
+# built once for a query "shape" with bind parameters in place of the client's values.
+# Dashboards tend to send the same where/sort/columns shapes over and over with
+# different values. Reusing a plan skips rebuilding the SQLAlchemy expressions, and
+# because the statement objects are reused, SQLAlchemy's compiled cache is hit without
+# recomputing cache keys.
+class QueryPlan:
+    query: Select = None
+    count_query: Select = None
+    page_query: Select = None
+    sorts: List[Tuple[InstrumentedAttribute, str]] = None
+    filtered: bool = False
+    version_query: Union[Select, None] = None
+    cursor_keys: Union[List[str], None] = None
+    _windowed_query: Union[Select, None] = None
+    _keys: Union[List[str], None] = None
+
+    def __init__(
+        self,
+        query: Select = ...,
+        count_query: Select = ...,
+        page_query: Select = ...,
+        sorts: List[Tuple[InstrumentedAttribute, str]] = ...,
+        filtered: bool = False,
+        version_query: Union[Select, None] = None,
+        cursor_keys: Union[List[str], None] = None,
+    ):
+        self.query = query
+        self.count_query = count_query
+        self.page_query = page_query
+        self.sorts = sorts
+        self.filtered = filtered
+        self.version_query = version_query
+        self.cursor_keys = cursor_keys
+        self._windowed_query = None
+        self._keys = None
+
+    # the page query, with the total count of the filtered query on every row
+    @property
+    def windowed_query(self) -> Select:
+        if self._windowed_query is None:
+            self._windowed_query = self.page_query.add_columns(
+                func.count(1).over().label(WINDOW_COUNT_LABEL)
+            )
+        return self._windowed_query
+
+    # the keys of the page query, without the window count, or the sort values selected
+    # only to build the next cursor
+    @property
+    def keys(self) -> List[str]:
+        if self._keys is None:
+            self._keys = [
+                x
+                for x in self.page_query.selected_columns.keys()
+                if not x.startswith(CURSOR_LABEL_PREFIX)
+            ]
+        return self._keys
+
+    # whether page rows carry columns the client did not ask for
+    @property
+    def hides_columns(self) -> bool:
+        return len(self.keys) < len(self.page_query.selected_columns)
+
+
+class QueryPlanCache:
+    max_size: int = 128
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    def __init__(self, max_size: int = 128):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._plans: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable) -> Union[QueryPlan, None]:
+        plan = self._plans.get(key, None)
+        if plan is None:
+            self.misses += 1
+            return None
+        self._plans.move_to_end(key)
+        self.hits += 1
+        return plan
+
+    def set(self, key: Hashable, plan: QueryPlan):
+        if self.max_size <= 0:
+            return
+        self._plans[key] = plan
+        self._plans.move_to_end(key)
+        while len(self._plans) > self.max_size:
+            self._plans.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._plans.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._plans),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+# -------------------------------------------------------------------------------------------
+# RELATION PLANS
+# -------------------------------------------------------------------------------------------
+# The tables and columns behind a one to many or many to many relationship. Resolving them
+# from the ORM's local_remote_pairs is done once per relationship, when the repository
+# resolves, instead of on every relationship write.
+class RelationPlan:
+    relation: str = None
+    direction: Any = None
+    # the far side of the relationship, and its column relations are validated against
+    foreign_table: Table = None
+    foreign_col: Column = None
+    # many to many only, the join table and its columns
+    join_table: Table = None
+    join_origin_col: Column = None
+    join_foreign_col: Column = None
+    # one to many only, the far table column holding the origin id
+    far_col: Column = None
+
+    def __init__(
+        self,
+        relation: str = ...,
+        direction: Any = ...,
+        foreign_table: Table = ...,
+        foreign_col: Column = ...,
+        join_table: Union[Table, None] = None,
+        join_origin_col: Union[Column, None] = None,
+        join_foreign_col: Union[Column, None] = None,
+        far_col: Union[Column, None] = None,
+    ):
+        self.relation = relation
+        self.direction = direction
+        self.foreign_table = foreign_table
+        self.foreign_col = foreign_col
+        self.join_table = join_table
+        self.join_origin_col = join_origin_col
+        self.join_foreign_col = join_foreign_col
+        self.far_col = far_col
+
+
+# Splits a "where" query object into a template, a hashable shape, and bind values.
+# The template mirrors the where object, but each client value is swapped for a bind
+# parameter, so AbstractRepository.query_forge can build it exactly like the original.
+# Anything that changes the SQL, rather than just a value, stays in the shape:
+# boolean operators, field names, field operators, and null values (which render as
+# IS NULL instead of = ?). Lists sent to field operators, like {"id": {"*in_": [1, 2]}},
+# become "expanding" binds, and {"*datetime": "..."} values are parsed as before.
+# The template is only needed to build a new plan, so build_template=False skips it.
+def where_template(
+    where: Any, op_map: Dict, build_template: bool = True
+) -> Tuple[Any, Hashable, Dict[str, Any]]:
+    values = {}
+
+    def bind(value: Any):
+        name = f"{BIND_PREFIX}w{len(values)}"
+        expanding = isinstance(value, list)
+        if expanding:
+            v_shape = "?[]"
+        elif isinstance(value, dict):
+            value = parse(value["*datetime"], tzinfos=[UTC])
+            v_shape = "?dt"
+        else:
+            v_shape = "?"
+        values[name] = value
+        if not build_template:
+            return None, v_shape
+        return bindparam(name, expanding=expanding), v_shape
+
+    def literal(value: Any):
+        if isinstance(value, (dict, list)):
+            return value, repr(value)
+        return value, (None if value is None else f"!{value!r}")
+
+    def walk(node: Any):
+        if isinstance(node, list):
+            pairs = [walk(x) for x in node]
+            return [p[0] for p in pairs], tuple(p[1] for p in pairs)
+        if not isinstance(node, dict):
+            return literal(node)
+        template = {}
+        shape = []
+        for k, v in node.items():
+            if k in op_map:
+                template[k], v_shape = walk(v)
+            elif isinstance(v, dict):
+                template[k] = {}
+                v_shape = []
+                for k2, v2 in v.items():
+                    if v2 is None or (isinstance(v2, dict) and "*datetime" not in v2):
+                        template[k][k2], v2_shape = literal(v2)
+                    else:
+                        template[k][k2], v2_shape = bind(v2)
+                    v_shape.append((k2, v2_shape))
+                v_shape = tuple(v_shape)
+            elif v is None or isinstance(v, list):
+                template[k], v_shape = literal(v)
+            else:
+                template[k], v_shape = bind(v)
+            shape.append((k, v_shape))
+        return template, tuple(shape)
+
+    if not isinstance(where, (dict, list)):
+        return where, None, values
+    template, shape = walk(where)
+    return template, shape, values
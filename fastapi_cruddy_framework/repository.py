@@ -1,7 +1,12 @@
+import json
 import math
+import time
+from uuid import uuid4
+from datetime import datetime
+from hashlib import blake2b
 from dateutil.parser import parse
 from dateutil.tz import UTC
-from asyncio import gather
+from asyncio import gather, create_task, Task
 from logging import getLogger
 from sqlalchemy import (
     update as _update,
@@ -10,20 +15,67 @@ from sqlalchemy import (
     and_,
     not_,
     func,
+    bindparam,
+    literal,
+    Integer,
 )
-from sqlalchemy.engine import Result
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.sql import select, update
 from sqlalchemy.sql.schema import Table, Column
-from sqlalchemy.orm import RelationshipProperty, ONETOMANY, MANYTOMANY
+from sqlalchemy.orm import (
+    RelationshipProperty,
+    InstrumentedAttribute,
+    ONETOMANY,
+    MANYTOMANY,
+    aliased,
+)
 from sqlmodel import inspect
-from typing import Union, List, Dict
+from typing import (
+    Union,
+    List,
+    Dict,
+    Tuple,
+    Literal,
+    Callable,
+    Awaitable,
+    AsyncIterator,
+)
+from sqlmodel.ext.asyncio.session import AsyncSession
 from pydantic.types import Json
 from .schemas import (
     BulkDTO,
     CruddyModel,
 )
+from .plans import (
+    QueryPlan,
+    QueryPlanCache,
+    RelationPlan,
+    where_template,
+    BIND_PREFIX,
+    LIMIT_BIND,
+    OFFSET_BIND,
+    ID_BIND,
+    WINDOW_COUNT_LABEL,
+    UPDATED_AT_LABEL,
+    CURSOR_LABEL_PREFIX,
+)
+from .instrumentation import track_origin
+from .cache import CacheBackend, LRUCache
 from .adapters import BaseAdapter, SqliteAdapter, MysqlAdapter, PostgresqlAdapter
-from .util import get_pk, possible_id_types, lifecycle_types
+from .util import (
+    get_pk,
+    possible_id_types,
+    lifecycle_types,
+    count_strategy_types,
+    list_execution_types,
+    relation_sync_types,
+    encode_cursor,
+    decode_cursor,
+    InvalidCursor,
+    UnsafeBulkWrite,
+    RelationshipWriteError,
+    NotModified,
+)
 
 UNSUPPORTED_LIKE_COLUMNS = [
     "UUID",
@@ -43,6 +95,14 @@ UNSUPPORTED_LIKE_COLUMNS = [
 ]
 
 
+COUNT_CACHE_MAX_ENTRIES = 1024
+RELATION_CHUNK_SIZE = 500
+KEYSET_BIND_PREFIX = f"{BIND_PREFIX}k"
+ORIGIN_LABEL = f"{BIND_PREFIX}origin"
+# List generations outlive every list cached under them
+LIST_GENERATION_TTL = 86400
+
+
 def exists(something):
     return something != None
 
@@ -60,13 +120,34 @@ class AbstractRepository:
     model: CruddyModel
     id_type: possible_id_types
     primary_key: str = None
+    count_strategy: count_strategy_types = "exact"
+    count_cache_ttl: float = 60
+    list_execution: list_execution_types = "parallel"
+    plan_cache: QueryPlanCache = None
+    bulk_create_chunk_size: int = 1000
+    bulk_write_max_rows: int = 10000
+    export_batch_size: int = 1000
+    relation_sync: relation_sync_types = "diff"
+    relation_plans: Dict[str, RelationPlan] = None
+    related_repositories: Dict[str, "AbstractRepository"] = None
+    record_cache: Union[CacheBackend, None] = None
+    record_cache_ttl: float = 30
+    list_cache: Union[CacheBackend, None] = None
+    list_cache_ttl: float = 5
+    list_cache_stale_ttl: float = 0
     lifecycle: Dict[str, lifecycle_types] = {
         "before_create": None,
         "after_create": None,
+        "before_create_many": None,
+        "after_create_many": None,
         "before_update": None,
         "after_update": None,
+        "before_update_many": None,
+        "after_update_many": None,
         "before_delete": None,
         "after_delete": None,
+        "before_delete_many": None,
+        "after_delete_many": None,
         "before_get_one": None,
         "after_get_one": None,
         "before_get_all": None,
@@ -88,22 +169,84 @@ class AbstractRepository:
         id_type: possible_id_types = int,
         lifecycle_before_create: lifecycle_types = None,
         lifecycle_after_create: lifecycle_types = None,
+        lifecycle_before_create_many: lifecycle_types = None,
+        lifecycle_after_create_many: lifecycle_types = None,
         lifecycle_before_update: lifecycle_types = None,
         lifecycle_after_update: lifecycle_types = None,
+        lifecycle_before_update_many: lifecycle_types = None,
+        lifecycle_after_update_many: lifecycle_types = None,
         lifecycle_before_delete: lifecycle_types = None,
         lifecycle_after_delete: lifecycle_types = None,
+        lifecycle_before_delete_many: lifecycle_types = None,
+        lifecycle_after_delete_many: lifecycle_types = None,
         lifecycle_before_get_one: lifecycle_types = None,
         lifecycle_after_get_one: lifecycle_types = None,
         lifecycle_before_get_all: lifecycle_types = None,
         lifecycle_after_get_all: lifecycle_types = None,
         lifecycle_before_set_relations: lifecycle_types = None,
         lifecycle_after_set_relations: lifecycle_types = None,
+        count_strategy: count_strategy_types = "exact",
+        count_cache_ttl: float = 60,
+        list_execution: list_execution_types = "parallel",
+        query_plan_cache_size: int = 128,
+        bulk_create_chunk_size: int = 1000,
+        bulk_write_max_rows: int = 10000,
+        export_batch_size: int = 1000,
+        relation_sync: relation_sync_types = "diff",
+        record_cache_size: int = 0,
+        record_cache_ttl: float = 30,
+        record_cache: Union[CacheBackend, None] = None,
+        list_cache_size: int = 0,
+        list_cache_ttl: float = 5,
+        list_cache_stale_ttl: float = 0,
+        list_cache: Union[CacheBackend, None] = None,
     ):
         self.adapter = adapter
         self.update_model = update_model
         self.create_model = create_model
         self.model = model
         self.id_type = id_type
+        self.count_strategy = count_strategy
+        self.count_cache_ttl = count_cache_ttl
+        self._count_cache = {}
+        self.list_execution = list_execution
+        self.plan_cache = QueryPlanCache(max_size=query_plan_cache_size)
+        self.bulk_create_chunk_size = bulk_create_chunk_size
+        self.bulk_write_max_rows = bulk_write_max_rows
+        self.export_batch_size = export_batch_size
+        self.relation_sync = relation_sync
+        self.relation_plans = {}
+        self.related_repositories = {}
+        # get_by_id is read through record_cache when a backend is passed in, or when
+        # record_cache_size is set, which builds an in-process LRU
+        self.record_cache_ttl = record_cache_ttl
+        if record_cache != None:
+            self.record_cache = record_cache
+        elif record_cache_size > 0:
+            self.record_cache = LRUCache(
+                max_size=record_cache_size, ttl=record_cache_ttl
+            )
+        else:
+            self.record_cache = None
+        self._record_cache_epoch = 0
+        # get_all and get_all_relations results are cached the same way, and entries may
+        # be served for list_cache_stale_ttl more seconds while they are refreshed
+        self.list_cache_ttl = list_cache_ttl
+        self.list_cache_stale_ttl = list_cache_stale_ttl
+        if list_cache != None:
+            self.list_cache = list_cache
+        elif list_cache_size > 0:
+            self.list_cache = LRUCache(
+                max_size=list_cache_size, ttl=list_cache_ttl + list_cache_stale_ttl
+            )
+        else:
+            self.list_cache = None
+        # list generations are kept in these backends: this repository's list cache,
+        # and the list caches of repositories whose relationship lists hold its records
+        self._generation_caches: List[CacheBackend] = (
+            [self.list_cache] if self.list_cache != None else []
+        )
+        self._list_refreshes: Dict[str, Task] = {}
         self.op_map = {
             "*and": and_,
             "*or": or_,
@@ -112,10 +255,16 @@ class AbstractRepository:
         self.lifecycle = {
             "before_create": lifecycle_before_create,
             "after_create": lifecycle_after_create,
+            "before_create_many": lifecycle_before_create_many,
+            "after_create_many": lifecycle_after_create_many,
             "before_update": lifecycle_before_update,
             "after_update": lifecycle_after_update,
+            "before_update_many": lifecycle_before_update_many,
+            "after_update_many": lifecycle_after_update_many,
             "before_delete": lifecycle_before_delete,
             "after_delete": lifecycle_after_delete,
+            "before_delete_many": lifecycle_before_delete_many,
+            "after_delete_many": lifecycle_after_delete_many,
             "before_get_one": lifecycle_before_get_one,
             "after_get_one": lifecycle_after_get_one,
             "before_get_all": lifecycle_before_get_all,
@@ -124,34 +273,318 @@ class AbstractRepository:
             "after_set_relations": lifecycle_after_set_relations,
         }
 
-    def resolve(self):
+    # related_repositories maps relationship names to the repositories of the far side,
+    # so relationship writes can invalidate the records they change over there
+    def resolve(self, related_repositories: Dict[str, "AbstractRepository"] = {}):
         # Can't do this until all models are defined, otherwise mappers break
         self.primary_key = get_pk(self.model)
+        self.related_repositories = related_repositories
+        # relationship lists are cached under the far side's generation too
+        if self.list_cache != None:
+            for related in related_repositories.values():
+                if not any(x is self.list_cache for x in related._generation_caches):
+                    related._generation_caches.append(self.list_cache)
+        self.relation_plans = {}
+        for relation in inspect(self.model).relationships:
+            if relation.direction == MANYTOMANY or relation.direction == ONETOMANY:
+                self.relation_plan(relation=relation.key)
 
-    async def create(self, data: CruddyModel) -> CruddyModel:
+    # create and update accept an optional {relation name: [ids]} dict. The record and
+    # its relationships are then written as one unit of work: one connection, one
+    # transaction, and nothing is left half-linked if a relationship write fails.
+    @track_origin
+    async def create(
+        self,
+        data: CruddyModel,
+        relations: Union[Dict[str, List[possible_id_types]], None] = None,
+    ) -> CruddyModel:
         # create user data
+        relation_results = []
         async with self.adapter.getSession() as session:
             record = self.model(**data.dict())
             if exists(self.lifecycle["before_create"]):
                 await self.lifecycle["before_create"](record)
             session.add(record)
+            if relations:
+                # the record must exist before anything can link to it
+                await session.flush()
+                relation_results = await self.write_relations(
+                    session=session,
+                    id=getattr(record, self.primary_key),
+                    relations=relations,
+                )
+        await self.mark_written()
         if exists(self.lifecycle["after_create"]):
             await self.lifecycle["after_create"](record)
+        await self.after_set_relations(relation_results)
         return record
         # return a value?
 
-    async def get_by_id(self, id: possible_id_types):
-        # retrieve user data by id
-        query = select(self.model).where(getattr(self.model, self.primary_key) == id)
+    # Creates many records in one transaction. Records with their primary key already
+    # set (like uuid7 keys) are written with chunked executemany INSERTs; records that
+    # need the database to generate a key fall back to the ORM, still in one transaction.
+    # relations is an optional list, parallel to data, of {relation name: [ids]} dicts.
+    # The batch hooks receive the whole list of records. If they are not set, the single
+    # record create hooks still run for each record.
+    @track_origin
+    async def create_many(
+        self,
+        data: List[CruddyModel],
+        relations: Union[List[Dict[str, List[possible_id_types]]], None] = None,
+    ) -> List[CruddyModel]:
+        records = [self.model(**x.dict()) for x in data]
+        if len(records) == 0:
+            return records
+
+        if exists(self.lifecycle["before_create_many"]):
+            await self.lifecycle["before_create_many"](records)
+        elif exists(self.lifecycle["before_create"]):
+            for record in records:
+                await self.lifecycle["before_create"](record)
+
+        table: Table = self.model.__table__
+        # Like the ORM, None values are left out for columns with a default or server
+        # default, so the database fills them in. Rows are grouped by the columns they
+        # set, as every row of an executemany INSERT must set the same columns.
+        defaulted = {
+            col.key
+            for col in table.columns
+            if col.default != None or col.server_default != None
+        }
+        groups: Dict[Tuple[str, ...], List[Dict]] = {}
+        for record in records:
+            row = {}
+            for col in table.columns:
+                value = getattr(record, col.key)
+                if value is None and col.key in defaulted:
+                    continue
+                row[col.key] = value
+            groups.setdefault(tuple(row.keys()), []).append(row)
+        relation_results = []
         async with self.adapter.getSession() as session:
-            if exists(self.lifecycle["before_get_one"]):
-                await self.lifecycle["before_get_one"](id)
-            result = (await session.execute(query)).scalar_one_or_none()
+            if all(getattr(x, self.primary_key) != None for x in records):
+                insert_query = table.insert()
+                for rows in groups.values():
+                    for i in range(0, len(rows), self.bulk_create_chunk_size):
+                        await session.execute(
+                            insert_query, rows[i : i + self.bulk_create_chunk_size]
+                        )
+            else:
+                session.add_all(records)
+                await session.flush()
+            if relations != None:
+                try:
+                    relation_results = await self.create_many_relations(
+                        session=session, records=records, relations=relations
+                    )
+                except SQLAlchemyError as e:
+                    raise RelationshipWriteError(
+                        f"Unable to set relationships: {e.__class__.__name__}"
+                    ) from e
+        await self.mark_written()
+
+        await self.after_set_relations(relation_results)
+        if exists(self.lifecycle["after_create_many"]):
+            await self.lifecycle["after_create_many"](records)
+        elif exists(self.lifecycle["after_create"]):
+            for record in records:
+                await self.lifecycle["after_create"](record)
+        return records
+
+    # Applies the relationship id lists of freshly created records within the creating
+    # session. Each relationship is validated with one query across every record, and
+    # many to many links are written with a single executemany INSERT. The usual
+    # set_relations hooks still see one relation_conf per record and relationship.
+    async def create_many_relations(
+        self,
+        session: AsyncSession = ...,
+        records: List[CruddyModel] = ...,
+        relations: List[Dict[str, List[possible_id_types]]] = ...,
+    ) -> List[Dict]:
+        relation_confs: Dict[str, List[Dict]] = {}
+        for record, record_relations in zip(records, relations):
+            for relation, relation_ids in record_relations.items():
+                relation_conf = {
+                    "id": getattr(record, self.primary_key),
+                    "relation": relation,
+                    "relations": relation_ids,
+                    "action": "set",
+                }
+                if exists(self.lifecycle["before_set_relations"]):
+                    await self.lifecycle["before_set_relations"](relation_conf)
+                relation_confs.setdefault(relation, []).append(relation_conf)
+
+        results = []
+        for relation, confs in relation_confs.items():
+            plan = self.relation_plan(relation=relation)
+            all_ids = list({x for conf in confs for x in conf["relations"]})
+            if plan.direction == MANYTOMANY:
+                db_ids = await self.existing_ids(
+                    session=session, column=plan.foreign_col, ids=all_ids
+                )
+                insertable = []
+                for conf in confs:
+                    linked = {f"{x}" for x in conf["relations"]} & db_ids.keys()
+                    results.append(
+                        {
+                            "model": self.model,
+                            "relation_conf": conf,
+                            "relation_type": MANYTOMANY,
+                            "related_table": plan.foreign_table,
+                            "related_field": plan.foreign_col.name,
+                            "updated_db_count": len(linked),
+                        }
+                    )
+                    for key in linked:
+                        insertable.append(
+                            {
+                                plan.join_origin_col.key: conf["id"],
+                                plan.join_foreign_col.key: db_ids[key],
+                            }
+                        )
+                for i in range(0, len(insertable), RELATION_CHUNK_SIZE):
+                    await session.execute(
+                        plan.join_table.insert(),
+                        insertable[i : i + RELATION_CHUNK_SIZE],
+                    )
+            elif plan.direction == ONETOMANY:
+                for conf in confs:
+                    updated = 0
+                    if len(conf["relations"]) > 0:
+                        alter_query = (
+                            update(table=plan.foreign_table)
+                            .values({plan.far_col.key: conf["id"]})
+                            .where(plan.foreign_col.in_(conf["relations"]))
+                        )
+                        updated = (await session.execute(alter_query)).rowcount
+                    results.append(
+                        {
+                            "model": self.model,
+                            "relation_conf": conf,
+                            "relation_type": ONETOMANY,
+                            "related_table": plan.foreign_table,
+                            "related_field": plan.far_col.key,
+                            "updated_db_count": updated,
+                        }
+                    )
+        return results
+
+    # With columns, only those columns (and the primary key) are selected, and the record
+    # is returned as a plain dict of them rather than a model instance. Projections are
+    # served from cached records, but never cached themselves.
+    @track_origin
+    async def get_by_id(
+        self, id: possible_id_types, columns: Union[List[str], None] = None
+    ):
+        # retrieve user data by id
+        if exists(self.lifecycle["before_get_one"]):
+            await self.lifecycle["before_get_one"](id)
+        projection = None
+        if columns != None and len(columns) > 0:
+            projection = list(columns)
+            if self.primary_key not in projection:
+                projection.append(self.primary_key)
+        query = self.select_by_id(id=id, columns=projection)
+        result = None
+        # a shared session holding uncommitted writes neither reads nor fills the cache
+        use_cache = (
+            self.record_cache != None and not self.adapter.shared_session_wrote()
+        )
+        if use_cache:
+            cached = await self.record_cache.get(self.record_cache_key(id))
+            if cached != None and projection != None:
+                result = {k: cached[k] for k in projection}
+            elif cached != None:
+                result = self.model(**cached)
+        if result is None and projection != None:
+            async with self.adapter.getSession(read_only=True) as session:
+                row = (await session.execute(query)).one_or_none()
+            result = dict(row._mapping) if row != None else None
+        elif result is None:
+            epoch = self._record_cache_epoch
+            async with self.adapter.getSession(read_only=True) as session:
+                result = (await session.execute(query)).scalar_one_or_none()
+            # a write that finished while the query ran may have made result stale
+            if use_cache and result != None and epoch == self._record_cache_epoch:
+                await self.record_cache.set(
+                    self.record_cache_key(id),
+                    self.record_values(result),
+                    self.record_cache_ttl,
+                )
         if exists(self.lifecycle["after_get_one"]):
             await self.lifecycle["after_get_one"](result)
         return result
 
-    async def update(self, id: possible_id_types, data: CruddyModel):
+    def record_cache_key(self, id: possible_id_types) -> str:
+        return f"{self.model.__name__}:{id}"
+
+    def record_values(self, record: CruddyModel) -> Dict:
+        return {
+            attr.key: getattr(record, attr.key)
+            for attr in inspect(self.model).column_attrs
+        }
+
+    # Drops the given ids from the record cache, or every record of this resource when
+    # ids is None
+    async def invalidate_records(
+        self, ids: Union[List[possible_id_types], None] = None
+    ):
+        if self.record_cache is None:
+            return
+        await self.drop_records(ids)
+        # a shared session commits later, and reads outside it may cache the records
+        # it replaced until then
+        self.adapter.after_commit(lambda: self.drop_records(ids))
+
+    async def drop_records(self, ids: Union[List[possible_id_types], None] = None):
+        self._record_cache_epoch += 1
+        if ids is None:
+            await self.record_cache.clear(prefix=f"{self.model.__name__}:")
+            return
+        for id in ids:
+            await self.record_cache.delete(self.record_cache_key(id))
+
+    # Every write path calls this once its transaction has committed. Cached counts are
+    # dropped, and the new generation retires every cached list result of the resource,
+    # since list cache keys carry the generation they were read at. Generations are kept
+    # in the cache backends themselves, so a shared backend retires the lists of every
+    # process using it.
+    async def mark_written(self):
+        await self.new_generation()
+        # a shared session commits later, and reads outside it may cache the lists it
+        # replaced until then
+        self.adapter.after_commit(self.new_generation)
+
+    async def new_generation(self):
+        self._count_cache.clear()
+        for cache in self._generation_caches:
+            await cache.set(
+                self.list_generation_key(), uuid4().hex, LIST_GENERATION_TTL
+            )
+
+    def list_generation_key(self) -> str:
+        return f"{self.model.__name__}:list:generation"
+
+    # The generation of this resource's records, as kept in a list cache backend. A
+    # missing one (never written, evicted or expired) is replaced with a new one, so no
+    # list cached before it went missing can be served.
+    async def list_generation(self, cache: CacheBackend = ...) -> str:
+        generation = await cache.get(self.list_generation_key())
+        if generation is None:
+            generation = uuid4().hex
+            await cache.set(self.list_generation_key(), generation, LIST_GENERATION_TTL)
+        return generation
+
+    # Single record writes run in one transaction on one connection. Where the adapter
+    # supports RETURNING, the written row comes back from the write statement itself.
+    # Otherwise the row is read with a second statement in the same transaction.
+    @track_origin
+    async def update(
+        self,
+        id: possible_id_types,
+        data: CruddyModel,
+        relations: Union[Dict[str, List[possible_id_types]], None] = None,
+    ):
         # update user data
         values = data.dict()
         if exists(self.lifecycle["before_update"]):
@@ -160,38 +593,164 @@ class AbstractRepository:
             _update(self.model)
             .where(getattr(self.model, self.primary_key) == id)
             .values(**values)
-            .execution_options(synchronize_session="fetch")
+            .execution_options(synchronize_session=False)
         )
+        updated_record = None
+        relation_results = []
         async with self.adapter.getSession() as session:
-            result = await session.execute(query)
-        if result.rowcount == 1:
-            updated_record = await self.get_by_id(id=id)
+            if self.adapter.supports_returning():
+                query = query.returning(*self.model.__table__.columns)
+                row = (await session.execute(query)).first()
+                if row != None:
+                    updated_record = self.model(**row._mapping)
+            elif (await session.execute(query)).rowcount == 1:
+                updated_record = (
+                    await session.execute(self.select_by_id(id=id))
+                ).scalar_one_or_none()
+            if updated_record != None and relations:
+                relation_results = await self.write_relations(
+                    session=session, id=id, relations=relations
+                )
+        await self.mark_written()
+        await self.invalidate_records([id])
+        if updated_record != None:
             if exists(self.lifecycle["after_update"]):
                 await self.lifecycle["after_update"](updated_record)
+            await self.after_set_relations(relation_results)
             return updated_record
         return None
         # return a value?
 
+    @track_origin
     async def delete(self, id: possible_id_types):
         # delete user data by id
-        record = await self.get_by_id(id=id)
-        if exists(self.lifecycle["before_delete"]):
-            await self.lifecycle["before_delete"](record)
         query = (
             _delete(self.model)
             .where(getattr(self.model, self.primary_key) == id)
-            .execution_options(synchronize_session="fetch")
+            .execution_options(synchronize_session=False)
         )
+        record = None
         async with self.adapter.getSession() as session:
-            result = await session.execute(query)
+            # before_delete must see the record before it is gone, so RETURNING only
+            # applies when no hook needs it
+            if self.adapter.supports_returning() and not exists(
+                self.lifecycle["before_delete"]
+            ):
+                query = query.returning(*self.model.__table__.columns)
+                row = (await session.execute(query)).first()
+                if row != None:
+                    record = self.model(**row._mapping)
+            else:
+                record = (
+                    await session.execute(self.select_by_id(id=id))
+                ).scalar_one_or_none()
+                if exists(self.lifecycle["before_delete"]):
+                    await self.lifecycle["before_delete"](record)
+                if (await session.execute(query)).rowcount != 1:
+                    record = None
+        await self.mark_written()
+        await self.invalidate_records([id])
 
-        if result.rowcount == 1:
+        if record != None:
             if exists(self.lifecycle["after_delete"]):
                 await self.lifecycle["after_delete"](record)
             return record
         return None
         # return a value?
 
+    def select_by_id(
+        self, id: possible_id_types, columns: Union[List[str], None] = None
+    ):
+        query = (
+            select(*[getattr(self.model, x) for x in columns])
+            if columns != None
+            else select(self.model)
+        )
+        return query.where(getattr(self.model, self.primary_key) == id)
+
+    # Updates every record matched by a "where" query object in a single UPDATE statement,
+    # and returns the number of affected rows. A where clause that filters nothing, or an
+    # update touching more than bulk_write_max_rows rows, raises UnsafeBulkWrite and rolls
+    # the transaction back. Per record update hooks are not invoked, only the batch hooks.
+    @track_origin
+    async def update_many(self, where: Json = ..., data: Dict = ...) -> int:
+        query_conf = {"where": where, "values": data}
+        if exists(self.lifecycle["before_update_many"]):
+            await self.lifecycle["before_update_many"](query_conf)
+        if len(query_conf["values"]) == 0:
+            raise UnsafeBulkWrite("A bulk update requires at least one value to set")
+        criteria = self.bulk_write_criteria(where=query_conf["where"])
+        query = (
+            _update(self.model)
+            .where(and_(*criteria))
+            .values(**query_conf["values"])
+            .execution_options(synchronize_session=False)
+        )
+        async with self.adapter.getSession() as session:
+            affected = self.check_bulk_write((await session.execute(query)).rowcount)
+        await self.mark_written()
+        await self.invalidate_records()
+        if exists(self.lifecycle["after_update_many"]):
+            await self.lifecycle["after_update_many"](
+                {**query_conf, "affected": affected}
+            )
+        return affected
+
+    # Deletes every record matched by a "where" query object in a single DELETE statement,
+    # with the same safety rules as update_many.
+    @track_origin
+    async def delete_many(self, where: Json = ...) -> int:
+        query_conf = {"where": where}
+        if exists(self.lifecycle["before_delete_many"]):
+            await self.lifecycle["before_delete_many"](query_conf)
+        criteria = self.bulk_write_criteria(where=query_conf["where"])
+        query = (
+            _delete(self.model)
+            .where(and_(*criteria))
+            .execution_options(synchronize_session=False)
+        )
+        async with self.adapter.getSession() as session:
+            affected = self.check_bulk_write((await session.execute(query)).rowcount)
+        await self.mark_written()
+        await self.invalidate_records()
+        if exists(self.lifecycle["after_delete_many"]):
+            await self.lifecycle["after_delete_many"](
+                {**query_conf, "affected": affected}
+            )
+        return affected
+
+    def bulk_write_criteria(self, where: Json = ...) -> List:
+        criteria = self.query_forge(model=self.model, where=where)
+        if len(criteria) == 0 or not self.filters_field(where=where):
+            raise UnsafeBulkWrite(
+                "A bulk write requires a where query that filters on at least one field"
+            )
+        return criteria
+
+    # Empty boolean operators, like {"*or": []}, build criteria that filter nothing, so
+    # a where query only counts if one of its field comparisons builds a criterion
+    def filters_field(self, where: Union[Dict, List[Dict]] = ...) -> bool:
+        if isinstance(where, list):
+            return any(self.filters_field(where=x) for x in where)
+        if not isinstance(where, dict):
+            return False
+        for k, v in where.items():
+            if k in self.op_map:
+                if self.filters_field(where=v):
+                    return True
+            elif len(self.query_forge(model=self.model, where={k: v})) > 0:
+                return True
+        return False
+
+    # Raising here, inside the session, rolls the write back
+    def check_bulk_write(self, affected: int) -> int:
+        if affected > self.bulk_write_max_rows:
+            raise UnsafeBulkWrite(
+                f"The bulk write would affect {affected} records, the limit is {self.bulk_write_max_rows}"
+            )
+        return affected
+
+    @track_origin
     async def get_all(
         self,
         page: int = 1,
@@ -199,10 +758,13 @@ class AbstractRepository:
         columns: List[str] = None,
         sort: List[str] = None,
         where: Json = None,
+        after: Union[str, None] = None,
+        count: Union[count_strategy_types, None] = None,
         # possible lifecycle hooks from foreign resource
         _lifecycle_before: lifecycle_types = None,
         _lifecycle_after: lifecycle_types = None,
         _use_own_hooks: bool = True,
+        _conditional: Union[Dict, None] = None,
     ) -> BulkDTO:
         query_conf = {
             "page": page,
@@ -210,6 +772,8 @@ class AbstractRepository:
             "columns": columns,
             "sort": sort,
             "where": where,
+            "after": after,
+            "count": count if count != None else self.count_strategy,
         }
 
         if _use_own_hooks:
@@ -226,75 +790,41 @@ class AbstractRepository:
             # this query
             await lifecycle_before(query_conf)
 
-        get_columns: List[str] = (
-            query_conf["columns"]
-            if query_conf["columns"] is not None and query_conf["columns"] != []
-            else list(self.model.__fields__.keys())
-        )
-        if self.primary_key not in get_columns:
-            get_columns.append(self.primary_key)
-
-        select_items = list(map(lambda x: getattr(self.model, x), get_columns))
-        query = select(*select_items)
-
-        if isinstance(query_conf["where"], dict) or isinstance(
-            query_conf["where"], list
-        ):
-            query = query.filter(
-                and_(*self.query_forge(model=self.model, where=query_conf["where"]))
+        version = None
+        if _conditional != None:
+            plan, params = self.list_plan(
+                model=self.model, primary_key=self.primary_key, query_conf=query_conf
+            )
+            version = await self.list_version(
+                plan=plan,
+                params=params,
+                query_conf=query_conf,
+                conditional=_conditional,
             )
 
-        # select sort dynamically
-        if query_conf["sort"] is not None and query_conf["sort"] != []:
-            # we need sort format data like this --> ['id asc','name desc', 'email']
-            def splitter(sort_string: str):
-                parts = sort_string.split(" ")
-                getter = "asc"
-                if len(parts) == 2:
-                    getter = parts[1]
-                return getattr(getattr(self.model, parts[0]), getter)
-
-            sorts = list(map(splitter, query_conf["sort"]))
-            for field in sorts:
-                query = query.order_by(field())
-
-        # count query
-        count_query = select(func.count(1)).select_from(query)
-        offset_page = query_conf["page"] - 1
-        # pagination
-        query = query.offset(offset_page * query_conf["limit"]).limit(
-            query_conf["limit"]
-        )
-        # total record
-
-        async with self.adapter.getSession() as session1:
-            async with self.adapter.getSession() as session2:
-                results = await gather(
-                    session1.execute(count_query),
-                    session2.execute(query),
-                    return_exceptions=False,
-                )
-                count: Result = results[0]
-                records: Result = results[1]
-                total_record = count.scalar() or 0
-                result = records.fetchall()
+        async def fetch() -> BulkDTO:
+            plan, params = self.list_plan(
+                model=self.model, primary_key=self.primary_key, query_conf=query_conf
+            )
+            return await self.fetch_page(
+                plan=plan,
+                params=params,
+                query_conf=query_conf,
+                count_table=self.model.__table__,
+            )
 
-        # possible pass in outside functions to map/alter data?
-        # total page
-        total_page = math.ceil(total_record / query_conf["limit"])
-        result = BulkDTO(
-            total_pages=total_page,
-            total_records=total_record,
-            page=query_conf["page"],
-            limit=query_conf["limit"],
-            data=result,
+        result = await self.cached_list(
+            key=await self.list_cache_key(query_conf=query_conf), fetch=fetch
         )
+        if version != None:
+            result.etag, result.last_modified = version
 
         if exists(lifecycle_after):
             await lifecycle_after(result)
 
         return result
 
+    @track_origin
     async def get_all_relations(
         self,
         id: possible_id_types = ...,
@@ -305,9 +835,12 @@ class AbstractRepository:
         columns: List[str] = None,
         sort: List[str] = None,
         where: Json = None,
+        after: Union[str, None] = None,
+        count: Union[count_strategy_types, None] = None,
         # the foreign repository's lifecycle hooks must be injected
         _lifecycle_before: lifecycle_types = None,
         _lifecycle_after: lifecycle_types = None,
+        _conditional: Union[Dict, None] = None,
     ) -> BulkDTO:
         # The related id column is mandatory or the join will explode
         relation_pk = get_pk(relation_model)
@@ -318,268 +851,1217 @@ class AbstractRepository:
             "columns": columns,
             "sort": sort,
             "where": where,
+            "after": after,
+            "count": count if count != None else self.count_strategy,
         }
 
         if exists(_lifecycle_before):
             await _lifecycle_before(query_conf)
 
-        get_columns: List[str] = (
-            query_conf["columns"]
+        # the listed records belong to the far side, so without its repository there
+        # is no generation to tell when their links change
+        related = self.related_repositories.get(relation, None)
+
+        version = None
+        if _conditional != None:
+            plan, params = self.list_plan(
+                model=relation_model,
+                primary_key=relation_pk,
+                query_conf=query_conf,
+                relation=relation,
+            )
+            params[ID_BIND] = id
+            version = await self.list_version(
+                plan=plan,
+                params=params,
+                query_conf=query_conf,
+                conditional=_conditional,
+            )
+
+        async def fetch() -> BulkDTO:
+            plan, params = self.list_plan(
+                model=relation_model,
+                primary_key=relation_pk,
+                query_conf=query_conf,
+                relation=relation,
+            )
+            params[ID_BIND] = id
+            return await self.fetch_page(
+                plan=plan,
+                params=params,
+                query_conf=query_conf,
+                count_key=f"{relation}:{id}",
+            )
+
+        key = None
+        if related != None:
+            key = await self.list_cache_key(
+                query_conf=query_conf,
+                relation=relation,
+                id=id,
+                related=related,
+            )
+        result = await self.cached_list(key=key, fetch=fetch)
+        if version != None:
+            result.etag, result.last_modified = version
+
+        if exists(_lifecycle_after):
+            await _lifecycle_after(result)
+
+        return result
+
+    # Resolves a many to one relationship in a single query, outer joined from the origin
+    # record so a missing origin and an empty relationship can be told apart: None when
+    # the origin record does not exist, otherwise the origin's foreign key value and the
+    # related record (None when there is none). The related record is a model instance,
+    # or a dict of the selected columns (and primary key) when columns are given.
+    @track_origin
+    async def get_one_relation(
+        self,
+        id: possible_id_types = ...,
+        relation: str = ...,
+        relation_model: CruddyModel = ...,
+        columns: Union[List[str], None] = None,
+    ) -> Union[Tuple[possible_id_types, Union[CruddyModel, Dict, None]], None]:
+        relation_pk = get_pk(relation_model)
+        projection = None
+        if columns != None and len(columns) > 0:
+            projection = list(columns)
+            if relation_pk not in projection:
+                projection.append(relation_pk)
+        get_columns = (
+            projection
+            if projection != None
+            else [attr.key for attr in inspect(relation_model).column_attrs]
+        )
+        relationship = getattr(self.model, relation)
+        local_col: Column = next(iter(relationship.property.local_columns))
+        # the far side is aliased, so a relationship may point back at its own model
+        target = aliased(relation_model)
+        query = (
+            select(
+                local_col.label(ORIGIN_LABEL),
+                *[getattr(target, x) for x in get_columns],
+            )
+            .select_from(self.model)
+            .outerjoin(relationship.of_type(target))
+            .where(getattr(self.model, self.primary_key) == id)
+        )
+        async with self.adapter.getSession(read_only=True) as session:
+            row = (await session.execute(query)).first()
+        if row is None:
+            return None
+        values = {x: row._mapping[x] for x in get_columns}
+        if values[relation_pk] is None:
+            return row._mapping[ORIGIN_LABEL], None
+        if projection != None:
+            return row._mapping[ORIGIN_LABEL], values
+        return row._mapping[ORIGIN_LABEL], relation_model(**values)
+
+    # Reads the foreign key a record holds for a many to one relationship, as a
+    # (key,) tuple, or None if the record does not exist
+    @track_origin
+    async def get_relation_key(
+        self, id: possible_id_types = ..., relation: str = ...
+    ) -> Union[Tuple[possible_id_types], None]:
+        relationship = getattr(self.model, relation)
+        local_col: Column = next(iter(relationship.property.local_columns))
+        query = select(local_col).where(getattr(self.model, self.primary_key) == id)
+        async with self.adapter.getSession(read_only=True) as session:
+            row = (await session.execute(query)).first()
+        return None if row is None else (row[0],)
+
+    # Checks that a record exists, from the record cache when it holds the record
+    @track_origin
+    async def record_exists(self, id: possible_id_types = ...) -> bool:
+        if self.record_cache != None and not self.adapter.shared_session_wrote():
+            if await self.record_cache.get(self.record_cache_key(id)) != None:
+                return True
+        primary_key = getattr(self.model, self.primary_key)
+        query = select(primary_key).where(primary_key == id)
+        async with self.adapter.getSession(read_only=True) as session:
+            return (await session.execute(query)).first() != None
+
+    # Loads the related records of many records at once, for embedding them in a page
+    # of results: one query per chunk of ids, joined through the relationship, instead
+    # of one relationship query per record. Returns the related rows grouped by the id
+    # of the record they belong to. Every related record is returned, unpaged. The far
+    # side's lifecycle hooks must be injected; the before hook sees a query_conf whose
+    # columns, sort and where it may change, and the after hook sees every row loaded.
+    @track_origin
+    async def get_included(
+        self,
+        ids: List[possible_id_types] = ...,
+        relation: str = ...,
+        relation_model: CruddyModel = ...,
+        _lifecycle_before: lifecycle_types = None,
+        _lifecycle_after: lifecycle_types = None,
+    ) -> Dict[possible_id_types, List]:
+        query_conf = {
+            "page": 1,
+            "limit": None,
+            "columns": None,
+            "sort": None,
+            "where": None,
+            "after": None,
+            "count": "none",
+        }
+        if exists(_lifecycle_before):
+            await _lifecycle_before(query_conf)
+
+        relation_pk = get_pk(relation_model)
+        get_columns = (
+            list(query_conf["columns"])
             if query_conf["columns"] is not None and query_conf["columns"] != []
             else list(relation_model.__fields__.keys())
         )
         if relation_pk not in get_columns:
             get_columns.append(relation_pk)
+        # the far side is aliased, so a relationship may point back at its own model
+        target = aliased(relation_model)
+        origin = getattr(self.model, self.primary_key)
+        query = (
+            select(
+                *[getattr(target, x) for x in get_columns],
+                origin.label(ORIGIN_LABEL),
+            )
+            .select_from(self.model)
+            .join(getattr(self.model, relation).of_type(target))
+        )
+        criteria = self.query_forge(model=target, where=query_conf["where"])
+        if len(criteria) > 0:
+            query = query.filter(and_(*criteria))
+        sorts = self.keyset_sort(
+            model=target,
+            primary_key=relation_pk,
+            sorts=self.sort_forge(model=target, sort=query_conf["sort"]),
+        )
+        for attr, direction in sorts:
+            query = query.order_by(getattr(attr, direction)())
 
-        select_items = list(map(lambda x: getattr(relation_model, x), get_columns))
+        rows = []
+        async with self.adapter.getSession(read_only=True) as session:
+            for i in range(0, len(ids), RELATION_CHUNK_SIZE):
+                chunk = ids[i : i + RELATION_CHUNK_SIZE]
+                rows += (await session.execute(query.where(origin.in_(chunk)))).all()
 
-        query = select(*select_items)
+        if exists(_lifecycle_after):
+            result = BulkDTO(
+                total_pages=1,
+                total_records=len(rows),
+                limit=len(rows),
+                page=1,
+                data=rows,
+                count_strategy="none",
+            )
+            await _lifecycle_after(result)
+            rows = result.data
 
-        query = query.join(getattr(self.model, relation))
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row._mapping[ORIGIN_LABEL], []).append(row)
+        return grouped
 
-        joinable = [getattr(self.model, self.primary_key) == id]
+    # Streams every record matching a query, sorted, as lists of up to export_batch_size
+    # rows read from a server-side cursor, so memory use stays flat however many records
+    # match. Nothing is counted or skipped with OFFSET. before_get_all sees the query
+    # first, with "limit" set to None when the export is unbounded, and after_get_all
+    # sees every batch as a BulkDTO, so it can still alter or redact rows. The session
+    # stays open until the generator is exhausted or closed.
+    async def stream_all(
+        self,
+        columns: List[str] = None,
+        sort: List[str] = None,
+        where: Json = None,
+        limit: Union[int, None] = None,
+    ) -> AsyncIterator[List]:
+        query_conf = {
+            "page": 1,
+            "limit": limit,
+            "columns": columns,
+            "sort": sort,
+            "where": where,
+            "after": None,
+            "count": "none",
+        }
+        if exists(self.lifecycle["before_get_all"]):
+            await self.lifecycle["before_get_all"](query_conf)
 
-        if isinstance(query_conf["where"], dict) or isinstance(
-            query_conf["where"], list
-        ):
-            joinable.append(
-                *self.query_forge(model=relation_model, where=query_conf["where"])
-            )
-        query = query.filter(and_(*joinable))
+        limit = query_conf["limit"]
+        plan, params = self.list_plan(
+            model=self.model,
+            primary_key=self.primary_key,
+            query_conf={**query_conf, "limit": 0},
+        )
+        del params[LIMIT_BIND], params[OFFSET_BIND]
+        query = plan.query
+        for attr, direction in plan.sorts:
+            query = query.order_by(getattr(attr, direction)())
+        if limit != None:
+            query = query.limit(limit)
 
-        # select sort dynamically
-        if query_conf["sort"] is not None and query_conf["sort"] != []:
-            # we need sort format data like this --> ['id asc','name desc', 'email']
-            def splitter(sort_string: str):
-                parts = sort_string.split(" ")
-                getter = "asc"
-                if len(parts) == 2:
-                    getter = parts[1]
-                return getattr(getattr(relation_model, parts[0]), getter)
-
-            sorts = list(map(splitter, query_conf["sort"]))
-            for field in sorts:
-                query = query.order_by(field())
-
-        # count query
-        count_query = select(func.count(1)).select_from(query)
-        offset_page = query_conf["page"] - 1
-        # pagination
-        query = query.offset(offset_page * query_conf["limit"]).limit(
-            query_conf["limit"]
-        )
-        # total record
-
-        async with self.adapter.getSession() as session1:
-            async with self.adapter.getSession() as session2:
-                results = await gather(
-                    session1.execute(count_query),
-                    session2.execute(query),
-                    return_exceptions=False,
-                )
-                count: Result = results[0]
-                records: Result = results[1]
-                total_record = count.scalar() or 0
-                result = records.fetchall()
+        batch = 0
+        async with self.adapter.getSession(read_only=True) as session:
+            result = await session.stream(query, params)
+            async for rows in result.partitions(self.export_batch_size):
+                batch += 1
+                if exists(self.lifecycle["after_get_all"]):
+                    page = BulkDTO(
+                        total_pages=0,
+                        total_records=0,
+                        limit=self.export_batch_size,
+                        page=batch,
+                        data=rows,
+                        count_strategy="none",
+                    )
+                    await self.lifecycle["after_get_all"](page)
+                    rows = page.data
+                yield rows
 
-        # possible pass in outside functions to map/alter data?
-        # total page
-        total_page = math.ceil(total_record / query_conf["limit"])
-        result = BulkDTO(
-            total_pages=total_page,
-            total_records=total_record,
-            page=query_conf["page"],
-            limit=query_conf["limit"],
-            data=result,
+    # A list cache key holds the resource's generation, the far side's generation for
+    # relationship lists, and a digest of the normalized query_conf (which includes any
+    # changes the before_get_all hook made). A write replaces a generation, so results
+    # read before it can never be looked up again. None without a list cache.
+    async def list_cache_key(
+        self,
+        query_conf: Dict = ...,
+        relation: Union[str, None] = None,
+        id: Union[possible_id_types, None] = None,
+        related: Union["AbstractRepository", None] = None,
+    ) -> Union[str, None]:
+        if self.list_cache is None:
+            return None
+        digest = self.query_digest(query_conf=query_conf)
+        generation = await self.list_generation(cache=self.list_cache)
+        if relation is None:
+            return f"{self.model.__name__}:list:{generation}:{digest}"
+        related_generation = await related.list_generation(cache=self.list_cache)
+        return (
+            f"{self.model.__name__}:list:{generation}:{relation}:{id}:"
+            f"{related_generation}:{digest}"
         )
 
-        if exists(_lifecycle_after):
-            await _lifecycle_after(result)
+    def query_digest(self, query_conf: Dict = ...) -> str:
+        normalized = json.dumps(
+            query_conf, sort_keys=True, default=str, separators=(",", ":")
+        )
+        return blake2b(normalized.encode("utf-8"), digest_size=16).hexdigest()
 
-        return result
+    # The version behind conditional GETs of a list query: a strong ETag and the latest
+    # updated_at of the whole filtered query, found with one count/max(updated_at) probe
+    # instead of the page itself. Inserts and updates move updated_at forward, deletes
+    # lower the count. Relationship lists also carry their origin record's updated_at,
+    # which every link write moves. Everything comes from the database, so ETags hold
+    # across processes and restarts. Raises NotModified when the ETag is one the client
+    # already has. Models without an updated_at column have no version.
+    async def list_version(
+        self,
+        plan: QueryPlan = ...,
+        params: Dict = ...,
+        query_conf: Dict = ...,
+        conditional: Dict = ...,
+    ) -> Union[Tuple[str, Union[datetime, None]], None]:
+        if plan.version_query is None:
+            return None
+        async with self.adapter.getSession(read_only=True) as session:
+            row = (await session.execute(plan.version_query, params)).one()
+        total = row[0]
+        changes = [x for x in row[1:] if x != None]
+        last_modified = max(changes) if len(changes) > 0 else None
+        variant = conditional.get("variant", "")
+        source = (
+            f"{self.query_digest(query_conf=query_conf)}|{total}|"
+            f"{'|'.join(f'{x}' for x in row[1:])}|{variant}"
+        )
+        etag = f'"{blake2b(source.encode("utf-8"), digest_size=16).hexdigest()}"'
+        tags = conditional.get("if_none_match", None) or []
+        if etag in tags or "*" in tags:
+            raise NotModified(etag=etag, last_modified=last_modified)
+        return etag, last_modified
 
-    # This one is rather "alchemy" because join tables aren't resources
-    async def set_many_many_relations(
+    # The version of a single record: a strong ETag and its updated_at. The record was
+    # just read (often from the record cache), so this costs no query. variant tells
+    # apart the representations of one record, like the one without links. Projections
+    # (dicts from get_by_id with columns) are versioned per set of columns, and only
+    # when updated_at is one of them.
+    def record_version(
+        self, record: Union[CruddyModel, Dict] = ..., variant: str = ""
+    ) -> Union[Tuple[str, Union[datetime, None]], None]:
+        if isinstance(record, dict):
+            updated_at = record.get("updated_at", None)
+            id = record[self.primary_key]
+            variant = f"|{','.join(sorted(record.keys()))}{variant}"
+        else:
+            updated_at = getattr(record, "updated_at", None)
+            id = getattr(record, self.primary_key)
+        if updated_at is None:
+            return None
+        source = f"{self.model.__name__}:{id}|{updated_at.isoformat()}{variant}"
+        etag = f'"{blake2b(source.encode("utf-8"), digest_size=16).hexdigest()}"'
+        return etag, updated_at
+
+    # Serves a list result from list_cache, or fetches and caches it. Entries are fresh
+    # for list_cache_ttl seconds. With list_cache_stale_ttl, an older entry is still
+    # served, and a single background fetch per key replaces it. Callers get a copy of
+    # the cached result, so their after_get_all hooks can't alter the cached one.
+    async def cached_list(
         self,
-        id: possible_id_types,
-        relation: str = ...,
-        relations: List[possible_id_types] = ...,
+        key: Union[str, None] = ...,
+        fetch: Callable[[], Awaitable[BulkDTO]] = ...,
+    ) -> BulkDTO:
+        # a shared session holding uncommitted writes neither reads nor fills the cache
+        if (
+            key is None
+            or self.list_cache is None
+            or self.adapter.shared_session_wrote()
+        ):
+            return await fetch()
+        cached = await self.list_cache.get(key)
+        if cached != None and (
+            cached[0] >= time.time() or self.list_cache_stale_ttl > 0
+        ):
+            fresh_until, result = cached
+            if fresh_until < time.time() and key not in self._list_refreshes:
+                task = create_task(self.refresh_list(key=key, fetch=fetch))
+                self._list_refreshes[key] = task
+                task.add_done_callback(lambda _: self._list_refreshes.pop(key, None))
+            return result.copy(update={"data": list(result.data)})
+        result = await fetch()
+        await self.store_list(key=key, result=result)
+        return result.copy(update={"data": list(result.data)})
+
+    async def store_list(self, key: str = ..., result: BulkDTO = ...):
+        await self.list_cache.set(
+            key,
+            (time.time() + self.list_cache_ttl, result),
+            self.list_cache_ttl + self.list_cache_stale_ttl,
+        )
+
+    async def refresh_list(
+        self, key: str = ..., fetch: Callable[[], Awaitable[BulkDTO]] = ...
     ):
-        relation_conf = {"id": id, "relation": relation, "relations": relations}
+        try:
+            await self.store_list(key=key, result=await fetch())
+        except Exception as e:
+            LOGGER.warning(f"Unable to refresh cached list {key}: {e!r}")
 
-        if exists(self.lifecycle["before_set_relations"]):
-            await self.lifecycle["before_set_relations"](relation_conf)
+    # Returns the cached plan of a one to many or many to many relationship
+    def relation_plan(self, relation: str = ...) -> RelationPlan:
+        plan = self.relation_plans.get(relation, None)
+        if plan is None:
+            plan = self.build_relation_plan(relation=relation)
+            self.relation_plans[relation] = plan
+        return plan
 
+    # Resolves the join table, its columns, and the far table of a relationship
+    def build_relation_plan(self, relation: str = ...) -> RelationPlan:
         model_relation: RelationshipProperty = getattr(
-            inspect(self.model).relationships, relation_conf["relation"]
+            inspect(self.model).relationships, relation
         )
         pairs = list(model_relation.local_remote_pairs)
-        # origin_table: Table = None
-        # origin_key: str = None
-        join_table: Table = None
-        join_table_origin_attr: str = None
-        join_table_foreign_attr: str = None
-        join_table_foreign: Table = None
-        foreign_table: Table = None
-        foreign_key: str = None
+        if model_relation.direction == MANYTOMANY:
+            join_table: Table = None
+            join_origin_col: Column = None
+            join_foreign_col: Column = None
+            foreign_table: Table = None
+            foreign_col: Column = None
+            for v in pairs:
+                local: Column = v[0]
+                remote: Column = v[1]
+                if local.table.name == self.model.__tablename__:
+                    # This is the link from our origin model to the join table
+                    join_table = remote.table
+                    join_origin_col = remote
+                else:
+                    # This is the link from the join table to the related model
+                    join_foreign_col = remote
+                    foreign_table = local.table
+                    foreign_col = local
+
+            if join_table.name != join_foreign_col.table.name:
+                raise TypeError(
+                    "Relationship many to many tables are not the same type!"
+                )
+
+            return RelationPlan(
+                relation=relation,
+                direction=MANYTOMANY,
+                foreign_table=foreign_table,
+                foreign_col=foreign_col,
+                join_table=join_table,
+                join_origin_col=join_origin_col,
+                join_foreign_col=join_foreign_col,
+            )
+
+        far_col: Column = None
         for v in pairs:
             local: Column = v[0]
             remote: Column = v[1]
             if local.table.name == self.model.__tablename__:
-                join_table = remote.table
-                join_table_origin_attr = remote.key
-                # origin_table = local.table
-                # origin_key = local.key
-                # This is the link from our origin model to the join table
+                # This is the column on the related model that points back to us
+                far_col = remote
+        if far_col is None:
+            raise RuntimeError(
+                "This should be impossible, but there was not a valid one-to-many relationship"
+            )
+        foreign_table: Table = far_col.table
+        rel_pk, foreign_col = foreign_table.primary_key.columns.items()[0]
 
-            else:
-                join_table_foreign_attr = remote.key
-                join_table_foreign = remote.table
-                foreign_table = local.table
-                foreign_key = local.key
-                # This is the link from the join table to the related model
-
-        if join_table.name != join_table_foreign.name:
-            raise TypeError("Relationship many to many tables are not the same type!")
-
-        validation_target_col: Column = getattr(foreign_table.columns, foreign_key)
-        # origin_id_col: Column = getattr(origin_table.columns, origin_key)
-        join_origin_col: Column = getattr(join_table.columns, join_table_origin_attr)
-        join_foreign_col: Column = getattr(join_table.columns, join_table_foreign_attr)
-        # validate_origin_id = select(from_obj=origin_table, columns=[origin_id_col]).where(origin_id_col == id)
-        validate_relation_ids = select(
-            from_obj=foreign_table, columns=[validation_target_col]
-        ).where(validation_target_col.in_(relation_conf["relations"]))
-        clear_relations_query = (
-            join_table.delete()
-            .where(join_origin_col == relation_conf["id"])
-            .execution_options(synchronize_session="fetch")
+        return RelationPlan(
+            relation=relation,
+            direction=model_relation.direction,
+            foreign_table=foreign_table,
+            foreign_col=foreign_col,
+            far_col=far_col,
         )
 
+    # Looks up which of the given ids exist in a column, a chunk at a time.
+    # Returns the database values, keyed by their string form.
+    async def existing_ids(
+        self,
+        session: AsyncSession = ...,
+        column: Column = ...,
+        ids: List[possible_id_types] = ...,
+    ) -> Dict[str, possible_id_types]:
+        db_ids = {}
+        ids = list(ids)
+        for i in range(0, len(ids), RELATION_CHUNK_SIZE):
+            query = select(column).where(column.in_(ids[i : i + RELATION_CHUNK_SIZE]))
+            for x in (await session.execute(query)).fetchall():
+                db_ids[f"{x[0]}"] = x[0]
+        return db_ids
+
+    # Replaces the relationship id lists of one record, in a single transaction.
+    # relations is a {relation name: [ids]} dict, like the shadow relationship
+    # properties of create and update payloads. Returns the number of linked records.
+    @track_origin
+    async def set_relations(
+        self,
+        id: possible_id_types = ...,
+        relations: Dict[str, List[possible_id_types]] = ...,
+    ) -> int:
         async with self.adapter.getSession() as session:
-            # origin_id = (await session.execute(validate_origin_id)).scalar_one_or_none()
-            db_ids = (await session.execute(validate_relation_ids)).fetchall()
-            insertable = list(
-                map(
-                    lambda x: {
-                        join_table_origin_attr: relation_conf["id"],
-                        join_table_foreign_attr: f"{x._mapping[foreign_key]}",
-                    },
-                    db_ids,
-                )
+            relation_results = await self.write_relations(
+                session=session, id=id, relations=relations
             )
-            create_relations_query = join_table.insert().values(
-                insertable
-            )  # .returning(join_foreign_col) # RETURNING DOESNT WORK ON ALL ADAPTERS
-            await session.execute(clear_relations_query)
-
-            check_ids = list(map(lambda x: f"{x._mapping[foreign_key]}", db_ids))
-            if len(insertable) > 0:
-                await session.execute(create_relations_query)
-                find_tgt_query = select(join_table).where(
-                    and_(
-                        join_origin_col == relation_conf["id"],
-                        join_foreign_col.in_(check_ids),
-                    )
-                )
-                count_query = select(func.count(1)).select_from(find_tgt_query)
-                result = (await session.execute(count_query)).scalar() or 0
-            else:
-                result = 0
+            await self.touch(session=session, id=id)
+        await self.invalidate_records([id])
+        return await self.after_set_relations(relation_results)
 
-        if exists(self.lifecycle["after_set_relations"]):
-            await self.lifecycle["after_set_relations"](
-                {
-                    "model": self.model,
-                    "relation_conf": relation_conf,
-                    "relation_type": MANYTOMANY,
-                    "related_table": foreign_table,
-                    "related_field": validation_target_col.name,
-                    "updated_db_count": result,
-                }
-            )
+    # Link rows have no updated_at of their own, so writes that change a record's links
+    # move the record's updated_at forward instead. Relationship list versions are
+    # built on it. (create and update write updated_at themselves.)
+    async def touch(self, session: AsyncSession = ..., id: possible_id_types = ...):
+        table: Table = self.model.__table__
+        if "updated_at" not in table.columns:
+            return
+        await session.execute(
+            update(table)
+            .values(updated_at=datetime.utcnow())
+            .where(table.columns[self.primary_key] == id)
+        )
 
-        return result
+    # This one is rather "alchemy" because join tables aren't resources
+    @track_origin
+    async def set_many_many_relations(
+        self,
+        id: possible_id_types,
+        relation: str = ...,
+        relations: List[possible_id_types] = ...,
+    ):
+        return await self.set_relations(id=id, relations={relation: relations})
 
     # There should probably be a configuration flag to disable this form of unsafe relationship update
+    @track_origin
     async def set_one_many_relations(
         self,
         id: possible_id_types,
         relation: str = ...,
         relations: List[possible_id_types] = ...,
     ):
-        relation_conf = {"id": id, "relation": relation, "relations": relations}
+        return await self.set_relations(id=id, relations={relation: relations})
 
-        if exists(self.lifecycle["before_set_relations"]):
-            await self.lifecycle["before_set_relations"](relation_conf)
+    # Writes relationship id lists within the caller's session, so a record and all of
+    # its relationships share one transaction (the unit of work behind create, update
+    # and set_relations). before_set_relations runs for each relationship here, while
+    # after_set_relations must wait until the transaction commits, so the mappings it
+    # will receive are returned instead. Database failures are raised as
+    # RelationshipWriteError, which rolls the whole unit of work back.
+    async def write_relations(
+        self,
+        session: AsyncSession = ...,
+        id: possible_id_types = ...,
+        relations: Dict[str, List[possible_id_types]] = ...,
+    ) -> List[Dict]:
+        relation_results = []
+        for relation, relation_ids in relations.items():
+            relation_conf = {
+                "id": id,
+                "relation": relation,
+                "relations": relation_ids,
+                "action": "set",
+            }
+            if exists(self.lifecycle["before_set_relations"]):
+                await self.lifecycle["before_set_relations"](relation_conf)
+            direction = self.relation_plan(relation=relation_conf["relation"]).direction
+            try:
+                if direction == MANYTOMANY:
+                    relation_result = await self.write_many_many_relations(
+                        session=session, relation_conf=relation_conf
+                    )
+                elif direction == ONETOMANY:
+                    relation_result = await self.write_one_many_relations(
+                        session=session, relation_conf=relation_conf
+                    )
+                else:
+                    continue
+            except SQLAlchemyError as e:
+                raise RelationshipWriteError(
+                    f"Unable to set relationship '{relation_conf['relation']}': {e.__class__.__name__}"
+                ) from e
+            relation_results.append(relation_result)
+        return relation_results
 
-        model_relation: RelationshipProperty = getattr(
-            inspect(self.model).relationships, relation_conf["relation"]
+    # Runs once relationship writes have committed. Relationship lists are cached by both
+    # sides, so both move to a new generation. One to many writes also change the foreign
+    # key of the far side records, which are dropped from the far side's record cache.
+    async def after_set_relations(self, relation_results: List[Dict]) -> int:
+        modified_records = 0
+        for relation_result in relation_results:
+            relation_conf = relation_result["relation_conf"]
+            related = self.related_repositories.get(relation_conf["relation"], None)
+            await self.mark_written()
+            if related != None:
+                await related.mark_written()
+            if relation_result["relation_type"] == ONETOMANY and related != None:
+                await related.invalidate_records(
+                    None
+                    if relation_conf["action"] == "set"
+                    else relation_conf["relations"]
+                )
+            if exists(self.lifecycle["after_set_relations"]):
+                await self.lifecycle["after_set_relations"](relation_result)
+            modified_records += relation_result["updated_db_count"]
+        return modified_records
+
+    # With relation_sync "diff" (the default) only the links that changed are written:
+    # the current links are read, and the additions and removals are applied in chunks.
+    # "replace" deletes every link of the origin record and inserts the new list.
+    async def write_many_many_relations(
+        self, session: AsyncSession = ..., relation_conf: Dict = ...
+    ) -> Dict:
+        plan = self.relation_plan(relation=relation_conf["relation"])
+        join_table = plan.join_table
+        join_origin_col = plan.join_origin_col
+        join_foreign_col = plan.join_foreign_col
+
+        db_ids = await self.existing_ids(
+            session=session, column=plan.foreign_col, ids=relation_conf["relations"]
         )
-        pairs = list(model_relation.local_remote_pairs)
-        found = False
-        for v in pairs:
-            local: Column = v[0]
-            remote: Column = v[1]
-            if local.table.name == self.model.__tablename__:
-                related_model: Table = remote.table
-                far_col_name: str = remote.key
-                far_col = remote
-                found = True
-                # origin_table = local.table
-                # origin_key = local.key
-                # This is the link from our origin model to the join table
-        if not found:
-            raise RuntimeError(
-                "This should be impossible, but there was not a valid one-to-many relationship"
+        if self.relation_sync == "diff":
+            current_query = select(join_foreign_col).where(
+                join_origin_col == relation_conf["id"]
+            )
+            current_ids = {
+                f"{x[0]}": x[0]
+                for x in (await session.execute(current_query)).fetchall()
+            }
+            removable = [v for k, v in current_ids.items() if k not in db_ids]
+            addable = [v for k, v in db_ids.items() if k not in current_ids]
+            for i in range(0, len(removable), RELATION_CHUNK_SIZE):
+                await session.execute(
+                    join_table.delete().where(
+                        and_(
+                            join_origin_col == relation_conf["id"],
+                            join_foreign_col.in_(
+                                removable[i : i + RELATION_CHUNK_SIZE]
+                            ),
+                        )
+                    )
+                )
+        else:
+            await session.execute(
+                join_table.delete().where(join_origin_col == relation_conf["id"])
+            )
+            addable = list(db_ids.values())
+
+        insertable = list(
+            map(
+                lambda x: {
+                    join_origin_col.key: relation_conf["id"],
+                    join_foreign_col.key: x,
+                },
+                addable,
+            )
+        )
+        for i in range(0, len(insertable), RELATION_CHUNK_SIZE):
+            await session.execute(
+                join_table.insert(), insertable[i : i + RELATION_CHUNK_SIZE]
             )
 
-        rel_pk, related_model_id = related_model.primary_key.columns.items()[0]
+        return {
+            "model": self.model,
+            "relation_conf": relation_conf,
+            "relation_type": MANYTOMANY,
+            "related_table": plan.foreign_table,
+            "related_field": plan.foreign_col.name,
+            "updated_db_count": len(db_ids),
+        }
+
+    async def write_one_many_relations(
+        self, session: AsyncSession = ..., relation_conf: Dict = ...
+    ) -> Dict:
+        plan = self.relation_plan(relation=relation_conf["relation"])
+        related_model = plan.foreign_table
+        far_col = plan.far_col
+        far_col_name = far_col.key
 
         clear_query = (
             update(table=related_model)
             .values({far_col_name: None})
-            .where(far_col.in_([relation_conf["id"]]))
+            .where(far_col == relation_conf["id"])
         )
         alter_query = (
             update(table=related_model)
             .values({far_col_name: relation_conf["id"]})
-            .where(related_model_id.in_(relation_conf["relations"]))
-            # .returning(related_model_id) # RETURNING DOESNT WORK ON ALL ADAPTERS
+            .where(plan.foreign_col.in_(relation_conf["relations"]))
         )
-        find_tgt_query = select(related_model).where(
-            and_(
-                far_col == relation_conf["id"],
-                related_model_id.in_(relation_conf["relations"]),
+        if far_col.nullable:
+            await session.execute(clear_query)
+        else:
+            LOGGER.warn(
+                f"Unable to clear relations for {related_model.name}.{far_col_name}. Column does not allow null values"
             )
+        alter_result = 0
+        if len(relation_conf["relations"]) > 0:
+            alter_result = (await session.execute(alter_query)).rowcount
+
+        return {
+            "model": self.model,
+            "relation_conf": relation_conf,
+            "relation_type": ONETOMANY,
+            "related_table": related_model,
+            "related_field": far_col_name,
+            "updated_db_count": alter_result,
+        }
+
+    # Links the given ids to a record, leaving its other relations untouched. Many to many
+    # links are written with INSERT ... SELECT statements that skip unknown ids and links
+    # which already exist. Returns the number of new links, or None when the record does
+    # not exist.
+    @track_origin
+    async def add_relations(
+        self,
+        id: possible_id_types = ...,
+        relation: str = ...,
+        relations: List[possible_id_types] = ...,
+    ) -> Union[int, None]:
+        return await self.change_relations(
+            id=id, relation=relation, relations=relations, action="add"
         )
-        count_query = select(func.count(1)).select_from(find_tgt_query)
-        async with self.adapter.getSession() as session:
-            if far_col.nullable:
-                await session.execute(clear_query)
-            else:
-                LOGGER.warn(
-                    f"Unable to clear relations for {related_model.name}.{far_col_name}. Column does not allow null values"
-                )
 
-            await session.execute(
-                alter_query
-            )  # .rowcount # also affected by removing returning
-            alter_result = (await session.execute(count_query)).scalar() or 0
+    # Unlinks the given ids from a record. Returns the number of removed links, or None
+    # when the record does not exist.
+    @track_origin
+    async def remove_relations(
+        self,
+        id: possible_id_types = ...,
+        relation: str = ...,
+        relations: List[possible_id_types] = ...,
+    ) -> Union[int, None]:
+        return await self.change_relations(
+            id=id, relation=relation, relations=relations, action="remove"
+        )
+
+    async def change_relations(
+        self,
+        id: possible_id_types = ...,
+        relation: str = ...,
+        relations: List[possible_id_types] = ...,
+        action: Literal["add", "remove"] = ...,
+    ) -> Union[int, None]:
+        relation_conf = {
+            "id": id,
+            "relation": relation,
+            "relations": relations,
+            "action": action,
+        }
+
+        if exists(self.lifecycle["before_set_relations"]):
+            await self.lifecycle["before_set_relations"](relation_conf)
+
+        plan = self.relation_plan(relation=relation_conf["relation"])
+        ids = list(relation_conf["relations"])
+        origin_query = select(getattr(self.model, self.primary_key)).where(
+            getattr(self.model, self.primary_key) == relation_conf["id"]
+        )
+        changed = 0
+        async with self.adapter.getSession() as session:
+            if (await session.execute(origin_query)).first() is None:
+                return None
+            try:
+                for i in range(0, len(ids), RELATION_CHUNK_SIZE):
+                    chunk = ids[i : i + RELATION_CHUNK_SIZE]
+                    if plan.direction == MANYTOMANY:
+                        query = self.many_many_change_query(
+                            plan=plan, id=relation_conf["id"], ids=chunk, action=action
+                        )
+                    else:
+                        query = self.one_many_change_query(
+                            plan=plan, id=relation_conf["id"], ids=chunk, action=action
+                        )
+                    changed += (await session.execute(query)).rowcount
+            except SQLAlchemyError as e:
+                raise RelationshipWriteError(
+                    f"Unable to {action} relations of '{relation_conf['relation']}': {e.__class__.__name__}"
+                ) from e
+            if changed > 0:
+                await self.touch(session=session, id=relation_conf["id"])
+        if changed > 0:
+            await self.invalidate_records([relation_conf["id"]])
 
-        if exists(self.lifecycle["after_set_relations"]):
-            await self.lifecycle["after_set_relations"](
+        await self.after_set_relations(
+            [
                 {
                     "model": self.model,
                     "relation_conf": relation_conf,
-                    "relation_type": ONETOMANY,
-                    "related_table": related_model,
-                    "related_field": far_col_name,
-                    "updated_db_count": alter_result,
+                    "relation_type": plan.direction,
+                    "related_table": plan.foreign_table,
+                    "related_field": plan.foreign_col.name
+                    if plan.direction == MANYTOMANY
+                    else plan.far_col.key,
+                    "updated_db_count": changed,
                 }
+            ]
+        )
+        return changed
+
+    def many_many_change_query(
+        self,
+        plan: RelationPlan = ...,
+        id: possible_id_types = ...,
+        ids: List[possible_id_types] = ...,
+        action: Literal["add", "remove"] = ...,
+    ):
+        if action == "remove":
+            return plan.join_table.delete().where(
+                and_(plan.join_origin_col == id, plan.join_foreign_col.in_(ids))
             )
+        already_linked = (
+            select(plan.join_foreign_col)
+            .where(
+                and_(
+                    plan.join_origin_col == id,
+                    plan.join_foreign_col == plan.foreign_col,
+                )
+            )
+            .exists()
+        )
+        linkable = select(
+            literal(id, type_=plan.join_origin_col.type), plan.foreign_col
+        ).where(and_(plan.foreign_col.in_(ids), not_(already_linked)))
+        return plan.join_table.insert().from_select(
+            [plan.join_origin_col.key, plan.join_foreign_col.key], linkable
+        )
 
-        return alter_result
+    def one_many_change_query(
+        self,
+        plan: RelationPlan = ...,
+        id: possible_id_types = ...,
+        ids: List[possible_id_types] = ...,
+        action: Literal["add", "remove"] = ...,
+    ):
+        if action == "remove":
+            if not plan.far_col.nullable:
+                raise RelationshipWriteError(
+                    f"Unable to remove relations of '{plan.relation}'. {plan.foreign_table.name}.{plan.far_col.key} does not allow null values"
+                )
+            return (
+                update(table=plan.foreign_table)
+                .values({plan.far_col.key: None})
+                .where(and_(plan.far_col == id, plan.foreign_col.in_(ids)))
+            )
+        return (
+            update(table=plan.foreign_table)
+            .values({plan.far_col.key: id})
+            .where(plan.foreign_col.in_(ids))
+        )
+
+    # Resolves the query plan for a list query and the bind values for this request.
+    # Plans are cached per query shape: the origin relation, selected columns, sort,
+    # pagination mode, and the structure (but not the values) of the where object.
+    def list_plan(
+        self,
+        model: CruddyModel = ...,
+        primary_key: str = ...,
+        query_conf: Dict = ...,
+        relation: Union[str, None] = None,
+    ) -> Tuple[QueryPlan, Dict]:
+        get_columns: List[str] = (
+            list(query_conf["columns"])
+            if query_conf["columns"] is not None and query_conf["columns"] != []
+            else list(model.__fields__.keys())
+        )
+        if primary_key not in get_columns:
+            get_columns.append(primary_key)
+        sort = query_conf["sort"] if query_conf["sort"] is not None else []
+        cursor_mode = query_conf["after"] is not None
+        seek = cursor_mode and query_conf["after"] != ""
+        values = decode_cursor(query_conf["after"]) if seek else []
+        # NULL cursor values are sought with IS NULL criteria instead of bind parameters
+        nulls = tuple(x is None for x in values)
+
+        _, shape, params = where_template(
+            query_conf["where"], self.op_map, build_template=False
+        )
+        key = (
+            relation,
+            tuple(get_columns),
+            tuple(sort),
+            shape,
+            cursor_mode,
+            seek,
+            nulls,
+        )
+        plan = self.plan_cache.get(key)
+        if plan is None:
+            template, _, _ = where_template(query_conf["where"], self.op_map)
+            plan = self.build_list_plan(
+                model=model,
+                primary_key=primary_key,
+                columns=get_columns,
+                sort=sort,
+                where=template,
+                cursor_mode=cursor_mode,
+                seek=seek,
+                nulls=nulls,
+                relation=relation,
+            )
+            self.plan_cache.set(key, plan)
+
+        # fetch one extra row to find out if there is another page
+        fetch_extra = cursor_mode or query_conf["count"] == "none"
+        params[LIMIT_BIND] = query_conf["limit"] + (1 if fetch_extra else 0)
+        if not cursor_mode:
+            params[OFFSET_BIND] = (query_conf["page"] - 1) * query_conf["limit"]
+        if seek:
+            if len(values) != len(plan.sorts):
+                raise InvalidCursor(
+                    f"Pagination cursor does not match the sort: {query_conf['after']}"
+                )
+            for i, value in enumerate(values):
+                if value is not None:
+                    params[f"{KEYSET_BIND_PREFIX}{i}"] = value
+        return plan, params
+
+    # Builds every statement a list query needs, with bind parameters in place of the
+    # client's where values, the origin id, the cursor values, limit and offset.
+    # nulls tells which cursor values are NULL.
+    def build_list_plan(
+        self,
+        model: CruddyModel = ...,
+        primary_key: str = ...,
+        columns: List[str] = ...,
+        sort: List[str] = ...,
+        where: Union[Dict, List[Dict], None] = None,
+        cursor_mode: bool = False,
+        seek: bool = False,
+        nulls: Tuple[bool, ...] = (),
+        relation: Union[str, None] = None,
+    ) -> QueryPlan:
+        select_items = list(map(lambda x: getattr(model, x), columns))
+        query = select(*select_items)
+
+        criteria = []
+        if relation != None:
+            query = query.join(getattr(self.model, relation))
+            criteria.append(getattr(self.model, self.primary_key) == bindparam(ID_BIND))
+        if isinstance(where, dict) or isinstance(where, list):
+            criteria += self.query_forge(model=model, where=where)
+        if len(criteria) > 0:
+            query = query.filter(and_(*criteria))
+
+        # select sort dynamically
+        sorts = self.sort_forge(model=model, sort=sort)
+        cursor_keys = None
+        if cursor_mode:
+            # keyset pagination needs a total order, so the primary key breaks ties
+            sorts = self.keyset_sort(model=model, primary_key=primary_key, sorts=sorts)
+            # the next cursor is built from the sort values of the page's last row.
+            # Sort columns the client did not select are read under labels that are
+            # stripped from the page before it is returned.
+            cursor_keys = [
+                attr.key if attr.key in columns else f"{CURSOR_LABEL_PREFIX}{i}"
+                for i, (attr, _) in enumerate(sorts)
+            ]
+            query = query.add_columns(
+                *[
+                    attr.label(cursor_keys[i])
+                    for i, (attr, _) in enumerate(sorts)
+                    if attr.key not in columns
+                ]
+            )
+
+        # ORDER BY is left out of the count, it can't change the result
+        count_query = select(func.count(1)).select_from(query)
+
+        # relationship lists also carry the origin record's updated_at, which link
+        # writes move forward, since link rows have no updated_at of their own
+        version_query = None
+        if "updated_at" in model.__table__.columns and (
+            relation is None or "updated_at" in self.model.__table__.columns
+        ):
+            versioned = query.add_columns(
+                model.__table__.columns["updated_at"].label(UPDATED_AT_LABEL)
+            ).subquery()
+            version_query = select(
+                func.count(1), func.max(versioned.c[UPDATED_AT_LABEL])
+            )
+            if relation != None:
+                origin_table: Table = self.model.__table__
+                version_query = version_query.add_columns(
+                    select(origin_table.columns["updated_at"])
+                    .where(origin_table.columns[self.primary_key] == bindparam(ID_BIND))
+                    .scalar_subquery()
+                )
+
+        page_query = query
+        for attr, direction in sorts:
+            page_query = page_query.order_by(getattr(attr, direction)())
+        if seek:
+            page_query = page_query.filter(
+                self.keyset_forge(
+                    sorts=sorts,
+                    values=[
+                        None
+                        if i < len(nulls) and nulls[i]
+                        else bindparam(f"{KEYSET_BIND_PREFIX}{i}")
+                        for i in range(len(sorts))
+                    ],
+                    nulls_first=self.adapter.nulls_sort_first(),
+                )
+            )
+        if not cursor_mode:
+            page_query = page_query.offset(bindparam(OFFSET_BIND, type_=Integer))
+        page_query = page_query.limit(bindparam(LIMIT_BIND, type_=Integer))
+
+        return QueryPlan(
+            query=query,
+            count_query=count_query,
+            page_query=page_query,
+            sorts=sorts,
+            filtered=len(criteria) > 0,
+            version_query=version_query,
+            cursor_keys=cursor_keys,
+        )
+
+    # Runs a list query plan as a page of results, alongside the total record count
+    # chosen by query_conf["count"]:
+    # exact - count(1) over the filtered query
+    # cached - an exact count, reused for count_cache_ttl seconds per normalized where clause
+    # estimated - table statistics from the database when the query is unfiltered, else exact
+    # none - no count at all. One extra row is fetched to tell the client if more pages exist
+    # With list_execution "parallel" the count and the page run concurrently on two pooled
+    # connections. With "single" both share one connection: exact counts ride along with the
+    # page as a window function when the database supports it, otherwise they run in sequence.
+    async def fetch_page(
+        self,
+        plan: QueryPlan = ...,
+        params: Dict = ...,
+        query_conf: Dict = ...,
+        count_table: Union[Table, None] = None,
+        count_key: str = "",
+    ) -> BulkDTO:
+        limit = query_conf["limit"]
+        count_strategy = query_conf["count"]
+        cursor_mode = query_conf["after"] is not None
+        fetch_extra = cursor_mode or count_strategy == "none"
+        offset = 0 if cursor_mode else params[OFFSET_BIND]
+
+        cache_key = None
+        if count_strategy == "cached":
+            normalized_where = json.dumps(
+                query_conf["where"], sort_keys=True, default=str
+            )
+            cache_key = f"{count_key}|{normalized_where}"
+        if count_strategy == "estimated" and (count_table is None or plan.filtered):
+            count_strategy = "exact"
+
+        cached_total = None
+        if count_strategy == "cached":
+            cached = self._count_cache.get(cache_key, None)
+            if cached != None and cached[0] > time.monotonic():
+                cached_total = cached[1]
+
+        def counted(total: int):
+            if count_strategy == "cached":
+                self._cache_count(cache_key, total)
+                return total, count_strategy
+            return total, "exact"
+
+        async def counter(session: AsyncSession):
+            if count_strategy == "none":
+                return None, count_strategy
+            if cached_total != None:
+                return cached_total, count_strategy
+            if count_strategy == "estimated":
+                estimate = await self.adapter.estimate_row_count(
+                    session=session, table_name=count_table.name
+                )
+                if estimate != None:
+                    return estimate, count_strategy
+            total = (await session.execute(plan.count_query, params)).scalar()
+            return counted(total or 0)
+
+        # a shared (request or writer) session can't run two statements at once, but
+        # until it has written, both queries can run on sessions of their own
+        if (
+            self.list_execution == "parallel"
+            and not self.adapter.shared_session_wrote()
+        ):
+            async with self.adapter.getSession(
+                read_only=True, shared=False
+            ) as session1:
+                async with self.adapter.getSession(
+                    read_only=True, shared=False
+                ) as session2:
+                    results = await gather(
+                        counter(session1),
+                        session2.execute(plan.page_query, params),
+                        return_exceptions=False,
+                    )
+                    total_record, count_strategy = results[0]
+                    records = results[1].freeze()
+                    result = records().fetchall()
+        elif (
+            count_strategy in ("exact", "cached")
+            and cached_total is None
+            and not cursor_mode
+            and self.adapter.supports_window_functions()
+        ):
+            # COUNT(*) OVER() is evaluated before LIMIT/OFFSET, so every row of the
+            # page carries the total for the whole filtered query. (In cursor mode the
+            # seek criteria would be counted too, so those queries count sequentially.)
+            async with self.adapter.getSession(read_only=True) as session:
+                records = (await session.execute(plan.windowed_query, params)).freeze()
+                if len(records.data) > 0:
+                    total = records.data[0]._mapping[WINDOW_COUNT_LABEL]
+                elif offset == 0:
+                    total = 0
+                else:
+                    # a page past the end has no rows to carry the total
+                    total = (await session.execute(plan.count_query, params)).scalar()
+            total_record, count_strategy = counted(total or 0)
+            result = records().columns(*plan.keys).fetchall()
+        else:
+            async with self.adapter.getSession(read_only=True) as session:
+                total_record, count_strategy = await counter(session)
+                records = (await session.execute(plan.page_query, params)).freeze()
+                result = records().fetchall()
+
+        has_more = None
+        next_cursor = None
+        if fetch_extra:
+            has_more = len(result) > limit
+            result = result[:limit]
+            if cursor_mode and has_more:
+                last = result[-1]._mapping
+                next_cursor = encode_cursor([last[x] for x in plan.cursor_keys])
+        if plan.hides_columns:
+            # the sort values only read to build the cursor are not returned
+            result = records().columns(*plan.keys).fetchall()[: len(result)]
+
+        # possible pass in outside functions to map/alter data?
+        # total page
+        if total_record is None:
+            # without a count, report what is known: the records seen so far
+            total_record = offset + len(result) if len(result) > 0 else 0
+            total_page = query_conf["page"] + (1 if has_more else 0)
+            total_page = total_page if len(result) > 0 else 0
+        else:
+            total_page = math.ceil(total_record / limit)
+        return BulkDTO(
+            total_pages=total_page,
+            total_records=total_record,
+            page=query_conf["page"],
+            limit=limit,
+            data=result,
+            next=next_cursor,
+            has_more=has_more,
+            count_strategy=count_strategy,
+        )
+
+    def _cache_count(self, key: str, total: int):
+        now = time.monotonic()
+        if len(self._count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+            for k in [k for k, v in self._count_cache.items() if v[0] <= now]:
+                del self._count_cache[k]
+            while len(self._count_cache) >= COUNT_CACHE_MAX_ENTRIES:
+                del self._count_cache[next(iter(self._count_cache))]
+        self._count_cache[key] = (now + self.count_cache_ttl, total)
+
+    # Converts a sort list, like ['id asc','name desc', 'email'], into a list of
+    # (model attribute, direction) tuples. Direction defaults to "asc".
+    def sort_forge(
+        self,
+        model: CruddyModel,
+        sort: Union[List[str], None],
+    ) -> List[Tuple[InstrumentedAttribute, str]]:
+        sorts = []
+        for sort_string in sort or []:
+            parts = sort_string.split(" ")
+            direction = "asc"
+            if len(parts) == 2:
+                direction = parts[1]
+            sorts.append((getattr(model, parts[0]), direction))
+        return sorts
+
+    # Keyset (cursor) pagination requires a unique, total ordering. Appending the
+    # primary key as the final sort key guarantees that, and with time-ordered
+    # uuid7 keys an unsorted query simply pages through records by creation time.
+    def keyset_sort(
+        self,
+        model: CruddyModel,
+        primary_key: str,
+        sorts: List[Tuple[InstrumentedAttribute, str]],
+    ) -> List[Tuple[InstrumentedAttribute, str]]:
+        if any(attr.key == primary_key for attr, _ in sorts):
+            return sorts
+        return sorts + [(getattr(model, primary_key), "asc")]
+
+    # Builds the "seek" criteria that resumes a keyset ordered query after the row
+    # described by the cursor values (or bind parameters for them). For sort keys (a asc, b desc, id asc) this renders as:
+    # (a > :a) OR (a = :a AND b < :b) OR (a = :a AND b = :b AND id > :id)
+    # A None value is a NULL cursor value, matched with IS NULL. Where NULLs sort is up
+    # to the database (nulls_first: NULL sorts below every value, so it leads ascending
+    # sorts), and the seek follows it: after a leading NULL come all the values, and
+    # after a value come the trailing NULLs.
+    def keyset_forge(
+        self,
+        sorts: List[Tuple[InstrumentedAttribute, str]],
+        values: List,
+        nulls_first: bool = True,
+    ):
+        seek_criteria = []
+        for i, (attr, direction) in enumerate(sorts):
+            level_criteria = [
+                sorts[j][0].is_(None) if values[j] is None else sorts[j][0] == values[j]
+                for j in range(i)
+            ]
+            nulls_lead = nulls_first == (direction != "desc")
+            nullable = getattr(attr.expression, "nullable", True)
+            if values[i] is None:
+                if not nulls_lead:
+                    # nothing sorts after a trailing NULL at this level
+                    continue
+                level_criteria.append(attr.is_not(None))
+            else:
+                after = attr < values[i] if direction == "desc" else attr > values[i]
+                if nullable and not nulls_lead:
+                    after = or_(after, attr.is_(None))
+                level_criteria.append(after)
+            seek_criteria.append(and_(*level_criteria))
+        return or_(*seek_criteria)
 
     # Initial, simple, query forge. Invalid attrs or ops are just dropped.
     # Improvements to make:
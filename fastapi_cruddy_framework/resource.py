@@ -1,7 +1,8 @@
 # pyright: reportShadowedImports=false
 import asyncio
-import re
-from fastapi import APIRouter
+from uuid import UUID as BaseUUID
+from fastapi import APIRouter, Depends
+from fastapi.routing import APIRoute
 from sqlalchemy.orm import (
     RelationshipProperty,
     # selectinload,
@@ -9,7 +10,7 @@ from sqlalchemy.orm import (
     MANYTOMANY,
 )
 from sqlmodel import inspect
-from typing import Union, Optional, List, Dict, Callable, Literal, Type
+from typing import Union, Optional, List, Dict, Tuple, Callable, Literal, Type, Any
 from pydantic import create_model
 from pydantic.generics import GenericModel
 from .inflector import pluralizer
@@ -26,8 +27,24 @@ from .schemas import (
 )
 from .controller import CruddyController, ControllerCongifurator
 from .repository import AbstractRepository
-from .adapters import BaseAdapter, SqliteAdapter, MysqlAdapter, PostgresqlAdapter
-from .util import possible_id_types, lifecycle_types
+from .cache import CacheBackend
+from .serialization import RowEncoder
+from .adapters import (
+    BaseAdapter,
+    SqliteAdapter,
+    MysqlAdapter,
+    PostgresqlAdapter,
+    RequestSessionRoute,
+)
+from .util import (
+    get_pk,
+    uuid_string,
+    possible_id_types,
+    lifecycle_types,
+    count_strategy_types,
+    list_execution_types,
+    relation_sync_types,
+)
 
 
 # -------------------------------------------------------------------------------------------
@@ -47,6 +64,9 @@ class Resource:
     _model_name_single: str = None
     _model_name_plural: str = None
     _on_resolution: Union[Callable, None] = None
+    _link_base: str = None
+    _link_suffixes: List[Tuple[str, str]] = None
+    _link_id: Callable[[possible_id_types], str] = None
     adapter: PostgresqlAdapter = None
     repository: AbstractRepository = None
     controller: APIRouter = None
@@ -78,6 +98,8 @@ class Resource:
         path: str = None,
         tags: List[str] = None,
         protected_relationships: List[str] = [],
+        conditional_requests: bool = False,
+        fast_serialization: bool = False,
         policies_universal: List[Callable] = [],
         policies_create: List[Callable] = [],
         policies_update: List[Callable] = [],
@@ -85,16 +107,26 @@ class Resource:
         policies_get_one: List[Callable] = [],
         policies_get_many: List[Callable] = [],
         disable_create: bool = False,
+        disable_create_many: bool = False,
         disable_update: bool = False,
         disable_delete: bool = False,
         disable_get_one: bool = False,
         disable_get_many: bool = False,
+        enable_update_many: bool = False,
+        enable_delete_many: bool = False,
+        enable_export: bool = False,
         lifecycle_before_create: lifecycle_types = None,
         lifecycle_after_create: lifecycle_types = None,
+        lifecycle_before_create_many: lifecycle_types = None,
+        lifecycle_after_create_many: lifecycle_types = None,
         lifecycle_before_update: lifecycle_types = None,
         lifecycle_after_update: lifecycle_types = None,
+        lifecycle_before_update_many: lifecycle_types = None,
+        lifecycle_after_update_many: lifecycle_types = None,
         lifecycle_before_delete: lifecycle_types = None,
         lifecycle_after_delete: lifecycle_types = None,
+        lifecycle_before_delete_many: lifecycle_types = None,
+        lifecycle_after_delete_many: lifecycle_types = None,
         lifecycle_before_get_one: lifecycle_types = None,
         lifecycle_after_get_one: lifecycle_types = None,
         lifecycle_before_get_all: lifecycle_types = None,
@@ -102,6 +134,21 @@ class Resource:
         lifecycle_before_set_relations: lifecycle_types = None,
         lifecycle_after_set_relations: lifecycle_types = None,
         controller_extension: Union[CruddyController, None] = None,
+        count_strategy: count_strategy_types = "exact",
+        count_cache_ttl: float = 60,
+        list_execution: list_execution_types = "parallel",
+        query_plan_cache_size: int = 128,
+        bulk_create_chunk_size: int = 1000,
+        bulk_write_max_rows: int = 10000,
+        export_batch_size: int = 1000,
+        relation_sync: relation_sync_types = "diff",
+        record_cache_size: int = 0,
+        record_cache_ttl: float = 30,
+        record_cache: Union[CacheBackend, None] = None,
+        list_cache_size: int = 0,
+        list_cache_ttl: float = 5,
+        list_cache_stale_ttl: float = 0,
+        list_cache: Union[CacheBackend, None] = None,
     ):
         possible_tag = f"{resource_model.__name__}".lower()
         possible_path = f"/{pluralizer.plural(possible_tag)}"
@@ -116,6 +163,9 @@ class Resource:
         self._id_type = id_type
         self._relations = {}
         self._protected_relationships = protected_relationships
+        self._conditional_requests = conditional_requests
+        self._fast_serialization = fast_serialization
+        self.row_encoder = None
 
         self.policies = {
             "universal": policies_universal,
@@ -128,12 +178,19 @@ class Resource:
 
         self.disabled_endpoints = {
             "create": disable_create,
+            "create_many": disable_create_many,
             "update": disable_update,
             "delete": disable_delete,
             "get_one": disable_get_one,
             "get_many": disable_get_many,
         }
 
+        self.enabled_endpoints = {
+            "update_many": enable_update_many,
+            "delete_many": enable_delete_many,
+            "export": enable_export,
+        }
+
         if None != adapter:
             self.adapter = adapter
         elif None != db_path:
@@ -151,19 +208,51 @@ class Resource:
             id_type=id_type,
             lifecycle_before_create=lifecycle_before_create,
             lifecycle_after_create=lifecycle_after_create,
+            lifecycle_before_create_many=lifecycle_before_create_many,
+            lifecycle_after_create_many=lifecycle_after_create_many,
             lifecycle_before_update=lifecycle_before_update,
             lifecycle_after_update=lifecycle_after_update,
+            lifecycle_before_update_many=lifecycle_before_update_many,
+            lifecycle_after_update_many=lifecycle_after_update_many,
             lifecycle_before_delete=lifecycle_before_delete,
             lifecycle_after_delete=lifecycle_after_delete,
+            lifecycle_before_delete_many=lifecycle_before_delete_many,
+            lifecycle_after_delete_many=lifecycle_after_delete_many,
             lifecycle_before_get_one=lifecycle_before_get_one,
             lifecycle_after_get_one=lifecycle_after_get_one,
             lifecycle_before_get_all=lifecycle_before_get_all,
             lifecycle_after_get_all=lifecycle_after_get_all,
             lifecycle_before_set_relations=lifecycle_before_set_relations,
             lifecycle_after_set_relations=lifecycle_after_set_relations,
+            count_strategy=count_strategy,
+            count_cache_ttl=count_cache_ttl,
+            list_execution=list_execution,
+            query_plan_cache_size=query_plan_cache_size,
+            bulk_create_chunk_size=bulk_create_chunk_size,
+            bulk_write_max_rows=bulk_write_max_rows,
+            export_batch_size=export_batch_size,
+            relation_sync=relation_sync,
+            record_cache_size=record_cache_size,
+            record_cache_ttl=record_cache_ttl,
+            record_cache=record_cache,
+            list_cache_size=list_cache_size,
+            list_cache_ttl=list_cache_ttl,
+            list_cache_stale_ttl=list_cache_stale_ttl,
+            list_cache=list_cache,
         )
 
-        self.controller = APIRouter(prefix=self._resource_path, tags=self._tags)
+        self.controller = APIRouter(
+            prefix=self._resource_path,
+            tags=self._tags,
+            # every repository call of a request shares the session of this dependency,
+            # which the route class commits before the response is sent
+            dependencies=[Depends(self.adapter)]
+            if self.adapter.request_scoped_sessions
+            else [],
+            route_class=RequestSessionRoute
+            if self.adapter.request_scoped_sessions
+            else APIRoute,
+        )
 
         if controller_extension != None and issubclass(
             controller_extension, CruddyController
@@ -185,6 +274,7 @@ class Resource:
 
     def set_local_link_prefix(self, prefix: str):
         self._link_prefix = prefix
+        self._build_link_templates()
 
     # The response schema factory
     # Converting this section a plugin pattern will allow
@@ -250,10 +340,30 @@ class Resource:
         )
         # End update record envelope schema
 
-        # Single record schema with embedded links
+        # Bulk update envelope schema, every field is optional and relationships are left out
+        PartialUpdateSchema = create_model(
+            f"{resource_update_name}Partial",
+            __base__=CruddyGenericModel,
+            **{
+                k: (Optional[v.outer_type_], None)
+                for k, v in update_schema.__fields__.items()
+            },
+        )
+        PartialUpdateEnvelope = create_model(
+            f"{resource_update_name}PartialEnvelope",
+            __base__=CruddyGenericModel,
+            **{
+                resource_model_name: (PartialUpdateSchema, ...),
+            },
+        )
+        # End bulk update envelope schema
+
+        # Single record schema with embedded links, and the related records requested
+        # with include (keyed by relationship name)
         SingleSchemaLinked = create_model(
             f"{resource_response_name}Linked",
             links=(Optional[LinkModel], None),
+            included=(Optional[Dict[str, Any]], None),
             __base__=response_schema,
         )
         # End single record schema with embedded links
@@ -273,11 +383,17 @@ class Resource:
         )
         old_single_init = SingleSchemaEnvelope.__init__
 
-        def new_single_init(self, *args, **kwargs):
+        def new_single_init(
+            self,
+            *args,
+            with_links: bool = True,
+            included: Union[Dict, None] = None,
+            **kwargs,
+        ):
             old_single_init(
                 self,
                 *args,
-                **handle_data_or_none(kwargs),
+                **handle_data_or_none(kwargs, with_links, included),
             )
 
         SingleSchemaEnvelope.__init__ = new_single_init
@@ -295,7 +411,14 @@ class Resource:
 
         old_many_init = ManySchemaEnvelope.__init__
 
-        def new_many_init(self, *args, **kwargs):
+        def new_many_init(
+            self,
+            *args,
+            with_links: bool = True,
+            included: Union[Dict, None] = None,
+            **kwargs,
+        ):
+            primary_key = local_resource.repository.primary_key
             old_many_init(
                 self,
                 *args,
@@ -305,8 +428,13 @@ class Resource:
                             lambda x: SingleSchemaLinked(
                                 **x._mapping,
                                 links=local_resource._link_builder(
-                                    id=x._mapping[local_resource.repository.primary_key]
-                                ),
+                                    id=x._mapping[primary_key]
+                                )
+                                if with_links
+                                else None,
+                                included=included.get(x._mapping[primary_key], {})
+                                if included != None
+                                else None,
                             ),
                             kwargs["data"],
                         )
@@ -321,29 +449,81 @@ class Resource:
         ManySchemaEnvelope.__init__ = new_many_init
         # End many records return payload
 
+        # Rows encoded straight to JSON (or CSV), for exports, and for lists of resources
+        # with fast_serialization
+        self.row_encoder = RowEncoder(
+            schema=SingleSchemaLinked,
+            plural_name=resource_model_plural,
+            primary_key=get_pk(self.repository.model),
+            link_builder=self._link_builder,
+        )
+
+        # Created records return payload (for post/bulk)
+        BulkSchemaEnvelope = create_model(
+            f"{resource_response_name}Bulk",
+            __base__=CruddyGenericModel,
+            **{
+                resource_model_plural: (Optional[List[SingleSchemaLinked]], None),
+            },
+        )
+
+        old_bulk_init = BulkSchemaEnvelope.__init__
+
+        def new_bulk_init(self, *args, **kwargs):
+            old_bulk_init(
+                self,
+                *args,
+                **{
+                    resource_model_plural: list(
+                        map(
+                            lambda x: SingleSchemaLinked(
+                                **x.dict(),
+                                links=local_resource._link_builder(
+                                    id=getattr(x, local_resource.repository.primary_key)
+                                ),
+                            ),
+                            kwargs["data"],
+                        )
+                    )
+                    if resource_model_plural not in kwargs
+                    else kwargs[resource_model_plural],
+                },
+            )
+
+        BulkSchemaEnvelope.__init__ = new_bulk_init
+        # End created records return payload
+
         # Expose the following schemas for further use
 
         self.schemas = {
             "single": SingleSchemaEnvelope,
             "many": ManySchemaEnvelope,
+            "bulk": BulkSchemaEnvelope,
             "create": SingleCreateEnvelope,
             "create_relations": SingleCreateSchema,
             "update": SingleUpdateEnvelope,
             "update_relations": SingleUpdateSchema,
+            "update_many": PartialUpdateEnvelope,
         }
 
+    # Links are built from templates made once, when the resource resolves: the path
+    # every link starts with, each relationship's suffix, and how ids become strings.
+    # During "many" lookups, and depending on DB type, UUID ids come back from the DB
+    # as undashed hex strings, so UUID resources convert ids through the UUID type.
+    def _build_link_templates(self):
+        self._link_base = f"{self._link_prefix}{self._resource_path}/"
+        self._link_suffixes = [(k, f"/{k}") for k in self._relations.keys()]
+        self._link_id = (
+            uuid_string
+            if isinstance(self._id_type, type) and issubclass(self._id_type, BaseUUID)
+            else str
+        )
+
     def _link_builder(self, id: possible_id_types = None):
-        # During "many" lookups, and depending on DB type, the id value return is a mapping
-        # from the DB, so the id value is not properly "dasherized" into UUID format. This
-        # REGEX fixes the issue without adding the CPU overhead of transforming each row
-        # into a record instance.
-        if (self.repository.id_type == UUID and type(id) == str) and not "-" in id:
-            id = re.sub(r"(\S{8})(\S{4})(\S{4})(\S{4})(.*)", r"\1-\2-\3-\4-\5", id)
-
-        new_link_object = {}
-        for k, v in self._relations.items():
-            new_link_object[k] = f"{self._link_prefix}{self._resource_path}/{id}/{k}"
-        return new_link_object
+        if self._link_suffixes is None:
+            self._build_link_templates()
+        base = self._link_base + self._link_id(id)
+        return {k: base + suffix for k, suffix in self._link_suffixes}
 
     def _create_schema_arg_handler(self, single_schema_linked, resource_model_name):
         def data_destructure(data):
@@ -355,7 +535,9 @@ class Resource:
                 return data.dict()
             return data
 
-        def handle_data_or_none(args):
+        def handle_data_or_none(
+            args, with_links: bool = True, included: Union[Dict, None] = None
+        ):
             if args == None:
                 return {"data": None}
 
@@ -375,7 +557,8 @@ class Resource:
             return {
                 resource_model_name: single_schema_linked(
                     **thing_to_convert,
-                    links=self._link_builder(id=id),
+                    links=self._link_builder(id=id) if with_links else None,
+                    included=included.get(id, {}) if included != None else None,
                 ),
                 "data": None,
             }
@@ -383,7 +566,12 @@ class Resource:
         return handle_data_or_none
 
     def resolve(self):
-        self.repository.resolve()
+        self._build_link_templates()
+        self.repository.resolve(
+            related_repositories={
+                k: v.foreign_resource.repository for k, v in self._relations.items()
+            }
+        )
 
         if self.controller_extension != None and issubclass(
             self.controller_extension, CruddyController
@@ -405,10 +593,13 @@ class Resource:
             create_model_proxy=self._create_schema,
             update_model=self.schemas["update"],
             update_model_proxy=self._update_schema,
+            update_many_model=self.schemas["update_many"],
             single_schema=self.schemas["single"],
             many_schema=self.schemas["many"],
+            bulk_schema=self.schemas["bulk"],
             meta_schema=self._meta_schema,
             relations=self._relations,
+            protected_relationships=self._protected_relationships,
             policies_universal=self.policies["universal"],
             policies_create=self.policies["create"],
             policies_update=self.policies["update"],
@@ -416,10 +607,17 @@ class Resource:
             policies_get_one=self.policies["get_one"],
             policies_get_many=self.policies["get_many"],
             disable_create=self.disabled_endpoints["create"],
+            disable_create_many=self.disabled_endpoints["create_many"],
             disable_update=self.disabled_endpoints["update"],
             disable_delete=self.disabled_endpoints["delete"],
             disable_get_one=self.disabled_endpoints["get_one"],
             disable_get_many=self.disabled_endpoints["get_many"],
+            enable_update_many=self.enabled_endpoints["update_many"],
+            enable_delete_many=self.enabled_endpoints["delete_many"],
+            enable_export=self.enabled_endpoints["export"],
+            conditional_requests=self._conditional_requests,
+            fast_serialization=self._fast_serialization,
+            row_encoder=self.row_encoder,
         )
 
         if callable(self._on_resolution):
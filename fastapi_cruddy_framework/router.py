@@ -6,6 +6,7 @@ from os import path
 from fastapi import APIRouter
 from types import ModuleType
 from .resource import Resource
+from .batch import CreateBatchRouter
 
 
 # -------------------------------------------------------------------------------------------
@@ -43,20 +44,35 @@ def CreateRouterFromResources(
     application_module: ModuleType = ...,
     resource_path: str = "resources",
     common_resource_name: str = "resource",
+    enable_batch: bool = False,
+    batch_max_operations: int = 100,
+    batch_concurrency: int = 8,
 ) -> APIRouter:
     modules = getDirectoryModules(
         application_module=application_module, sub_module_path=resource_path
     )
     router = APIRouter()
+    resources = []
 
     # We delay binding routes to the router until all resources are ready
     for m in modules:
         module = m[1]
         resource = getattr(module, common_resource_name)
+        resources.append(resource)
 
         def setup(router: APIRouter = router, resource: Resource = resource):
             router.include_router(getattr(resource, "controller"))
 
         resource._on_resolution = setup
 
+    # POST /_batch runs operations against the routes of this router's resources
+    if enable_batch:
+        router.include_router(
+            CreateBatchRouter(
+                resources=resources,
+                max_operations=batch_max_operations,
+                concurrency=batch_concurrency,
+            )
+        )
+
     return router
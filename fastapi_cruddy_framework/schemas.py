@@ -1,5 +1,5 @@
 from sqlalchemy.orm import declared_attr, RelationshipProperty
-from typing import TypeVar, Optional, Generic, List, TYPE_CHECKING
+from typing import TypeVar, Optional, Generic, List, Dict, Any, Literal, TYPE_CHECKING
 from pydantic.generics import GenericModel
 from sqlmodel import Field, SQLModel
 from datetime import datetime
@@ -36,6 +36,12 @@ class BulkDTO(CruddyGenericModel):
     limit: int
     page: int
     data: List
+    next: Optional[str] = None
+    has_more: Optional[bool] = None
+    count_strategy: Optional[str] = None
+    # the version of the listed records, only set for conditional GETs
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
 
 
 class MetaObject(CruddyGenericModel):
@@ -43,6 +49,43 @@ class MetaObject(CruddyGenericModel):
     limit: int
     pages: int
     records: int
+    # opaque keyset cursor for the following page, only present in cursor mode
+    next: Optional[str] = None
+    # only present when the query fetched a look-ahead row (cursor mode or count "none")
+    has_more: Optional[bool] = None
+    # the count strategy that produced "pages" and "records"
+    count_strategy: Optional[str] = None
+
+
+class BulkWriteResponse(CruddyGenericModel):
+    # The response for filter based bulk updates and deletes
+    affected: int
+
+
+class BatchOperation(CruddyGenericModel):
+    # One request of a batch: a resource route's method and path (relative to the router
+    # the batch route is mounted on), its query parameters, and its JSON body
+    method: Literal["GET", "POST", "PATCH", "DELETE"]
+    path: str
+    query: Optional[Dict[str, Any]] = None
+    body: Optional[Any] = None
+
+
+class BatchRequest(CruddyGenericModel):
+    operations: List[BatchOperation]
+    # run every operation in one transaction, which is rolled back if any of them fails
+    transaction: bool = False
+
+
+class BatchResult(CruddyGenericModel):
+    # The status code and JSON body the operation's route responded with
+    status: int
+    body: Optional[Any] = None
+
+
+class BatchResponse(CruddyGenericModel):
+    # One result per operation, in the order the operations were sent
+    results: List[BatchResult]
 
 
 class PageResponse(CruddyGenericModel):
@@ -0,0 +1,188 @@
+import csv
+import io
+import json
+from datetime import date, time
+from uuid import UUID as BaseUUID
+from fastapi import Response
+from pydantic import BaseModel
+from pydantic.fields import ModelField, SHAPE_SINGLETON
+from pydantic.json import pydantic_encoder
+from pydantic.utils import lenient_issubclass
+from typing import Union, List, Dict, Tuple, Any, Callable, Type
+from .util import uuid_string
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# -------------------------------------------------------------------------------------------
+# JSON ENCODING
+# -------------------------------------------------------------------------------------------
+# orjson when it is installed, the standard library otherwise. Values neither of them
+# handle natively (UUID subclasses, Decimals, sets...) are encoded the way pydantic and
+# FastAPI encode them.
+if orjson != None:
+
+    def dump_json(value: Any) -> bytes:
+        return orjson.dumps(value, default=pydantic_encoder)
+
+else:
+
+    def dump_json(value: Any) -> bytes:
+        return json.dumps(
+            value, default=pydantic_encoder, separators=(",", ":"), ensure_ascii=False
+        ).encode("utf-8")
+
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+# CSV cells are text: temporal values in ISO format like the JSON responses, booleans
+# in lower case, and nested values as JSON
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (dict, list)):
+        return dump_json(value).decode("utf-8")
+    return value
+
+
+# -------------------------------------------------------------------------------------------
+# ROW ENCODER
+# -------------------------------------------------------------------------------------------
+# Writes the rows of a list query straight to JSON bytes, shaped exactly like the
+# resource's "many" response model with response_model_exclude_none: the response
+# schema's fields (by alias, None values left out), then the record's links. The field
+# list is compiled once per resource, so rows skip building a pydantic model each, and
+# FastAPI's validation of the whole envelope. Values are written as SQLAlchemy returns
+# them, without pydantic validation; UUID fields are the one exception, since drivers
+# may return them as undashed hex strings.
+class RowEncoder:
+    plural_name: str = None
+    primary_key: str = None
+
+    def __init__(
+        self,
+        schema: Type[BaseModel] = ...,
+        plural_name: str = ...,
+        primary_key: str = ...,
+        link_builder: Callable[[Any], Dict[str, str]] = ...,
+    ):
+        self.plural_name = plural_name
+        self.primary_key = primary_key
+        self.link_builder = link_builder
+        self.fields: List[Tuple[str, str, Union[Callable, None], ModelField]] = []
+        for name, field in schema.__fields__.items():
+            if name == "links" or name == "included":
+                continue
+            converter = None
+            if field.shape == SHAPE_SINGLETON and lenient_issubclass(
+                field.type_, BaseUUID
+            ):
+                converter = uuid_string
+            self.fields.append((name, field.alias, converter, field))
+
+    def encode_row(
+        self,
+        row: Any,
+        links: bool = True,
+        included: Union[Dict[str, Any], None] = None,
+    ) -> Dict[str, Any]:
+        mapping = row._mapping if hasattr(row, "_mapping") else row
+        encoded = {}
+        for name, alias, converter, field in self.fields:
+            if name in mapping:
+                value = mapping[name]
+            elif field.required:
+                continue
+            else:
+                value = field.get_default()
+            if value is None:
+                continue
+            encoded[alias] = converter(value) if converter != None else value
+        if links:
+            encoded["links"] = self.link_builder(id=mapping[self.primary_key])
+        if included != None:
+            encoded["included"] = included
+        return encoded
+
+    # included maps the ids of the rows to their included related records
+    def encode_many(
+        self,
+        rows: List[Any] = ...,
+        meta: BaseModel = ...,
+        links: bool = True,
+        included: Union[Dict[Any, Dict[str, Any]], None] = None,
+    ) -> bytes:
+        if included is None:
+            data = [self.encode_row(row, links) for row in rows]
+        else:
+            data = [
+                self.encode_row(
+                    row, links, included.get(row._mapping[self.primary_key], {})
+                )
+                for row in rows
+            ]
+        return dump_json(
+            {
+                self.plural_name: data,
+                "meta": meta.dict(by_alias=True, exclude_none=True),
+            }
+        )
+
+    # The exported rows hold the same values as list responses, without links: one JSON
+    # object per line for NDJSON, or one CSV line per row under a header of field aliases
+    def encode_ndjson(self, rows: List[Any] = ...) -> bytes:
+        return b"".join(
+            dump_json(self.encode_row(row, links=False)) + b"\n" for row in rows
+        )
+
+    # The CSV columns of an export: the response schema fields the rows were queried
+    # with, in schema order
+    def csv_fields(self, row: Union[Any, None] = None) -> List[str]:
+        mapping = row._mapping if hasattr(row, "_mapping") else row
+        return [
+            alias
+            for name, alias, _, _ in self.fields
+            if mapping is None or name in mapping
+        ]
+
+    def encode_csv(
+        self, rows: List[Any] = ..., fields: List[str] = ..., header: bool = False
+    ) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(
+            buffer, fieldnames=fields, restval="", extrasaction="ignore"
+        )
+        if header:
+            writer.writeheader()
+        for row in rows:
+            encoded = self.encode_row(row, links=False)
+            writer.writerow({k: _csv_value(v) for k, v in encoded.items()})
+        return buffer.getvalue().encode("utf-8")
+
+    # headers already set on the route's injected response (by policies, or ETags) are
+    # carried over
+    def response(
+        self,
+        rows: List[Any] = ...,
+        meta: BaseModel = ...,
+        response: Response = ...,
+        links: bool = True,
+        included: Union[Dict[Any, Dict[str, Any]], None] = None,
+    ) -> Response:
+        raw = Response(
+            content=self.encode_many(
+                rows=rows, meta=meta, links=links, included=included
+            ),
+            media_type="application/json",
+        )
+        raw.raw_headers.extend(response.raw_headers)
+        return raw
@@ -1,6 +1,11 @@
 import inspect
+import json
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as BinasciiError
+from datetime import datetime
+from uuid import UUID as BaseUUID
 from sqlalchemy.orm import class_mapper, object_mapper
-from typing import Union, Optional, Coroutine, Any, Callable
+from typing import Union, Optional, Coroutine, Any, Callable, List, Literal
 from .uuid import UUID
 
 
@@ -14,4 +19,86 @@ def get_pk(model):
 
 possible_id_types = Union[UUID, int, str]
 
+
+# The canonical (dashed, lower case) string of a UUID. Depending on the database, UUID
+# columns may come back as UUID objects or as undashed hex strings.
+def uuid_string(value: Any) -> str:
+    if value is None or isinstance(value, BaseUUID):
+        return str(value)
+    return str(BaseUUID(f"{value}"))
+
+
 lifecycle_types = Optional[Callable[..., Coroutine[Any, Any, Any]]]
+
+count_strategy_types = Literal["exact", "cached", "estimated", "none"]
+
+list_execution_types = Literal["parallel", "single"]
+
+relation_sync_types = Literal["diff", "replace"]
+
+replica_strategy_types = Literal["round_robin", "least_connections"]
+
+sqlite_profile_types = Literal["balanced", "durable", "fast"]
+
+export_format_types = Literal["ndjson", "csv"]
+
+
+# -------------------------------------------------------------------------------------------
+# KEYSET CURSORS
+# -------------------------------------------------------------------------------------------
+# A cursor is the list of sort key values (always ending with the primary key) of the last
+# record a client received, JSON encoded and then base64 encoded so it stays opaque and URL
+# safe. Datetimes reuse the "*datetime" wrapper from the "where" query language so they can
+# be rebuilt into real datetime objects before being bound to a query.
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values: List[Any]) -> str:
+    serializable = []
+    for value in values:
+        if isinstance(value, datetime):
+            value = {"*datetime": value.isoformat()}
+        elif isinstance(value, BaseUUID):
+            value = str(value)
+        serializable.append(value)
+    raw = json.dumps(serializable, separators=(",", ":")).encode("utf-8")
+    return urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(urlsafe_b64decode(padded.encode("ascii")))
+        decoded = []
+        for value in values:
+            if isinstance(value, dict) and "*datetime" in value:
+                value = datetime.fromisoformat(value["*datetime"])
+            decoded.append(value)
+    except (BinasciiError, ValueError, TypeError):
+        raise InvalidCursor(f"Invalid pagination cursor: {cursor}")
+    if not isinstance(values, list):
+        raise InvalidCursor(f"Invalid pagination cursor: {cursor}")
+    return decoded
+
+
+# Raised by filter based bulk updates and deletes when the where clause does not filter
+# anything, or when more rows would be affected than the resource allows. The transaction
+# is rolled back before this reaches the caller.
+class UnsafeBulkWrite(ValueError):
+    pass
+
+
+# Raised by list queries run for a conditional GET when the client's copy, identified by
+# its If-None-Match ETags, is still current. The page is never fetched.
+class NotModified(Exception):
+    def __init__(self, etag: str, last_modified: Union[datetime, None]):
+        super().__init__(etag)
+        self.etag = etag
+        self.last_modified = last_modified
+
+
+# Raised when the relationship writes of a create, update or set_relations call fail. The
+# record write shares their transaction, so it is rolled back as well.
+class RelationshipWriteError(RuntimeError):
+    pass
@@ -0,0 +1,215 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Optional, List, Dict, Tuple, Any
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlmodel import Field, Relationship, SQLModel
+from fastapi_cruddy_framework import (
+    UUID,
+    CruddyModel,
+    CruddyUUIDModel,
+    Resource,
+    ResourceRegistry,
+    SqliteAdapter,
+    CreateBatchRouter,
+)
+
+
+# The models every test app is built from: members with many notes, and many teams
+class TeamMemberLink(CruddyModel, table=True):
+    member_id: Optional[UUID] = Field(
+        default=None, foreign_key="Member.id", primary_key=True
+    )
+    team_id: Optional[UUID] = Field(
+        default=None, foreign_key="Team.id", primary_key=True
+    )
+
+
+class TeamUpdate(CruddyModel):
+    name: str
+
+
+class TeamCreate(TeamUpdate):
+    pass
+
+
+class TeamView(CruddyUUIDModel):
+    id: Optional[UUID]
+    name: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+class Team(CruddyUUIDModel, TeamCreate, table=True):
+    members: List["Member"] = Relationship(
+        back_populates="teams", link_model=TeamMemberLink
+    )
+
+
+class MemberUpdate(CruddyModel):
+    name: str
+    age: Optional[int]
+
+
+class MemberCreate(MemberUpdate):
+    pass
+
+
+class MemberView(CruddyUUIDModel):
+    id: Optional[UUID]
+    name: Optional[str]
+    age: Optional[int]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+class Member(CruddyUUIDModel, MemberCreate, table=True):
+    notes: List["Note"] = Relationship(back_populates="member")
+    teams: List["Team"] = Relationship(
+        back_populates="members", link_model=TeamMemberLink
+    )
+
+
+class NoteUpdate(CruddyModel):
+    content: str
+
+
+class NoteCreate(NoteUpdate):
+    member_id: Optional[UUID] = Field(default=None, foreign_key="Member.id")
+
+
+class NoteView(CruddyUUIDModel):
+    id: Optional[UUID]
+    member_id: Optional[UUID]
+    content: Optional[str]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+
+class Note(CruddyUUIDModel, NoteCreate, table=True):
+    member: Optional["Member"] = Relationship(back_populates="notes")
+
+
+class AppHarness:
+    def __init__(
+        self,
+        app: FastAPI = ...,
+        adapter: SqliteAdapter = ...,
+        resources: Dict[str, Resource] = ...,
+    ):
+        self.app = app
+        self.adapter = adapter
+        self.resources = resources
+        self.client = TestClient(app)
+
+    @property
+    def members(self) -> Resource:
+        return self.resources["members"]
+
+    @property
+    def notes(self) -> Resource:
+        return self.resources["notes"]
+
+    @property
+    def teams(self) -> Resource:
+        return self.resources["teams"]
+
+    def create_member(self, name: str = "member", age: Optional[int] = None) -> Dict:
+        response = self.client.post(
+            "/members", json={"member": {"name": name, "age": age}}
+        )
+        assert response.status_code == 200
+        return response.json()["member"]
+
+
+# Builds an app around a file database in tmp_path, with a registry of its own so every
+# test resolves fresh resources. Options are passed to all three resources, and
+# adapter_options to the SqliteAdapter. batch adds POST /_batch over those resources.
+def build_app(
+    tmp_path, adapter_options: Dict[str, Any] = {}, batch: bool = False, **options
+) -> AppHarness:
+    registry = ResourceRegistry()
+    Resource._set_registry(reg=registry)
+    adapter = SqliteAdapter(
+        db_path=os.path.join(tmp_path, "test.db"),
+        **{"mode": "file", "instrument": False, **adapter_options},
+    )
+
+    def resource(model, create_model, update_model, response_schema) -> Resource:
+        return Resource(
+            adapter=adapter,
+            id_type=UUID,
+            response_schema=response_schema,
+            resource_update_model=update_model,
+            resource_create_model=create_model,
+            resource_model=model,
+            **options,
+        )
+
+    async def setup() -> Dict[str, Resource]:
+        resources = {
+            "members": resource(Member, MemberCreate, MemberUpdate, MemberView),
+            "notes": resource(Note, NoteCreate, NoteUpdate, NoteView),
+            "teams": resource(Team, TeamCreate, TeamUpdate, TeamView),
+        }
+        # the registry resolves on the next cycle of the event loop
+        await asyncio.sleep(0)
+        assert registry.is_ready()
+        await adapter.destroy_then_create_all_tables_unsafe()
+        return resources
+
+    resources = asyncio.run(setup())
+    app = FastAPI()
+    for x in resources.values():
+        app.include_router(x.controller)
+    if batch:
+        app.include_router(CreateBatchRouter(resources=list(resources.values())))
+    return AppHarness(app=app, adapter=adapter, resources=resources)
+
+
+# Stand-ins for read replicas: separate database files that never receive the primary's
+# writes. Each holds one member named after it, so a list shows which database served it.
+def replica_paths(tmp_path, count: int = 2) -> List[str]:
+    return [os.path.join(tmp_path, f"replica{i}.db") for i in range(count)]
+
+
+def seed_replicas(adapter: SqliteAdapter):
+    async def seed():
+        for i, engine in enumerate(adapter.replica_engines):
+            async with engine.begin() as conn:
+                await conn.run_sync(SQLModel.metadata.drop_all)
+                await conn.run_sync(SQLModel.metadata.create_all)
+            async with adapter.asyncSessionGenerator(engine)() as session:
+                session.add(Member(name=f"replica{i}"))
+                await session.commit()
+
+    asyncio.run(seed())
+
+
+def records(response, key: str = "members") -> List[Dict]:
+    assert response.status_code == 200
+    return response.json()[key]
+
+
+def names(response, key: str = "members") -> List[str]:
+    return [x["name"] for x in records(response, key=key)]
+
+
+# Follows the next cursors of a cursor mode list, returning every row and the page count
+def page_through(
+    client: TestClient, path: str, params: Dict = {}, key: str = "members"
+) -> Tuple[List[Dict], int]:
+    rows = []
+    pages = 0
+    params = dict(params)
+    while True:
+        response = client.get(path, params=params)
+        assert response.status_code == 200
+        body = response.json()
+        rows += body[key]
+        pages += 1
+        cursor = body["meta"].get("next", None)
+        if cursor is None:
+            return rows, pages
+        params["after"] = cursor
@@ -0,0 +1,103 @@
+import threading
+import pytest
+from .helpers import build_app, names
+
+
+@pytest.fixture
+def harness(tmp_path):
+    return build_app(tmp_path, batch=True)
+
+
+def batch(harness, operations, transaction: bool = False) -> list:
+    response = harness.client.post(
+        "/_batch", json={"operations": operations, "transaction": transaction}
+    )
+    assert response.status_code == 200
+    return response.json()["results"]
+
+
+def test_batches_run_every_operation_in_order(harness):
+    member = harness.create_member(name="existing")
+    results = batch(
+        harness,
+        [
+            {"method": "POST", "path": "/members", "body": {"member": {"name": "new"}}},
+            {"method": "GET", "path": "/members", "query": {"sort": ["name asc"]}},
+            {
+                "method": "GET",
+                "path": f"/members/{member['id']}",
+                "query": {"columns": ["name"], "links": False},
+            },
+            {"method": "GET", "path": "/members", "query": {"where": {"name": "new"}}},
+            {"method": "DELETE", "path": f"/members/{member['id']}"},
+        ],
+    )
+    assert [x["status"] for x in results] == [200] * 5
+    assert results[0]["body"]["member"]["name"] == "new"
+    assert [x["name"] for x in results[1]["body"]["members"]] == ["existing", "new"]
+    assert results[2]["body"]["member"] == {"id": member["id"], "name": "existing"}
+    assert [x["name"] for x in results[3]["body"]["members"]] == ["new"]
+    assert names(harness.client.get("/members")) == ["new"]
+
+
+def test_failed_operations_report_their_own_status(harness):
+    results = batch(
+        harness,
+        [
+            {"method": "GET", "path": "/nowhere"},
+            {"method": "PATCH", "path": "/members"},
+            {"method": "POST", "path": "/members", "body": {"member": {}}},
+            {"method": "POST", "path": "/members", "body": {"member": {"name": "ok"}}},
+        ],
+    )
+    assert [x["status"] for x in results] == [404, 405, 422, 200]
+    assert names(harness.client.get("/members")) == ["ok"]
+
+
+def test_transactions_roll_back_on_the_first_failure(harness):
+    member = harness.create_member(name="kept")
+    results = batch(
+        harness,
+        [
+            {"method": "POST", "path": "/members", "body": {"member": {"name": "new"}}},
+            {"method": "DELETE", "path": f"/members/{member['id']}"},
+            {"method": "POST", "path": "/members", "body": {"member": {}}},
+            {"method": "GET", "path": "/members"},
+        ],
+        transaction=True,
+    )
+    assert [x["status"] for x in results] == [424, 424, 422, 424]
+    assert results[0]["body"] == {"detail": "Rolled back, operation 2 failed"}
+    assert names(harness.client.get("/members")) == ["kept"]
+
+    results = batch(
+        harness,
+        [
+            {"method": "POST", "path": "/members", "body": {"member": {"name": "new"}}},
+            {"method": "GET", "path": "/members", "query": {"sort": ["name asc"]}},
+        ],
+        transaction=True,
+    )
+    assert [x["status"] for x in results] == [200, 200]
+    # operations of a transaction read its earlier writes
+    assert [x["name"] for x in results[1]["body"]["members"]] == ["kept", "new"]
+
+
+def test_sync_routes_run_in_the_threadpool(harness):
+    threads = []
+
+    @harness.members.controller.get("/sync/ping")
+    def ping():
+        threads.append(threading.get_ident())
+        return {"pong": True}
+
+    results = batch(harness, [{"method": "GET", "path": "/members/sync/ping"}])
+    assert results == [{"status": 200, "body": {"pong": True}}]
+    assert threads != [threading.get_ident()] and len(threads) == 1
+
+
+def test_batches_are_capped(harness):
+    operations = [{"method": "GET", "path": "/members"}] * 101
+    response = harness.client.post("/_batch", json={"operations": operations})
+    assert response.status_code == 400
+    assert len(batch(harness, operations[:100])) == 100
@@ -0,0 +1,110 @@
+import asyncio
+from typing import Optional
+import pytest
+from fastapi import HTTPException
+from sqlmodel import Field, select
+from fastapi_cruddy_framework import UUID, AbstractRepository, CruddyUUIDModel
+from .helpers import build_app, names
+
+
+# A table with a server side default, created along with the helpers' tables
+class Counter(CruddyUUIDModel, table=True):
+    label: str
+    hits: Optional[int] = Field(default=None, sa_column_kwargs={"server_default": "7"})
+
+
+@pytest.fixture
+def harness(tmp_path):
+    return build_app(tmp_path, list_cache_size=100, list_cache_ttl=60)
+
+
+def test_bulk_creates_every_record(harness):
+    client = harness.client
+    assert names(client.get("/members")) == []
+    response = client.post(
+        "/members/bulk",
+        json=[{"member": {"name": f"m{i}", "age": i}} for i in range(3)],
+    )
+    created = names(response)
+    assert created == ["m0", "m1", "m2"]
+    assert len({x["id"] for x in response.json()["members"]}) == 3
+    # the bulk write retires cached lists
+    listed = client.get("/members", params={"sort": ["age asc"]})
+    assert names(listed) == created
+
+
+def test_bulk_creates_relationships(harness):
+    client = harness.client
+    team = client.post("/teams", json={"team": {"name": "team"}}).json()["team"]
+    response = client.post(
+        "/members/bulk",
+        json=[
+            {"member": {"name": "in team", "teams": [team["id"]]}},
+            {"member": {"name": "alone"}},
+        ],
+    )
+    in_team = response.json()["members"][0]
+    assert names(client.get(f"/teams/{team['id']}/members")) == ["in team"]
+    assert names(client.get(f"/members/{in_team['id']}/teams"), key="teams") == ["team"]
+
+
+def test_bulk_creates_nothing_when_a_relationship_write_fails(harness):
+    client = harness.client
+    team = client.post("/teams", json={"team": {"name": "team"}}).json()["team"]
+
+    async def deny(relation_conf):
+        raise HTTPException(status_code=403, detail="denied")
+
+    harness.members.repository.lifecycle["before_set_relations"] = deny
+    response = client.post(
+        "/members/bulk",
+        json=[
+            {"member": {"name": "alone"}},
+            {"member": {"name": "in team", "teams": [team["id"]]}},
+        ],
+    )
+    assert response.status_code == 403
+    assert names(client.get("/members")) == []
+
+
+def test_bulk_creates_leave_defaults_to_the_database(harness):
+    repository = AbstractRepository(
+        adapter=harness.adapter,
+        update_model=Counter,
+        create_model=Counter,
+        model=Counter,
+        id_type=UUID,
+        bulk_create_chunk_size=2,
+    )
+    repository.resolve()
+
+    async def run():
+        await repository.create_many(
+            data=[
+                Counter(label="unset"),
+                Counter(label="set", hits=3),
+                Counter(label="also unset"),
+            ]
+        )
+        async with harness.adapter.getSession() as session:
+            rows = await session.execute(select(Counter.label, Counter.hits))
+            return dict(rows.all())
+
+    assert asyncio.run(run()) == {"unset": 7, "set": 3, "also unset": 7}
+
+
+def test_bulk_create_hooks(harness):
+    seen = []
+    lifecycle = harness.members.repository.lifecycle
+
+    async def before_create_many(records):
+        seen.append(len(records))
+        for record in records:
+            record.name = record.name.upper()
+
+    lifecycle["before_create_many"] = before_create_many
+    response = harness.client.post(
+        "/members/bulk", json=[{"member": {"name": "a"}}, {"member": {"name": "b"}}]
+    )
+    assert names(response) == ["A", "B"]
+    assert seen == [2]
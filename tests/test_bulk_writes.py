@@ -0,0 +1,83 @@
+import pytest
+from .helpers import build_app, names
+
+
+@pytest.fixture
+def harness(tmp_path):
+    harness = build_app(
+        tmp_path,
+        enable_update_many=True,
+        enable_delete_many=True,
+        bulk_write_max_rows=3,
+    )
+    for i in range(5):
+        harness.create_member(name=f"m{i}", age=i)
+    return harness
+
+
+def ages(harness, name: str) -> list:
+    response = harness.client.get("/members", params={"sort": ["age asc"]})
+    return [x["age"] for x in response.json()["members"] if x["name"] == name]
+
+
+def test_update_many_sets_values_on_matching_records(harness):
+    response = harness.client.patch(
+        "/members",
+        params={"where": '{"age": {"*lt": 2}}'},
+        json={"member": {"name": "young"}},
+    )
+    assert response.json() == {"affected": 2}
+    assert ages(harness, "young") == [0, 1]
+    # values left out of the payload are not touched
+    assert ages(harness, "m2") == [2]
+
+
+def test_delete_many_removes_matching_records(harness):
+    client = harness.client
+    response = client.delete("/members", params={"where": '{"age": {"*gte": 3}}'})
+    assert response.json() == {"affected": 2}
+    assert names(client.get("/members", params={"sort": ["age asc"]})) == [
+        "m0",
+        "m1",
+        "m2",
+    ]
+
+
+@pytest.mark.parametrize(
+    "where", ["{}", '{"*or": []}', '{"*and": [{"*or": []}, {}]}', '{"nope": 1}']
+)
+def test_unfiltered_bulk_writes_are_rejected(harness, where):
+    client = harness.client
+    response = client.patch(
+        "/members", params={"where": where}, json={"member": {"name": "all"}}
+    )
+    assert response.status_code == 400
+    assert client.delete("/members", params={"where": where}).status_code == 400
+    assert len(names(client.get("/members"))) == 5
+
+
+def test_bulk_writes_past_the_row_cap_are_rolled_back(harness):
+    client = harness.client
+    where = '{"age": {"*gte": 1}}'
+    response = client.patch(
+        "/members", params={"where": where}, json={"member": {"name": "many"}}
+    )
+    assert response.status_code == 400
+    assert ages(harness, "many") == []
+    assert client.delete("/members", params={"where": where}).status_code == 400
+    assert len(names(client.get("/members"))) == 5
+    # at the cap is fine
+    response = client.delete("/members", params={"where": '{"age": {"*gte": 2}}'})
+    assert response.json() == {"affected": 3}
+
+
+def test_bulk_write_routes_are_opt_in(tmp_path):
+    harness = build_app(tmp_path)
+    harness.create_member()
+    client = harness.client
+    where = '{"name": "member"}'
+    response = client.patch(
+        "/members", params={"where": where}, json={"member": {"name": "x"}}
+    )
+    assert response.status_code == 405
+    assert client.delete("/members", params={"where": where}).status_code == 405
@@ -0,0 +1,95 @@
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+import pytest
+from .helpers import build_app, names
+
+
+@pytest.fixture
+def harness(tmp_path):
+    return build_app(tmp_path, conditional_requests=True)
+
+
+def etag_of(response) -> str:
+    assert response.status_code == 200
+    return response.headers["etag"]
+
+
+def test_unchanged_lists_are_not_modified(harness):
+    client = harness.client
+    harness.create_member(name="a")
+    etag = etag_of(client.get("/members"))
+    response = client.get("/members", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+    # weak comparison, and any of several tags
+    response = client.get("/members", headers={"If-None-Match": f'"x", W/{etag}'})
+    assert response.status_code == 304
+    # each query, and each representation, has an ETag of its own
+    assert etag_of(client.get("/members", params={"limit": 5})) != etag
+    assert etag_of(client.get("/members", params={"links": False})) != etag
+
+
+def test_list_etags_change_with_writes(harness):
+    client = harness.client
+    member = harness.create_member(name="before")
+    etag = etag_of(client.get("/members"))
+    response = client.patch(
+        f"/members/{member['id']}", json={"member": {"name": "after"}}
+    )
+    assert response.status_code == 200
+    response = client.get("/members", headers={"If-None-Match": etag})
+    assert names(response) == ["after"]
+    assert etag_of(response) != etag
+
+    etag = etag_of(response)
+    harness.create_member(name="second")
+    assert client.get("/members", headers={"If-None-Match": etag}).status_code == 200
+    etag = etag_of(client.get("/members"))
+    assert client.delete(f"/members/{member['id']}").status_code == 200
+    response = client.get("/members", headers={"If-None-Match": etag})
+    assert names(response) == ["second"]
+
+
+def test_relationship_list_etags_change_with_link_writes(harness):
+    client = harness.client
+    member = harness.create_member(name="member")
+    team = client.post("/teams", json={"team": {"name": "team"}}).json()["team"]
+    path = f"/members/{member['id']}/teams"
+    etag = etag_of(client.get(path))
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+    # link rows have no updated_at, so the ETag follows the origin record
+    response = client.post(f"/teams/{team['id']}/members", json=[member["id"]])
+    assert response.json() == {"affected": 1}
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert names(response, key="teams") == ["team"]
+    assert etag_of(response) != etag
+
+
+def test_unchanged_records_are_not_modified(harness):
+    client = harness.client
+    member = harness.create_member(name="before")
+    path = f"/members/{member['id']}"
+    response = client.get(path)
+    etag = etag_of(response)
+    assert "last-modified" in response.headers
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+    later = format_datetime(datetime.now(timezone.utc) + timedelta(hours=1), True)
+    assert client.get(path, headers={"If-Modified-Since": later}).status_code == 304
+    earlier = format_datetime(datetime.now(timezone.utc) - timedelta(hours=1), True)
+    assert client.get(path, headers={"If-Modified-Since": earlier}).status_code == 200
+
+    response = client.patch(path, json={"member": {"name": "after"}})
+    assert response.status_code == 200
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.json()["member"]["name"] == "after"
+    assert etag_of(response) != etag
+
+
+def test_conditional_requests_are_off_by_default(tmp_path):
+    harness = build_app(tmp_path)
+    member = harness.create_member()
+    for path in ("/members", f"/members/{member['id']}"):
+        response = harness.client.get(path, headers={"If-None-Match": "*"})
+        assert response.status_code == 200
+        assert "etag" not in response.headers
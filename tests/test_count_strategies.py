@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import pytest
+from .helpers import build_app, names
+
+
+def run_sql(tmp_path, statement: str):
+    connection = sqlite3.connect(os.path.join(tmp_path, "test.db"))
+    try:
+        connection.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def meta(response) -> dict:
+    assert response.status_code == 200
+    return response.json()["meta"]
+
+
+@pytest.fixture(params=["parallel", "single"])
+def harness(tmp_path, request):
+    harness = build_app(tmp_path, list_execution=request.param)
+    for i in range(5):
+        harness.create_member(name=f"m{i}", age=i)
+    return harness
+
+
+def test_exact_counts(harness):
+    client = harness.client
+    assert meta(client.get("/members", params={"limit": 2})) == {
+        "page": 1,
+        "limit": 2,
+        "pages": 3,
+        "records": 5,
+        "count_strategy": "exact",
+    }
+    where = '{"age": {"*gte": 3}}'
+    filtered = meta(client.get("/members", params={"limit": 2, "where": where}))
+    assert (filtered["records"], filtered["pages"]) == (2, 1)
+    # a page past the end still reports the total
+    past = meta(client.get("/members", params={"limit": 2, "page": 9}))
+    assert (past["records"], past["pages"]) == (5, 3)
+
+
+def test_none_skips_the_count_and_reports_has_more(harness):
+    client = harness.client
+    first = meta(client.get("/members", params={"limit": 2, "count": "none"}))
+    assert first["count_strategy"] == "none"
+    assert first["has_more"] is True
+    assert (first["records"], first["pages"]) == (2, 2)
+    last = client.get("/members", params={"limit": 2, "page": 3, "count": "none"})
+    assert names(last) == ["m4"]
+    assert meta(last)["has_more"] is False
+    assert (meta(last)["records"], meta(last)["pages"]) == (5, 3)
+
+
+def test_cached_counts_last_until_the_resource_writes(harness, tmp_path):
+    client = harness.client
+    params = {"limit": 2, "count": "cached"}
+    assert meta(client.get("/members", params=params))["records"] == 5
+    # a write made outside the repository is not seen until the cached count expires
+    run_sql(tmp_path, "DELETE FROM Member WHERE name = 'm0'")
+    cached = meta(client.get("/members", params=params))
+    assert (cached["records"], cached["count_strategy"]) == (5, "cached")
+    # each where clause has a count of its own
+    where = '{"age": {"*gte": 3}}'
+    assert (
+        meta(client.get("/members", params={**params, "where": where}))["records"] == 2
+    )
+    # a write through the repository clears the cached counts
+    harness.create_member(name="m5")
+    assert meta(client.get("/members", params=params))["records"] == 5
+    assert names(client.get("/members", params={"limit": 10}))[0] == "m1"
+
+
+def test_estimated_counts_read_table_statistics(harness, tmp_path):
+    client = harness.client
+    params = {"limit": 2, "count": "estimated"}
+    # SQLite has no statistics before ANALYZE runs, so the count is exact
+    assert meta(client.get("/members", params=params))["count_strategy"] == "exact"
+    run_sql(tmp_path, "ANALYZE")
+    run_sql(tmp_path, "DELETE FROM Member WHERE name = 'm0'")
+    estimated = meta(client.get("/members", params=params))
+    assert (estimated["records"], estimated["count_strategy"]) == (5, "estimated")
+    # statistics can't count filtered queries
+    where = '{"age": {"*gte": 3}}'
+    filtered = meta(client.get("/members", params={**params, "where": where}))
+    assert (filtered["records"], filtered["count_strategy"]) == (2, "exact")
+
+
+def test_resource_count_strategy_is_the_default(tmp_path):
+    harness = build_app(tmp_path, count_strategy="none")
+    harness.create_member()
+    client = harness.client
+    assert meta(client.get("/members"))["count_strategy"] == "none"
+    exact = meta(client.get("/members", params={"count": "exact"}))
+    assert exact["count_strategy"] == "exact"
@@ -0,0 +1,123 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+from .helpers import build_app, page_through, records
+
+
+# Ages repeat and some are NULL, so the walks below cross ties and NULL runs
+AGES = [30, None, 25, 30, None, 41, 25, 30, None, 19, 41, 25, 30]
+
+
+@pytest.fixture
+def harness(tmp_path):
+    harness = build_app(tmp_path)
+    for i, age in enumerate(AGES):
+        harness.create_member(name=f"m{i:02d}", age=age)
+    return harness
+
+
+def names_of(rows):
+    return [x["name"] for x in rows]
+
+
+@pytest.mark.parametrize(
+    "sort", [[], ["age"], ["age desc"], ["age", "name desc"], ["name desc"]]
+)
+def test_cursor_walk_neither_skips_nor_repeats_rows(harness, sort):
+    client = harness.client
+    expected = names_of(
+        records(client.get("/members", params={"sort": sort, "limit": 100}))
+    )
+    for limit in (1, 2, 5):
+        rows, pages = page_through(
+            client, "/members", {"sort": sort, "limit": limit, "after": ""}
+        )
+        assert names_of(rows) == expected
+        assert pages == -(-len(AGES) // limit)
+
+
+def test_cursor_walk_resumes_after_null_sort_values(harness):
+    client = harness.client
+    sort = ["age", "name"]
+    ordered = names_of(
+        records(client.get("/members", params={"sort": sort, "limit": 100}))
+    )
+    # the first page ends inside the run of NULL ages, which SQLite sorts first
+    first = client.get("/members", params={"sort": sort, "limit": 2, "after": ""})
+    assert [x.get("age") for x in records(first)] == [None, None]
+    rest, _ = page_through(
+        client,
+        "/members",
+        {"sort": sort, "limit": 100, "after": first.json()["meta"]["next"]},
+    )
+    assert names_of(records(first)) + names_of(rest) == ordered
+
+
+def test_cursor_values_are_not_returned_unless_selected(harness):
+    client = harness.client
+    params = {"columns": ["name"], "sort": ["created_at"], "limit": 3, "after": ""}
+    rows, _ = page_through(client, "/members", params)
+    assert len(rows) == len(AGES)
+    for row in rows:
+        assert set(row.keys()) == {"id", "name", "links"}
+    response = client.get("/members", params={**params, "links": False})
+    assert set(records(response)[0].keys()) == {"id", "name"}
+
+
+def test_cursor_that_does_not_match_the_sort_is_rejected(harness):
+    client = harness.client
+    first = client.get("/members", params={"sort": ["age"], "limit": 2, "after": ""})
+    cursor = first.json()["meta"]["next"]
+    response = client.get(
+        "/members", params={"sort": ["age", "name"], "limit": 2, "after": cursor}
+    )
+    assert response.status_code == 400
+    response = client.get("/members", params={"limit": 2, "after": "not a cursor"})
+    assert response.status_code == 400
+
+
+def test_relationship_lists_page_by_cursor(harness):
+    client = harness.client
+    member = harness.create_member(name="author")
+    for i in range(7):
+        response = client.post(
+            "/notes", json={"note": {"content": f"n{i}", "member_id": member["id"]}}
+        )
+        assert response.status_code == 200
+    rows, pages = page_through(
+        client,
+        f"/members/{member['id']}/notes",
+        {"sort": ["content desc"], "limit": 3, "after": ""},
+        key="notes",
+    )
+    assert [x["content"] for x in rows] == [f"n{i}" for i in reversed(range(7))]
+    assert pages == 3
+
+
+# PostgreSQL sorts NULL above every value, so a seek past a value also takes the NULLs
+def test_keyset_seek_follows_the_null_ordering(harness):
+    repository = harness.members.repository
+    member = repository.model
+    sorts = [(member.age, "asc"), (member.id, "asc")]
+
+    def render(values, nulls_first):
+        criteria = repository.keyset_forge(
+            sorts=sorts, values=values, nulls_first=nulls_first
+        )
+        compiled = criteria.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+        return " ".join(str(compiled).split())
+
+    assert render([None, "a"], True) == (
+        '"Member".age IS NOT NULL OR "Member".age IS NULL AND "Member".id > \'a\''
+    )
+    assert render([None, "a"], False) == (
+        '"Member".age IS NULL AND "Member".id > \'a\''
+    )
+    assert render([3, "a"], False) == (
+        '"Member".age > 3 OR "Member".age IS NULL '
+        'OR "Member".age = 3 AND "Member".id > \'a\''
+    )
+    assert render([3, "a"], True) == (
+        '"Member".age > 3 OR "Member".age = 3 AND "Member".id > \'a\''
+    )
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sqlite3
+import pytest
+from fastapi_cruddy_framework import UUID, AbstractRepository, LRUCache
+from .helpers import Member, MemberCreate, MemberUpdate, build_app, names
+
+
+def run_sql(tmp_path, statement: str):
+    connection = sqlite3.connect(os.path.join(tmp_path, "test.db"))
+    try:
+        connection.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def member_names(result) -> list:
+    return sorted(x._mapping["name"] for x in result.data)
+
+
+@pytest.fixture
+def harness(tmp_path):
+    return build_app(tmp_path, list_cache_size=100, list_cache_ttl=60)
+
+
+def test_lists_are_served_from_the_cache(harness, tmp_path):
+    client = harness.client
+    harness.create_member(name="a")
+    assert names(client.get("/members")) == ["a"]
+    # rows changed outside the repository are served from the cache
+    run_sql(tmp_path, "UPDATE Member SET name = 'outside'")
+    assert names(client.get("/members")) == ["a"]
+    # every query has an entry of its own
+    assert names(client.get("/members", params={"limit": 5})) == ["outside"]
+
+
+def test_a_patch_retires_cached_lists(harness):
+    client = harness.client
+    member = harness.create_member(name="before")
+    assert names(client.get("/members")) == ["before"]
+    response = client.patch(
+        f"/members/{member['id']}", json={"member": {"name": "after"}}
+    )
+    assert response.status_code == 200
+    assert names(client.get("/members")) == ["after"]
+    assert client.delete(f"/members/{member['id']}").status_code == 200
+    assert names(client.get("/members")) == []
+
+
+def test_relationship_writes_retire_both_sides_lists(harness):
+    client = harness.client
+    member = harness.create_member(name="member")
+    team = client.post("/teams", json={"team": {"name": "team"}}).json()["team"]
+    teams_of_member = f"/members/{member['id']}/teams"
+    members_of_team = f"/teams/{team['id']}/members"
+    assert names(client.get(teams_of_member), key="teams") == []
+    assert names(client.get(members_of_team)) == []
+    response = client.post(members_of_team, json=[member["id"]])
+    assert response.json() == {"affected": 1}
+    assert names(client.get(teams_of_member), key="teams") == ["team"]
+    assert names(client.get(members_of_team)) == ["member"]
+    response = client.delete(teams_of_member, params={"ids": [team["id"]]})
+    assert response.json() == {"affected": 1}
+    assert names(client.get(teams_of_member), key="teams") == []
+    assert names(client.get(members_of_team)) == []
+
+
+# Two repositories sharing one backend stand in for two processes sharing a cache server
+def test_generations_are_shared_through_the_backend(tmp_path):
+    shared = LRUCache(max_size=100)
+    harness = build_app(tmp_path, list_cache=shared, list_cache_ttl=60)
+    first = harness.members.repository
+    second = AbstractRepository(
+        adapter=harness.adapter,
+        update_model=MemberUpdate,
+        create_model=MemberCreate,
+        model=Member,
+        id_type=UUID,
+        list_cache=shared,
+        list_cache_ttl=60,
+    )
+    second.resolve()
+
+    async def run():
+        await first.create(data=MemberCreate(name="a"))
+        cached = member_names(await first.get_all())
+        await second.create(data=MemberCreate(name="b"))
+        return cached, member_names(await first.get_all())
+
+    assert asyncio.run(run()) == (["a"], ["a", "b"])
+
+
+def test_stale_lists_are_served_while_they_refresh(tmp_path):
+    harness = build_app(
+        tmp_path, list_cache_size=100, list_cache_ttl=0.1, list_cache_stale_ttl=60
+    )
+    repository = harness.members.repository
+
+    async def run():
+        await repository.create(data=MemberCreate(name="a"))
+        first = member_names(await repository.get_all())
+        run_sql(tmp_path, "UPDATE Member SET name = 'outside'")
+        await asyncio.sleep(0.2)
+        # expired, so the stale result is returned and refreshed in the background
+        stale = member_names(await repository.get_all())
+        while len(repository._list_refreshes) > 0:
+            await asyncio.sleep(0.01)
+        return first, stale, member_names(await repository.get_all())
+
+    assert asyncio.run(run()) == (["a"], ["a"], ["outside"])
+
+
+def test_shared_sessions_bypass_the_cache_once_they_wrote(harness):
+    repository = harness.members.repository
+    adapter = harness.adapter
+
+    async def run():
+        await repository.create(data=MemberCreate(name="committed"))
+        cached = member_names(await repository.get_all())
+        try:
+            async with adapter.transaction():
+                # before writing, the transaction still reads the cache
+                clean = member_names(await repository.get_all())
+                await repository.create(data=MemberCreate(name="uncommitted"))
+                seen = member_names(await repository.get_all())
+                raise RuntimeError("roll back")
+        except RuntimeError:
+            pass
+        return cached, clean, seen, member_names(await repository.get_all())
+
+    committed = ["committed"]
+    both = ["committed", "uncommitted"]
+    assert asyncio.run(run()) == (committed, committed, both, committed)
+
+
+def test_lists_cached_during_a_transaction_are_retired_once_it_commits(harness):
+    repository = harness.members.repository
+    adapter = harness.adapter
+
+    async def read_elsewhere():
+        # outside the transaction's session, so the committed list is read and cached
+        adapter._request_session.set(None)
+        return member_names(await repository.get_all())
+
+    async def run():
+        member = await repository.create(data=MemberCreate(name="old"))
+        async with adapter.transaction():
+            await repository.update(id=member.id, data=MemberUpdate(name="new"))
+            during = await asyncio.create_task(read_elsewhere())
+        return during, member_names(await repository.get_all())
+
+    assert asyncio.run(run()) == (["old"], ["new"])
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import sqlite3
+import time
+import pytest
+from .helpers import MemberUpdate, build_app
+
+
+def run_sql(tmp_path, statement: str):
+    connection = sqlite3.connect(os.path.join(tmp_path, "test.db"))
+    try:
+        connection.execute(statement)
+        connection.commit()
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def harness(tmp_path):
+    return build_app(
+        tmp_path,
+        record_cache_size=100,
+        enable_update_many=True,
+        enable_delete_many=True,
+    )
+
+
+def get_member(harness, id) -> dict:
+    response = harness.client.get(f"/members/{id}")
+    assert response.status_code == 200
+    return response.json().get("member", None)
+
+
+def test_get_by_id_reads_through_the_cache(harness, tmp_path):
+    member = harness.create_member(name="cached")
+    assert get_member(harness, member["id"])["name"] == "cached"
+    # rows changed outside the repository are served from the cache
+    run_sql(tmp_path, "UPDATE Member SET name = 'outside'")
+    assert get_member(harness, member["id"])["name"] == "cached"
+    stats = harness.members.repository.record_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+    # projections are answered from the cached record too
+    response = harness.client.get(
+        f"/members/{member['id']}", params={"columns": ["name"], "links": False}
+    )
+    assert response.json()["member"] == {"id": member["id"], "name": "cached"}
+
+
+def test_writes_invalidate_cached_records(harness):
+    client = harness.client
+    member = harness.create_member(name="before")
+    assert get_member(harness, member["id"])["name"] == "before"
+    response = client.patch(
+        f"/members/{member['id']}", json={"member": {"name": "patched"}}
+    )
+    assert response.status_code == 200
+    assert get_member(harness, member["id"])["name"] == "patched"
+
+    response = client.patch(
+        "/members",
+        params={"where": '{"name": "patched"}'},
+        json={"member": {"name": "bulk patched"}},
+    )
+    assert response.json() == {"affected": 1}
+    assert get_member(harness, member["id"])["name"] == "bulk patched"
+
+    assert client.delete(f"/members/{member['id']}").status_code == 200
+    assert get_member(harness, member["id"]) is None
+
+
+def test_bulk_deletes_invalidate_cached_records(harness):
+    member = harness.create_member(name="doomed")
+    assert get_member(harness, member["id"]) != None
+    response = harness.client.delete("/members", params={"where": '{"name": "doomed"}'})
+    assert response.json() == {"affected": 1}
+    assert get_member(harness, member["id"]) is None
+
+
+def test_moving_a_foreign_key_invalidates_the_far_records(harness):
+    client = harness.client
+    first = harness.create_member(name="first")
+    second = harness.create_member(name="second")
+    note = client.post(
+        "/notes", json={"note": {"content": "n", "member_id": first["id"]}}
+    ).json()["note"]
+    assert client.get(f"/notes/{note['id']}").json()["note"]["member_id"] == first["id"]
+    response = client.post(f"/members/{second['id']}/notes", json=[note["id"]])
+    assert response.json() == {"affected": 1}
+    cached = client.get(f"/notes/{note['id']}").json()["note"]
+    assert cached["member_id"] == second["id"]
+
+
+def test_cached_records_expire(tmp_path):
+    harness = build_app(tmp_path, record_cache_size=100, record_cache_ttl=0.2)
+    member = harness.create_member(name="cached")
+    get_member(harness, member["id"])
+    run_sql(tmp_path, "UPDATE Member SET name = 'outside'")
+    assert get_member(harness, member["id"])["name"] == "cached"
+    time.sleep(0.3)
+    assert get_member(harness, member["id"])["name"] == "outside"
+    assert harness.members.repository.record_cache.stats()["expirations"] == 1
+
+
+def test_invalidate_records_drops_records_by_hand(harness, tmp_path):
+    member = harness.create_member(name="cached")
+    get_member(harness, member["id"])
+    run_sql(tmp_path, "UPDATE Member SET name = 'outside'")
+    asyncio.run(harness.members.repository.invalidate_records())
+    assert get_member(harness, member["id"])["name"] == "outside"
+
+
+def test_shared_sessions_never_cache_uncommitted_records(harness):
+    repository = harness.members.repository
+    adapter = harness.adapter
+    member = harness.create_member(name="committed")
+
+    async def run():
+        try:
+            async with adapter.transaction():
+                await repository.update(
+                    id=member["id"], data=MemberUpdate(name="uncommitted")
+                )
+                # the transaction reads its own write, bypassing the cache
+                seen = (await repository.get_by_id(id=member["id"])).name
+                raise RuntimeError("roll back")
+        except RuntimeError:
+            pass
+        return seen, (await repository.get_by_id(id=member["id"])).name
+
+    assert asyncio.run(run()) == ("uncommitted", "committed")
+
+
+def test_reads_cached_during_a_transaction_are_dropped_once_it_commits(harness):
+    repository = harness.members.repository
+    adapter = harness.adapter
+    member = harness.create_member(name="old")
+
+    async def read_elsewhere():
+        # outside the transaction's session, so the committed record is read and cached
+        adapter._request_session.set(None)
+        return (await repository.get_by_id(id=member["id"])).name
+
+    async def run():
+        async with adapter.transaction():
+            await repository.update(id=member["id"], data=MemberUpdate(name="new"))
+            during = await asyncio.create_task(read_elsewhere())
+        return during, (await repository.get_by_id(id=member["id"])).name
+
+    assert asyncio.run(run()) == ("old", "new")
@@ -0,0 +1,98 @@
+import pytest
+from fastapi import HTTPException
+from .helpers import Member, MemberUpdate, build_app
+
+
+@pytest.fixture
+def harness(tmp_path):
+    return build_app(tmp_path)
+
+
+def create_note(harness, member_id=None) -> dict:
+    response = harness.client.post(
+        "/notes", json={"note": {"content": "note", "member_id": member_id}}
+    )
+    assert response.status_code == 200
+    return response.json()["note"]
+
+
+# GET /notes/{id}/member runs the member resource's get one hooks
+def hook_events(harness, before=None):
+    events = []
+    lifecycle = harness.members.repository.lifecycle
+
+    async def before_get_one(id):
+        events.append(("before", str(id) if id != None else None))
+        if before != None:
+            await before(id)
+
+    async def after_get_one(record):
+        events.append(("after", record))
+
+    lifecycle["before_get_one"] = before_get_one
+    lifecycle["after_get_one"] = after_get_one
+    return events
+
+
+def test_foreign_before_hook_runs_before_the_record_is_read(harness):
+    member = harness.create_member(name="original")
+    note = create_note(harness, member_id=member["id"])
+    repository = harness.members.repository
+
+    async def rename(id):
+        await repository.update(id=id, data=MemberUpdate(name="renamed"))
+
+    events = hook_events(harness, before=rename)
+    response = harness.client.get(f"/notes/{note['id']}/member")
+    assert response.status_code == 200
+    assert response.json()["member"]["name"] == "renamed"
+    assert [x[0] for x in events] == ["before", "after"]
+    assert events[0][1] == member["id"]
+    assert isinstance(events[1][1], Member)
+
+
+def test_foreign_before_hook_can_guard_the_route(harness):
+    member = harness.create_member()
+    note = create_note(harness, member_id=member["id"])
+
+    async def deny(id):
+        raise HTTPException(status_code=403, detail="denied")
+
+    events = hook_events(harness, before=deny)
+    response = harness.client.get(f"/notes/{note['id']}/member")
+    assert response.status_code == 403
+    assert events == [("before", member["id"])]
+
+
+def test_foreign_after_hook_gets_a_record_with_columns(harness):
+    member = harness.create_member(name="kept", age=7)
+    note = create_note(harness, member_id=member["id"])
+    events = hook_events(harness)
+
+    async def after_get_one(record):
+        events.append(("after", record))
+        record.name = "redacted"
+
+    harness.members.repository.lifecycle["after_get_one"] = after_get_one
+    response = harness.client.get(
+        f"/notes/{note['id']}/member", params={"columns": ["name"], "links": False}
+    )
+    assert response.status_code == 200
+    assert response.json()["member"] == {"id": member["id"], "name": "redacted"}
+    assert isinstance(events[1][1], Member)
+
+
+def test_foreign_hooks_on_missing_relations(harness):
+    note = create_note(harness)
+    events = hook_events(harness)
+    response = harness.client.get(f"/notes/{note['id']}/member")
+    assert response.status_code == 200
+    assert response.json().get("member") is None
+    assert events == [("before", None), ("after", None)]
+
+    # without an origin record there is no related id, and no hook runs
+    events.clear()
+    response = harness.client.get(f"/notes/{harness.create_member()['id']}/member")
+    assert response.status_code == 200
+    assert response.json().get("member") is None
+    assert events == []
@@ -0,0 +1,121 @@
+import asyncio
+import sqlite3
+import time
+from sqlmodel import select
+from .helpers import Member, build_app, names, replica_paths, seed_replicas
+
+
+# Lists run their count and page queries in one session, so each list is one read
+def build_replicated(tmp_path, **adapter_options):
+    harness = build_app(
+        tmp_path,
+        adapter_options={
+            "replica_paths": replica_paths(tmp_path, count=2),
+            **adapter_options,
+        },
+        list_execution="single",
+    )
+    seed_replicas(harness.adapter)
+    return harness
+
+
+def served(names) -> str:
+    replica = [x for x in names if x.startswith("replica")]
+    return replica[0] if len(replica) == 1 else "primary"
+
+
+def served_by(harness) -> str:
+    return served(names(harness.client.get("/members")))
+
+
+# the database a read session of the adapter is served by
+async def read_from(adapter) -> str:
+    async with adapter.getSession(read_only=True) as session:
+        return served((await session.execute(select(Member.name))).scalars().all())
+
+
+def test_round_robin_rotates_through_replicas(tmp_path):
+    harness = build_replicated(tmp_path)
+    served = [served_by(harness) for _ in range(3)]
+    assert served == ["replica0", "replica1", "replica0"]
+
+    async def run():
+        return [await read_from(harness.adapter) for _ in range(3)]
+
+    assert asyncio.run(run()) == ["replica1", "replica0", "replica1"]
+
+
+def test_writes_go_to_the_primary(tmp_path):
+    harness = build_replicated(tmp_path)
+    harness.create_member(name="a")
+    harness.create_member(name="b")
+    for path in replica_paths(tmp_path, count=2):
+        connection = sqlite3.connect(path)
+        try:
+            assert connection.execute("SELECT count(*) FROM Member").fetchone() == (1,)
+        finally:
+            connection.close()
+    # without a read-your-writes window, reads still go to the replicas
+    assert served_by(harness) in ("replica0", "replica1")
+
+    async def primary_names():
+        async with harness.adapter.getSession() as session:
+            return (await session.execute(select(Member.name))).scalars().all()
+
+    assert sorted(asyncio.run(primary_names())) == ["a", "b"]
+
+
+def test_least_connections_picks_the_idlest_replica(tmp_path):
+    harness = build_replicated(tmp_path, replica_strategy="least_connections")
+    adapter = harness.adapter
+
+    async def run():
+        served = []
+        async with adapter.getSession(read_only=True) as session:
+            # the first replica is checked out, so the second one serves the next read
+            await session.execute(select(Member.name))
+            served.append(await read_from(adapter))
+            served.append(await read_from(adapter))
+        # once it is returned, both are idle and the first one is picked again
+        served.append(await read_from(adapter))
+        return served
+
+    assert asyncio.run(run()) == ["replica1", "replica1", "replica0"]
+    assert adapter._replica_checkouts == [0, 0]
+
+
+def test_reads_go_to_the_primary_during_the_read_your_writes_window(tmp_path):
+    harness = build_replicated(tmp_path, read_your_writes_window=0.5)
+    assert served_by(harness) == "replica0"
+    harness.create_member(name="fresh")
+    assert harness.adapter.wrote_recently()
+    assert names(harness.client.get("/members")) == ["fresh"]
+    time.sleep(0.6)
+    assert not harness.adapter.wrote_recently()
+    assert served_by(harness) in ("replica0", "replica1")
+
+
+def test_read_your_writes_window_is_kept_per_write_scope(tmp_path):
+    harness = build_replicated(tmp_path, read_your_writes_window=60)
+    adapter = harness.adapter
+
+    async def write_then_read(scope: str) -> str:
+        adapter.set_write_scope(scope)
+        async with adapter.getSession() as session:
+            session.add(Member(name=f"written by {scope}"))
+        return await read_from(adapter)
+
+    async def read(scope: str) -> str:
+        adapter.set_write_scope(scope)
+        return await read_from(adapter)
+
+    async def run():
+        # each task runs in a copy of the context, so their scopes stay apart
+        written = await asyncio.create_task(write_then_read("a"))
+        same = await asyncio.create_task(read("a"))
+        other = await asyncio.create_task(read("b"))
+        return written, same, other
+
+    written, same, other = asyncio.run(run())
+    assert (written, same) == ("primary", "primary")
+    assert other in ("replica0", "replica1")
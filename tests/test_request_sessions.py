@@ -0,0 +1,92 @@
+import pytest
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from fastapi_cruddy_framework import BulkDTO, RequestSessionRoute
+from .helpers import (
+    AppHarness,
+    MemberCreate,
+    build_app,
+    names,
+    replica_paths,
+    seed_replicas,
+)
+
+
+def member_names(result: BulkDTO):
+    return sorted(x._mapping["name"] for x in result.data)
+
+
+# Adds the routes below to the app, on a router sharing the request session like the
+# resources' own routers do
+def add_probe_routes(harness: AppHarness):
+    repository = harness.members.repository
+    router = APIRouter(
+        route_class=RequestSessionRoute, dependencies=[Depends(harness.adapter)]
+    )
+
+    @router.post("/probe/write-then-read")
+    async def write_then_read():
+        before = member_names(await repository.get_all())
+        await repository.create(data=MemberCreate(name="uncommitted"))
+        after = member_names(await repository.get_all())
+        return {"before": before, "after": after}
+
+    @router.post("/probe/write-then-fail/{how}")
+    async def write_then_fail(how: str):
+        await repository.create(data=MemberCreate(name="discarded"))
+        if how == "raise":
+            raise HTTPException(status_code=409, detail="conflict")
+        return JSONResponse(status_code=409, content={"detail": "conflict"})
+
+    harness.app.include_router(router)
+
+
+@pytest.fixture
+def replicated(tmp_path):
+    harness = build_app(
+        tmp_path,
+        adapter_options={
+            "request_scoped_sessions": True,
+            "replica_paths": replica_paths(tmp_path, count=1),
+            "read_your_writes_window": 60,
+        },
+    )
+    seed_replicas(harness.adapter)
+    add_probe_routes(harness)
+    return harness
+
+
+def test_reads_use_replicas_until_the_request_writes(replicated):
+    client = replicated.client
+    assert names(client.get("/members")) == ["replica0"]
+    assert not replicated.adapter.wrote_recently()
+
+    # the write's own reads join its session, and see the member it has not committed
+    response = client.post("/probe/write-then-read")
+    assert response.status_code == 200
+    assert response.json() == {"before": ["replica0"], "after": ["uncommitted"]}
+
+    # a request that wrote opens the read-your-writes window, so reads use the primary
+    assert replicated.adapter.wrote_recently()
+    assert names(client.get("/members")) == ["uncommitted"]
+
+
+@pytest.mark.parametrize("how", ["raise", "return"])
+def test_error_responses_roll_back_the_request(tmp_path, how):
+    harness = build_app(tmp_path, adapter_options={"request_scoped_sessions": True})
+    add_probe_routes(harness)
+    client = harness.client
+    harness.create_member(name="kept")
+    response = client.post(f"/probe/write-then-fail/{how}")
+    assert response.status_code == 409
+    assert names(client.get("/members")) == ["kept"]
+
+
+def test_writes_commit_once_per_request(tmp_path):
+    harness = build_app(tmp_path, adapter_options={"request_scoped_sessions": True})
+    add_probe_routes(harness)
+    client = harness.client
+    response = client.post("/probe/write-then-read")
+    assert response.status_code == 200
+    assert response.json() == {"before": [], "after": ["uncommitted"]}
+    assert names(client.get("/members")) == ["uncommitted"]
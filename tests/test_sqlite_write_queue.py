@@ -0,0 +1,93 @@
+import asyncio
+import os
+import sqlite3
+import pytest
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import text
+from fastapi_cruddy_framework import SqliteAdapter
+
+
+# Every write session of a reader_writer adapter is served by its SqliteWriteQueue. The
+# tests queue several writes at once, so they are committed as one group, while the first
+# one holds its turn until the others are waiting.
+async def setup_adapter(db_path: str) -> SqliteAdapter:
+    adapter = SqliteAdapter(db_path=db_path, mode="reader_writer", instrument=False)
+    async with adapter.getSession() as session:
+        await session.execute(text("CREATE TABLE item (name TEXT PRIMARY KEY)"))
+    return adapter
+
+
+def committed_names(db_path: str):
+    connection = sqlite3.connect(db_path)
+    try:
+        return sorted(x[0] for x in connection.execute("SELECT name FROM item"))
+    finally:
+        connection.close()
+
+
+async def insert(adapter: SqliteAdapter, name: str, hold: asyncio.Event = None):
+    async with adapter.getSession() as session:
+        await session.execute(text("INSERT INTO item (name) VALUES (:n)"), {"n": name})
+        if hold != None:
+            await hold.wait()
+
+
+async def wait_queued(adapter: SqliteAdapter, count: int):
+    while adapter.write_queue._queue.qsize() < count:
+        await asyncio.sleep(0.001)
+
+
+def test_failing_job_only_rolls_back_its_own_savepoint(tmp_path):
+    db_path = os.path.join(tmp_path, "queue.db")
+
+    async def failing(adapter: SqliteAdapter):
+        async with adapter.getSession() as session:
+            await session.execute(text("INSERT INTO item (name) VALUES ('b')"))
+            raise RuntimeError("hook failed")
+
+    async def run():
+        adapter = await setup_adapter(db_path)
+        batches = adapter.write_queue.batches
+        hold = asyncio.Event()
+        first = asyncio.create_task(insert(adapter, "a", hold))
+        await asyncio.sleep(0.01)
+        jobs = [
+            asyncio.create_task(failing(adapter)),
+            # the duplicate key only fails when the job's savepoint is flushed
+            asyncio.create_task(insert(adapter, "a")),
+            asyncio.create_task(insert(adapter, "c")),
+        ]
+        await wait_queued(adapter, 3)
+        hold.set()
+        results = await asyncio.gather(first, *jobs, return_exceptions=True)
+        await adapter.shutdown()
+        return results, adapter.write_queue.batches - batches
+
+    results, batches = asyncio.run(run())
+    assert results[0] is None
+    assert isinstance(results[1], RuntimeError)
+    assert isinstance(results[2], IntegrityError)
+    assert results[3] is None
+    assert batches == 1
+    assert committed_names(db_path) == ["a", "c"]
+
+
+def test_callers_return_after_the_group_commit(tmp_path):
+    db_path = os.path.join(tmp_path, "queue.db")
+
+    async def run():
+        adapter = await setup_adapter(db_path)
+        hold = asyncio.Event()
+        first = asyncio.create_task(insert(adapter, "a"))
+        second = asyncio.create_task(insert(adapter, "b", hold))
+        await wait_queued(adapter, 0)
+        await asyncio.sleep(0.05)
+        # the first job is done, but its group is still open with the second one
+        assert not first.done()
+        assert committed_names(db_path) == []
+        hold.set()
+        await asyncio.gather(first, second)
+        assert committed_names(db_path) == ["a", "b"]
+        await adapter.shutdown()
+
+    asyncio.run(run())